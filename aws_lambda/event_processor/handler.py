@@ -1,16 +1,23 @@
 import json
 import os
+import math
 import logging
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 s3_client = boto3.client("s3")
-dynamodb = boto3.resource("dynamodb")
+# Low-level client rather than a Table resource: clients are thread-safe,
+# so the flush pool can share this one across warm invocations
+dynamodb_client = boto3.client("dynamodb")
 S3_BUCKET = os.environ.get("S3_BUCKET", "datapulse-storage")
 TABLE_NAME = os.environ.get("DYNAMODB_TABLE", "datapulse-event-summaries")
+SUMMARY_FLUSH_WORKERS = int(os.environ.get("SUMMARY_FLUSH_WORKERS", "8"))
+
+_flush_executor = ThreadPoolExecutor(max_workers=SUMMARY_FLUSH_WORKERS)
 
 
 def lambda_handler(event, context):
@@ -22,6 +29,8 @@ def lambda_handler(event, context):
 
     processed = 0
     errors = 0
+    summaries = {}
+    today = datetime.utcnow().strftime("%Y-%m-%d")
 
     for record in event.get("Records", []):
         try:
@@ -42,8 +51,8 @@ def lambda_handler(event, context):
                 ContentType="application/json",
             )
 
-            # Update summary in DynamoDB
-            _update_summary(event_type, payload)
+            # Aggregate into the per-type summary, written once per batch
+            _add_to_summary(summaries, (event_type, today), payload)
 
             processed += 1
             logger.info(f"Processed event: {event_type}")
@@ -52,11 +61,15 @@ def lambda_handler(event, context):
             errors += 1
             logger.error(f"Error processing record: {e}")
 
+    summary_errors = _flush_summaries(summaries)
+
     result = {
         "statusCode": 200,
         "body": json.dumps({
             "processed": processed,
             "errors": errors,
+            "summaries_updated": len(summaries) - summary_errors,
+            "summary_errors": summary_errors,
             "request_id": context.aws_request_id,
         }),
     }
@@ -83,19 +96,94 @@ def _enrich_event(event_data):
     return enriched
 
 
-def _update_summary(event_type, payload):
+def _add_to_summary(summaries, key, payload):
+    summary = summaries.get(key)
+    if summary is None:
+        summary = summaries[key] = {"count": 0, "value_count": 0, "sum": 0.0, "min": None, "max": None}
+    summary["count"] += 1
+    if not isinstance(payload, dict):
+        return
+
+    try:
+        value = float(payload.get("value"))
+    except (ValueError, TypeError):
+        return
+    if not math.isfinite(value):
+        return
+    summary["value_count"] += 1
+    summary["sum"] += value
+    summary["min"] = value if summary["min"] is None else min(summary["min"], value)
+    summary["max"] = value if summary["max"] is None else max(summary["max"], value)
+
+
+def _flush_summaries(summaries):
+    """Write one update per (event_type, date) concurrently; returns the
+    number of keys that failed."""
+    if not summaries:
+        return 0
+    results = _flush_executor.map(lambda item: _update_summary(*item), summaries.items())
+    return sum(1 for ok in results if not ok)
+
+
+def _number(value):
+    return {"N": repr(value) if isinstance(value, float) else str(value)}
+
+
+def _update_summary(key, summary):
+    event_type, date = key
+    item_key = {"event_type": {"S": event_type}, "date": {"S": date}}
+    values = {
+        ":n": _number(summary["count"]),
+        ":ts": {"S": datetime.utcnow().isoformat()},
+    }
+    expression = "ADD event_count :n SET last_updated = :ts"
+    if summary["value_count"]:
+        values.update({
+            ":vc": _number(summary["value_count"]),
+            ":sum": _number(summary["sum"]),
+            ":min": _number(summary["min"]),
+            ":max": _number(summary["max"]),
+        })
+        expression = (
+            "ADD event_count :n, value_count :vc, value_sum :sum "
+            "SET last_updated = :ts, value_min = if_not_exists(value_min, :min), "
+            "value_max = if_not_exists(value_max, :max)"
+        )
+
+    try:
+        response = dynamodb_client.update_item(
+            TableName=TABLE_NAME,
+            Key=item_key,
+            UpdateExpression=expression,
+            ExpressionAttributeValues=values,
+            ReturnValues="UPDATED_NEW",
+        )
+    except Exception as e:
+        logger.error(f"DynamoDB update failed for {event_type}/{date}: {e}")
+        return False
+
+    # ADD cannot keep a minimum or maximum, so lower/raise them with a
+    # conditional write only when this batch actually moved them
+    stored = response.get("Attributes", {})
+    if summary["value_count"]:
+        if float(stored.get("value_min", {}).get("N", summary["min"])) > summary["min"]:
+            _set_extreme(item_key, "value_min", ">", values[":min"])
+        if float(stored.get("value_max", {}).get("N", summary["max"])) < summary["max"]:
+            _set_extreme(item_key, "value_max", "<", values[":max"])
+    return True
+
+
+def _set_extreme(item_key, attribute, comparison, value):
     try:
-        table = dynamodb.Table(TABLE_NAME)
-        today = datetime.utcnow().strftime("%Y-%m-%d")
-
-        table.update_item(
-            Key={"event_type": event_type, "date": today},
-            UpdateExpression="SET event_count = if_not_exists(event_count, :zero) + :inc, last_updated = :ts",
-            ExpressionAttributeValues={
-                ":inc": 1,
-                ":zero": 0,
-                ":ts": datetime.utcnow().isoformat(),
-            },
+        dynamodb_client.update_item(
+            TableName=TABLE_NAME,
+            Key=item_key,
+            UpdateExpression=f"SET {attribute} = :v",
+            ConditionExpression=f"{attribute} {comparison} :v",
+            ExpressionAttributeValues={":v": value},
         )
+    except dynamodb_client.exceptions.ConditionalCheckFailedException:
+        # A concurrent invocation already stored a more extreme value
+        pass
     except Exception as e:
-        logger.error(f"DynamoDB update failed: {e}")
+        logger.error(f"DynamoDB {attribute} update failed: {e}")
@@ -1,8 +1,23 @@
 import logging
+from datetime import timezone
+
 from django.conf import settings
 
 logger = logging.getLogger("analytics")
 
+EVENTS_INDEX = "datapulse-events"
+INDEX_SUFFIX_FORMATS = {"day": "%Y.%m.%d", "month": "%Y.%m"}
+
+
+def events_index_for(timestamp):
+    # Backing index per ES_INDEX_GRANULARITY, matching the FastAPI service's
+    # routing (UTC, naive treated as UTC); reads go through the datapulse-events alias.
+    granularity = getattr(settings, "ES_INDEX_GRANULARITY", "day")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    return f"{EVENTS_INDEX}-{timestamp.strftime(INDEX_SUFFIX_FORMATS[granularity])}"
+
 
 def get_es_client():
     es_host = getattr(settings, "ELASTICSEARCH_HOST", "")
@@ -38,7 +53,7 @@ def index_event(event):
             "source_id": str(event.source_id) if event.source else None,
         }
         es.index(
-            index="datapulse-events",
+            index=events_index_for(event.timestamp),
             id=str(event.id),
             document=doc,
         )
@@ -59,31 +74,23 @@ def search_events(query, user, size=50):
             "query": {
                 "bool": {
                     "must": [
-                        {
-                            "multi_match": {
-                                "query": query,
-                                "fields": [
-                                    "event_type^3",
-                                    "payload.*",
-                                    "metadata.*",
-                                ],
-                                "fuzziness": "AUTO",
-                            }
-                        }
-                    ]
+                        {"match": {"search_text": {"query": query}}}
+                    ],
+                    "should": [
+                        {"term": {"event_type": {"value": query, "boost": 3}}}
+                    ],
                 }
             },
             "sort": [{"timestamp": {"order": "desc"}}],
             "size": size,
             "highlight": {
                 "fields": {
-                    "event_type": {},
-                    "payload.*": {},
+                    "search_text": {},
                 }
             },
         }
 
-        response = es.search(index="datapulse-events", body=body)
+        response = es.search(index=EVENTS_INDEX, body=body)
         hits = response["hits"]
 
         results = []
@@ -121,14 +128,14 @@ def aggregate_events(field, interval="day", size=30):
                 },
                 "by_event_type": {
                     "terms": {
-                        "field": "event_type.keyword",
+                        "field": "event_type",
                         "size": size,
                     }
                 },
             },
         }
 
-        response = es.search(index="datapulse-events", body=body)
+        response = es.search(index=EVENTS_INDEX, body=body)
         return response["aggregations"]
     except Exception as e:
         logger.error(f"Elasticsearch aggregation failed: {e}")
@@ -140,6 +140,8 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Elasticsearch (optional - disabled if not configured)
 ELASTICSEARCH_HOST = os.environ.get("ELASTICSEARCH_HOST", "")
+# Backing index period for events ("day" or "month"); must match the FastAPI service
+ES_INDEX_GRANULARITY = os.environ.get("ES_INDEX_GRANULARITY", "day")
 
 # Kafka (optional)
 KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "")
@@ -1,10 +1,16 @@
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .routers import ingestion, search, websocket_router
+from .services.bulk_indexer import start_bulk_indexer, stop_bulk_indexer
+from .services.index_template import ensure_index_template
+from .services.kafka_consumer import start_consumer, stop_consumer
+from .services.suggestion_index import suggestion_index
+from .services.ws_backplane import create_backplane
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("datapulse-fastapi")
@@ -13,13 +19,27 @@ logger = logging.getLogger("datapulse-fastapi")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting DataPulse FastAPI ingestion service")
+    if os.environ.get("ELASTICSEARCH_HOST"):
+        await asyncio.to_thread(ensure_index_template)
+        await asyncio.to_thread(suggestion_index.seed_from_es)
+    await start_bulk_indexer()
+    backplane = create_backplane()
+    if backplane:
+        try:
+            await websocket_router.manager.set_backplane(backplane)
+        except Exception as e:
+            logger.warning(f"WebSocket backplane not started: {e}")
+    await websocket_router.event_conflator.start()
     if os.environ.get("KAFKA_BOOTSTRAP_SERVERS"):
         try:
-            from .services.kafka_consumer import start_consumer, stop_consumer
             await start_consumer()
         except Exception as e:
             logger.warning(f"Kafka consumer not started: {e}")
     yield
+    await stop_consumer()
+    await websocket_router.event_conflator.stop()
+    await websocket_router.manager.clear_backplane()
+    await stop_bulk_indexer()
     logger.info("Shutting down DataPulse FastAPI ingestion service")
 
 
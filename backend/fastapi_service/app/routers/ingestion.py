@@ -1,3 +1,4 @@
+import uuid
 import logging
 from datetime import datetime
 from typing import List, Optional
@@ -6,12 +7,15 @@ from pydantic import BaseModel, Field
 
 from ..services.kafka_producer import produce_event
 from ..services.elasticsearch_client import index_document, bulk_index
+from ..services.bulk_indexer import bulk_indexer
+from ..services.kafka_consumer import event_consumer
 
 logger = logging.getLogger("datapulse-fastapi")
 router = APIRouter()
 
 
 class EventPayload(BaseModel):
+    event_id: Optional[str] = Field(default=None, max_length=100)
     event_type: str = Field(..., min_length=1, max_length=100)
     source_id: Optional[str] = None
     payload: dict = Field(default_factory=dict)
@@ -34,6 +38,8 @@ async def ingest_event(event: EventPayload, background_tasks: BackgroundTasks):
     try:
         if not event.timestamp:
             event.timestamp = datetime.utcnow()
+        if not event.event_id:
+            event.event_id = str(uuid.uuid4())
 
         event_dict = event.model_dump()
 
@@ -41,13 +47,15 @@ async def ingest_event(event: EventPayload, background_tasks: BackgroundTasks):
         background_tasks.add_task(produce_event, "datapulse-events", event_dict)
 
         # Index in Elasticsearch for search
-        background_tasks.add_task(
-            index_document, "datapulse-events", event_dict
-        )
+        if not bulk_indexer.add("datapulse-events", event_dict):
+            background_tasks.add_task(
+                index_document, "datapulse-events", event_dict
+            )
 
         logger.info(f"Event ingested: type={event.event_type}")
         return IngestResponse(
             status="accepted",
+            event_id=event.event_id,
             message=f"Event '{event.event_type}' queued for processing",
         )
     except Exception as e:
@@ -62,6 +70,8 @@ async def bulk_ingest(request: BulkIngestRequest, background_tasks: BackgroundTa
         for event in request.events:
             if not event.timestamp:
                 event.timestamp = datetime.utcnow()
+            if not event.event_id:
+                event.event_id = str(uuid.uuid4())
             events.append(event.model_dump())
 
         # Bulk publish to Kafka
@@ -69,7 +79,8 @@ async def bulk_ingest(request: BulkIngestRequest, background_tasks: BackgroundTa
             background_tasks.add_task(produce_event, "datapulse-events", event_dict)
 
         # Bulk index in Elasticsearch
-        background_tasks.add_task(bulk_index, "datapulse-events", events)
+        if not bulk_indexer.add_many("datapulse-events", events):
+            background_tasks.add_task(bulk_index, "datapulse-events", events)
 
         logger.info(f"Bulk ingested {len(events)} events")
         return {"status": "accepted", "count": len(events)}
@@ -82,6 +93,7 @@ async def bulk_ingest(request: BulkIngestRequest, background_tasks: BackgroundTa
 async def webhook_ingest(source_id: str, payload: dict, background_tasks: BackgroundTasks):
     try:
         event_dict = {
+            "event_id": str(uuid.uuid4()),
             "event_type": "webhook",
             "source_id": source_id,
             "payload": payload,
@@ -90,10 +102,21 @@ async def webhook_ingest(source_id: str, payload: dict, background_tasks: Backgr
         }
 
         background_tasks.add_task(produce_event, "datapulse-events", event_dict)
-        background_tasks.add_task(index_document, "datapulse-events", event_dict)
+        if not bulk_indexer.add("datapulse-events", event_dict):
+            background_tasks.add_task(index_document, "datapulse-events", event_dict)
 
         logger.info(f"Webhook event from source {source_id}")
         return {"status": "accepted", "source_id": source_id}
     except Exception as e:
         logger.error(f"Webhook ingestion failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/indexer/stats")
+async def indexer_stats():
+    return bulk_indexer.stats()
+
+
+@router.get("/consumer/stats")
+async def consumer_stats():
+    return event_consumer.stats()
@@ -1,8 +1,24 @@
+import json
 import logging
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from ..services.elasticsearch_client import search_documents, aggregate_data
+from ..services.elasticsearch_client import (
+    search_documents,
+    search_page,
+    close_cursor,
+    iter_documents,
+    aggregate_data,
+    parse_metrics,
+    get_suggestions,
+    run_dsl_query,
+)
+from ..services.query_cache import query_cache, ttl_for_window
+from ..services.suggestion_index import suggestion_index
+
+SUGGEST_CACHE_TTL = 60
 
 logger = logging.getLogger("datapulse-fastapi")
 router = APIRouter()
@@ -15,11 +31,30 @@ class SearchRequest(BaseModel):
     from_offset: int = 0
     sort_by: Optional[str] = "timestamp"
     sort_order: Optional[str] = "desc"
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    use_cursor: bool = False
+    cursor: Optional[str] = None
+    fuzzy: bool = False
 
 
 @router.post("/query")
 async def search_events(request: SearchRequest):
+    suggestion_index.record(request.query, "query")
     try:
+        if request.use_cursor or request.cursor:
+            return search_page(
+                index=request.index,
+                query=request.query,
+                size=request.size,
+                cursor=request.cursor,
+                sort_by=request.sort_by,
+                sort_order=request.sort_order,
+                start_time=request.start_time,
+                end_time=request.end_time,
+                fuzzy=request.fuzzy,
+            )
+
         results = search_documents(
             index=request.index,
             query=request.query,
@@ -27,52 +62,167 @@ async def search_events(request: SearchRequest):
             from_offset=request.from_offset,
             sort_by=request.sort_by,
             sort_order=request.sort_order,
+            start_time=request.start_time,
+            end_time=request.end_time,
+            fuzzy=request.fuzzy,
         )
         return results
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Search failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class DslRequest(BaseModel):
+    body: dict
+    index: str = "datapulse-events"
+
+
+@router.post("/dsl")
+async def search_dsl(request: DslRequest):
+    try:
+        return run_dsl_query(request.index, request.body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"DSL search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/events")
 async def search_events_get(
     q: str = Query(..., min_length=1),
     event_type: Optional[str] = None,
     size: int = Query(default=50, le=200),
     offset: int = Query(default=0, ge=0),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    use_cursor: bool = False,
+    cursor: Optional[str] = None,
+    fuzzy: bool = False,
 ):
+    suggestion_index.record(q, "query")
     try:
         filters = {}
         if event_type:
             filters["event_type"] = event_type
 
+        if use_cursor or cursor:
+            return search_page(
+                index="datapulse-events",
+                query=q,
+                size=size,
+                cursor=cursor,
+                filters=filters,
+                start_time=start,
+                end_time=end,
+                fuzzy=fuzzy,
+            )
+
         results = search_documents(
             index="datapulse-events",
             query=q,
             size=size,
             from_offset=offset,
             filters=filters,
+            start_time=start,
+            end_time=end,
+            fuzzy=fuzzy,
         )
         return results
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Event search failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.delete("/cursor")
+async def release_cursor(cursor: str = Query(..., min_length=1)):
+    try:
+        return {"closed": close_cursor(cursor)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/export")
+async def export_events(
+    q: str = Query(..., min_length=1),
+    event_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    filters = {"event_type": event_type} if event_type else None
+
+    def generate():
+        try:
+            for document in iter_documents(
+                index="datapulse-events",
+                query=q,
+                filters=filters,
+                start_time=start,
+                end_time=end,
+            ):
+                yield json.dumps(document, default=str) + "\n"
+        except Exception as e:
+            logger.error(f"Event export failed: {e}")
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @router.get("/aggregate")
 async def aggregate_events(
     field: str = Query(default="event_type"),
     interval: str = Query(default="day"),
     size: int = Query(default=30, le=100),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    source_id: Optional[str] = None,
+    mode: str = Query(default="flat", pattern="^(flat|nested)$"),
+    metrics: List[str] = Query(default=[]),
+    min_doc_count: int = Query(default=0, ge=0),
 ):
+    filters = {}
+    if event_type:
+        filters["event_type"] = event_type
+    if source_id:
+        filters["source_id"] = source_id
+
+    params = {
+        "field": field,
+        "interval": interval,
+        "size": size,
+        "start": start,
+        "end": end,
+        "filters": filters,
+        "mode": mode,
+        "metrics": sorted(metrics),
+        "min_doc_count": min_doc_count,
+    }
     try:
-        results = aggregate_data(
-            index="datapulse-events",
-            field=field,
-            interval=interval,
-            size=size,
+        parse_metrics(metrics)
+        results = await query_cache.get_or_compute(
+            "aggregate",
+            params,
+            ttl=ttl_for_window(interval, end),
+            compute=lambda: aggregate_data(
+                index="datapulse-events",
+                field=field,
+                interval=interval,
+                size=size,
+                start_time=start,
+                end_time=end,
+                filters=filters,
+                mode=mode,
+                metrics=metrics,
+                min_doc_count=min_doc_count,
+            ),
         )
         return results
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Aggregation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -80,10 +230,26 @@ async def aggregate_events(
 
 @router.get("/suggest")
 async def suggest_queries(q: str = Query(..., min_length=1)):
-    try:
-        from ..services.elasticsearch_client import get_suggestions
-        suggestions = get_suggestions("datapulse-events", q)
+    prefix = q.strip().lower()
+    suggestions = suggestion_index.suggest(prefix)
+    if suggestions:
         return {"suggestions": suggestions}
+
+    # Cold prefix: nothing in memory yet, ask Elasticsearch
+    try:
+        suggestions = await query_cache.get_or_compute(
+            "suggest",
+            {"prefix": prefix},
+            ttl=SUGGEST_CACHE_TTL,
+            compute=lambda: get_suggestions("datapulse-events", prefix),
+        )
+        # None means Elasticsearch failed, and is not cached
+        return {"suggestions": suggestions or []}
     except Exception as e:
         logger.error(f"Suggestion failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return query_cache.stats()
@@ -1,49 +1,289 @@
+import os
 import json
 import logging
 import asyncio
-from typing import List
+from typing import Dict, Optional, Set, Union
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from ..services.event_conflator import EventConflator, shape_frame
+from ..services.replay_buffer import replay_buffer
+from ..services.ws_encoding import DEFAULT_ENCODING, encode_frame, negotiate_encoding
+
 logger = logging.getLogger("datapulse-fastapi")
 router = APIRouter()
 
+WS_MAX_SUBSCRIPTIONS = int(os.environ.get("WS_MAX_SUBSCRIPTIONS", "50"))
+WS_SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", "256"))
+# What to do when a client's send queue is full: drop_oldest keeps the most
+# recent frames, drop_newest keeps the backlog, disconnect closes the socket
+WS_SLOW_CLIENT_POLICY = os.environ.get("WS_SLOW_CLIENT_POLICY", "drop_oldest")
+
+
+class ClientConnection:
+    """Bounded outbound queue and writer task for one socket, so a slow
+    client only ever delays itself."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        on_error,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+        policy: str = WS_SLOW_CLIENT_POLICY,
+    ):
+        self.websocket = websocket
+        self.policy = policy
+        self.dropped = 0
+        # channel -> (mode, event_types); channels not listed get the default stream
+        self.stream_keys: Dict[str, tuple] = {}
+        self.encoding = DEFAULT_ENCODING
+        self._on_error = on_error
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._closing: Optional[asyncio.Task] = None
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, data: Union[str, bytes]) -> bool:
+        """Queue a pre-serialized frame (text, or bytes for binary encodings).
+        Returns False if the client is too slow and was disconnected under
+        the ``disconnect`` policy."""
+        if not self._queue.full():
+            self._queue.put_nowait(data)
+            return True
+
+        self.dropped += 1
+        if self.policy == "disconnect":
+            self._on_error(self.websocket)
+            self._closing = asyncio.create_task(self._close(code=1013))
+            return False
+        if self.policy == "drop_oldest":
+            self._queue.get_nowait()
+            self._queue.put_nowait(data)
+        return True
+
+    def close(self):
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def _write_loop(self):
+        while True:
+            data = await self._queue.get()
+            try:
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+            except Exception:
+                self._on_error(self.websocket)
+                return
+
+    async def _close(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.subscriptions: dict = {}
+    """Tracks sockets and their channel subscriptions.
+
+    ``subscriptions`` maps channel -> sockets and ``connection_channels`` is
+    the reverse index, so connect, subscribe, unsubscribe and disconnect only
+    touch the sets involved rather than scanning every channel.
+    """
+
+    def __init__(self, max_subscriptions: int = WS_MAX_SUBSCRIPTIONS, replay=replay_buffer):
+        self.max_subscriptions = max_subscriptions
+        self.replay = replay
+        self.active_connections: Set[WebSocket] = set()
+        self.subscriptions: Dict[str, Set[WebSocket]] = {}
+        self.connection_channels: Dict[WebSocket, Set[str]] = {}
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.backplane = None
+        self._backplane_tasks: Set[asyncio.Task] = set()
+
+    async def set_backplane(self, backplane):
+        """Route broadcasts through a cross-process backplane. Channels that
+        already have local subscribers are subscribed on it immediately."""
+        await backplane.start(self._deliver_local)
+        self.backplane = backplane
+        for channel in list(self.subscriptions):
+            await backplane.subscribe(channel)
+
+    async def clear_backplane(self):
+        if self.backplane:
+            await self.backplane.stop()
+        self.backplane = None
 
     async def connect(self, websocket: WebSocket, channel: str = "default"):
         await websocket.accept()
-        self.active_connections.append(websocket)
-        if channel not in self.subscriptions:
-            self.subscriptions[channel] = []
-        self.subscriptions[channel].append(websocket)
+        self.active_connections.add(websocket)
+        self.connection_channels[websocket] = set()
+        self.clients[websocket] = ClientConnection(websocket, on_error=self.disconnect)
+        self.subscribe(websocket, channel)
         logger.info(f"WebSocket connected to channel: {channel}")
 
+    def subscribe(self, websocket: WebSocket, channel: str) -> bool:
+        channels = self.connection_channels.get(websocket)
+        if channels is None:
+            return False
+        if channel in channels:
+            return True
+        if len(channels) >= self.max_subscriptions:
+            return False
+        channels.add(channel)
+        subscribers = self.subscriptions.setdefault(channel, set())
+        subscribers.add(websocket)
+        if len(subscribers) == 1:
+            self._sync_backplane(channel)
+        return True
+
+    def unsubscribe(self, websocket: WebSocket, channel: str) -> bool:
+        channels = self.connection_channels.get(websocket)
+        if not channels or channel not in channels:
+            return False
+        channels.discard(channel)
+        client = self.clients.get(websocket)
+        if client:
+            client.stream_keys.pop(channel, None)
+        subscribers = self.subscriptions.get(channel)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscriptions[channel]
+                self._sync_backplane(channel)
+        return True
+
+    def _sync_backplane(self, channel: str):
+        if not self.backplane:
+            return
+        task = asyncio.create_task(self._reconcile_backplane(channel))
+        self._backplane_tasks.add(task)
+        task.add_done_callback(self._backplane_tasks.discard)
+
+    async def _reconcile_backplane(self, channel: str):
+        # Re-read local state when the task runs, so a quick subscribe and
+        # unsubscribe pair settles on whatever is true now
+        backplane = self.backplane
+        if not backplane:
+            return
+        try:
+            wanted = channel in self.subscriptions
+            if wanted and channel not in backplane.channels:
+                await backplane.subscribe(channel)
+            elif not wanted and channel in backplane.channels:
+                await backplane.unsubscribe(channel)
+        except Exception as e:
+            logger.error(f"Backplane subscription update failed for {channel}: {e}")
+
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        for channel, connections in self.subscriptions.items():
-            if websocket in connections:
-                connections.remove(websocket)
+        channels = self.connection_channels.get(websocket)
+        if channels is None:
+            return
+        for channel in list(channels):
+            self.unsubscribe(websocket, channel)
+        del self.connection_channels[websocket]
+        self.active_connections.discard(websocket)
+        client = self.clients.pop(websocket, None)
+        if client:
+            client.close()
         logger.info("WebSocket disconnected")
 
     async def broadcast(self, message: dict, channel: str = "default"):
-        connections = self.subscriptions.get(channel, [])
-        disconnected = []
-        for connection in connections:
+        # Serialize once; each subscriber only gets a queue append
+        text = json.dumps(message, default=str)
+        if self.backplane:
             try:
-                await connection.send_json(message)
-            except Exception:
-                disconnected.append(connection)
-        for conn in disconnected:
-            self.disconnect(conn)
+                await self.backplane.publish(channel, text)
+                return
+            except Exception as e:
+                logger.error(f"Backplane publish failed, delivering locally: {e}")
+        await self._deliver_local(channel, text)
+
+    async def _deliver_local(self, channel: str, text: str):
+        # Replay is recorded from delivered frames, not where events are
+        # produced: with the backplane these include every worker's events,
+        # not just the ones from this worker's Kafka partitions
+        frame = json.loads(text)
+        self._record_replay(channel, frame)
+        subscribers = self.subscriptions.get(channel)
+        if not subscribers:
+            return
+
+        groups: Dict[tuple, list] = {}
+        for websocket in list(subscribers):
+            client = self.clients.get(websocket)
+            if client:
+                groups.setdefault((client.stream_keys.get(channel), client.encoding), []).append(client)
+
+        for (stream_key, encoding), clients in groups.items():
+            data = text
+            if stream_key is not None or encoding != DEFAULT_ENCODING:
+                # Encode once per shape/encoding
+                shaped = shape_frame(frame, *stream_key) if stream_key else frame
+                if shaped is None:
+                    continue
+                data = encode_frame(shaped, encoding)
+            for client in clients:
+                client.enqueue(data)
+
+    def _record_replay(self, channel: str, frame):
+        if not isinstance(frame, dict):
+            return
+        if frame.get("type") == "new_event":
+            events = [frame.get("data")]
+        elif frame.get("type") == "new_events":
+            # Conflated frames carry samples; replay matches what was delivered live
+            events = frame.get("samples") or []
+        else:
+            return
+        for event in events:
+            if isinstance(event, dict):
+                self.replay.record(channel, event)
+
+    def set_encoding(self, websocket: WebSocket, requested: Optional[str]) -> str:
+        client = self.clients.get(websocket)
+        if not client:
+            return DEFAULT_ENCODING
+        if requested:
+            client.encoding = negotiate_encoding(requested)
+        return client.encoding
+
+    def set_stream_options(self, websocket: WebSocket, channel: str, mode: str = "batch", event_types=None):
+        """Stream options apply to one channel, so each subscription keeps
+        its own filter and mode."""
+        client = self.clients.get(websocket)
+        if not client:
+            return
+        types = frozenset(event_types or ())
+        if mode == "batch" and not types:
+            client.stream_keys.pop(channel, None)
+        else:
+            client.stream_keys[channel] = (mode, types)
 
     async def send_personal(self, websocket: WebSocket, message: dict):
-        await websocket.send_json(message)
+        client = self.clients.get(websocket)
+        if client:
+            client.enqueue(encode_frame(message, client.encoding))
 
 
 manager = ConnectionManager()
+event_conflator = EventConflator(publish=manager.broadcast)
+
+
+def build_replay_frame(channel: str, replay, event_types=None) -> Optional[dict]:
+    """Catch-up frame for a ``{"last": N}`` and/or ``{"seconds": T}`` replay
+    request, served from the in-memory buffer. None if the request is invalid."""
+    if not isinstance(replay, dict):
+        return None
+    try:
+        last = int(replay["last"]) if replay.get("last") is not None else None
+        seconds = float(replay["seconds"]) if replay.get("seconds") is not None else None
+    except (TypeError, ValueError):
+        return None
+    if last is None and seconds is None:
+        return None
+
+    events = replay_buffer.recent(channel, last=last, seconds=seconds, event_types=event_types)
+    return {"type": "replay", "channel": channel, "count": len(events), "events": events}
 
 
 @router.websocket("/events/{channel}")
@@ -56,12 +296,37 @@ async def websocket_events(websocket: WebSocket, channel: str):
 
             if message.get("type") == "subscribe":
                 new_channel = message.get("channel", channel)
-                if new_channel not in manager.subscriptions:
-                    manager.subscriptions[new_channel] = []
-                manager.subscriptions[new_channel].append(websocket)
+                if manager.subscribe(websocket, new_channel):
+                    mode = message.get("mode", "batch")
+                    if mode not in ("batch", "aggregate"):
+                        mode = "batch"
+                    manager.set_stream_options(websocket, new_channel, mode, message.get("event_types"))
+                    # The reply is already sent in the negotiated encoding
+                    encoding = manager.set_encoding(websocket, message.get("encoding"))
+                    reply = {
+                        "type": "subscribed",
+                        "channel": new_channel,
+                        "mode": mode,
+                        "encoding": encoding,
+                    }
+                else:
+                    reply = {
+                        "type": "error",
+                        "channel": new_channel,
+                        "message": f"Subscription limit of {manager.max_subscriptions} channels reached",
+                    }
+                await manager.send_personal(websocket, reply)
+                if reply["type"] == "subscribed" and "replay" in message:
+                    frame = build_replay_frame(new_channel, message["replay"], message.get("event_types"))
+                    if frame:
+                        await manager.send_personal(websocket, frame)
+
+            elif message.get("type") == "unsubscribe":
+                old_channel = message.get("channel", channel)
+                manager.unsubscribe(websocket, old_channel)
                 await manager.send_personal(
                     websocket,
-                    {"type": "subscribed", "channel": new_channel},
+                    {"type": "unsubscribed", "channel": old_channel},
                 )
 
             elif message.get("type") == "ping":
@@ -94,7 +359,12 @@ async def websocket_dashboard(websocket: WebSocket, dashboard_id: str):
         manager.disconnect(websocket)
 
 
-async def push_event_to_clients(event_data: dict, channel: str = "default"):
+async def push_event_to_clients(event_data: dict, channel: str = "default", conflate: bool = True):
+    """Push an event to a channel's subscribers. Conflated events go out in
+    the channel's next ``new_events`` frame; others are sent immediately.
+    Delivered frames are kept in the channel's replay buffer."""
+    if conflate and event_conflator.add(channel, event_data):
+        return
     await manager.broadcast(
         {"type": "new_event", "data": event_data},
         channel=channel,
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+from .elasticsearch_client import get_es_client
+from .index_routing import write_index
+
+logger = logging.getLogger("datapulse-fastapi")
+
+BULK_MIN_DOCS = int(os.environ.get("ES_BULK_MIN_DOCS", "100"))
+BULK_MAX_DOCS = int(os.environ.get("ES_BULK_MAX_DOCS", "5000"))
+BULK_MAX_BYTES = int(os.environ.get("ES_BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+BULK_FLUSH_INTERVAL = float(os.environ.get("ES_BULK_FLUSH_INTERVAL", "1.0"))
+BULK_CONCURRENCY = int(os.environ.get("ES_BULK_CONCURRENCY", "4"))
+BULK_TARGET_LATENCY_MS = float(os.environ.get("ES_BULK_TARGET_LATENCY_MS", "500"))
+BULK_MAX_RETRIES = int(os.environ.get("ES_BULK_MAX_RETRIES", "3"))
+BULK_MAX_QUEUE_DOCS = int(os.environ.get("ES_BULK_MAX_QUEUE_DOCS", "100000"))
+
+
+class AdaptiveBatchSizer:
+    """AIMD controller for the number of documents sent per bulk request.
+
+    Grows additively while ES answers under the latency target and backs off
+    multiplicatively when it is slow or rejects work with 429.
+    """
+
+    def __init__(
+        self,
+        min_size: int = BULK_MIN_DOCS,
+        max_size: int = BULK_MAX_DOCS,
+        target_latency_ms: float = BULK_TARGET_LATENCY_MS,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency_ms = target_latency_ms
+        self.batch_size = min_size
+        self._step = max(1, min_size // 2)
+
+    def record(self, latency_ms: float, rejected: bool = False) -> int:
+        if rejected:
+            self.batch_size = int(self.batch_size * 0.5)
+        elif latency_ms > self.target_latency_ms:
+            self.batch_size = int(self.batch_size * 0.75)
+        else:
+            self.batch_size += self._step
+        self.batch_size = max(self.min_size, min(self.max_size, self.batch_size))
+        return self.batch_size
+
+
+def _is_retryable(status) -> bool:
+    # Connection errors are reported by the helpers with a non-numeric status
+    if not isinstance(status, int):
+        return True
+    return status == 429 or status >= 500
+
+
+class BulkIndexer:
+    """Background indexer that accumulates documents from all ingestion routes
+    and ships them to Elasticsearch with ``streaming_bulk``.
+
+    A batch is flushed once it reaches the adaptive document count or
+    ``max_bytes``, or when ``flush_interval`` elapses. Up to ``concurrency``
+    bulk requests are in flight at once, each on a worker thread.
+    """
+
+    def __init__(
+        self,
+        client_factory=get_es_client,
+        max_bytes: int = BULK_MAX_BYTES,
+        flush_interval: float = BULK_FLUSH_INTERVAL,
+        concurrency: int = BULK_CONCURRENCY,
+        max_retries: int = BULK_MAX_RETRIES,
+        max_queue_docs: int = BULK_MAX_QUEUE_DOCS,
+        sizer: Optional[AdaptiveBatchSizer] = None,
+    ):
+        self._client_factory = client_factory
+        self._es = None
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.max_queue_docs = max_queue_docs
+        self.sizer = sizer or AdaptiveBatchSizer()
+
+        self._buffer: deque = deque()
+        self._buffer_bytes = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        # Retries waiting out their backoff, keyed by id() of the retry list
+        self._retries: dict = {}
+        self._stats = {
+            "indexed": 0,
+            "failed": 0,
+            "retried": 0,
+            "rejected_429": 0,
+            "dropped": 0,
+            "batches": 0,
+            "last_latency_ms": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add(self, index: str, document: dict) -> bool:
+        """Queue a document for indexing. Returns False when the indexer is not
+        running so callers can fall back to direct indexing."""
+        if not self.running:
+            return False
+
+        action = {"_index": write_index(index, document), "_source": document}
+        if document.get("event_id"):
+            action["_id"] = document["event_id"]
+        self._enqueue(action, attempt=0)
+        return True
+
+    def add_many(self, index: str, documents: list) -> bool:
+        if not self.running:
+            return False
+        for document in documents:
+            self.add(index, document)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "running": self.running,
+            "queued_docs": len(self._buffer),
+            "queued_bytes": self._buffer_bytes,
+            "inflight_batches": len(self._inflight),
+            "pending_retries": sum(len(retry) for _, retry in self._retries.values()),
+            "batch_size": self.sizer.batch_size,
+        }
+
+    async def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Bulk indexer started (concurrency={self.concurrency}, "
+            f"flush_interval={self.flush_interval}s)"
+        )
+
+    async def stop(self, timeout: float = 10.0):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Drain whatever is still buffered before shutting down
+        try:
+            await asyncio.wait_for(self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Bulk indexer stopped with {len(self._buffer)} documents unflushed")
+        logger.info("Bulk indexer stopped")
+
+    def _enqueue(self, action: dict, attempt: int, front: bool = False):
+        size = len(json.dumps(action["_source"], default=str))
+        entry = (action, size, attempt)
+        if front:
+            self._buffer.appendleft(entry)
+        else:
+            self._buffer.append(entry)
+        self._buffer_bytes += size
+
+        while len(self._buffer) > self.max_queue_docs:
+            _, dropped_size, _ = self._buffer.popleft()
+            self._buffer_bytes -= dropped_size
+            self._stats["dropped"] += 1
+
+        if self._batch_ready() and self._wakeup:
+            self._wakeup.set()
+
+    def _batch_ready(self) -> bool:
+        return (
+            len(self._buffer) >= self.sizer.batch_size
+            or self._buffer_bytes >= self.max_bytes
+        )
+
+    def _take_batch(self) -> list:
+        batch = []
+        batch_bytes = 0
+        while self._buffer and len(batch) < self.sizer.batch_size:
+            action, size, attempt = self._buffer[0]
+            if batch and batch_bytes + size > self.max_bytes:
+                break
+            self._buffer.popleft()
+            self._buffer_bytes -= size
+            batch.append((action, attempt))
+            batch_bytes += size
+        return batch
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                timed_out = False
+            except asyncio.TimeoutError:
+                timed_out = True
+            self._wakeup.clear()
+
+            # Full batches go out as soon as they are ready; a timer tick also
+            # flushes the partial remainder
+            while self._buffer and (timed_out or self._batch_ready()):
+                await self._semaphore.acquire()
+                batch = self._take_batch()
+                if not batch:
+                    self._semaphore.release()
+                    break
+                task = asyncio.create_task(self._send(batch))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _drain(self):
+        # Documents backing off are sent now instead of after their delay;
+        # max_retries still bounds how often a failing document comes back
+        while True:
+            if self._inflight:
+                await asyncio.gather(*self._inflight, return_exceptions=True)
+            self._flush_retries()
+            if not self._buffer:
+                return
+            while self._buffer:
+                batch = self._take_batch()
+                await self._send(batch, acquire=False)
+
+    def _flush_retries(self):
+        retries, self._retries = self._retries, {}
+        for handle, retry in retries.values():
+            handle.cancel()
+            self._requeue(retry)
+
+    async def _send(self, batch: list, acquire: bool = True):
+        start = time.monotonic()
+        try:
+            results = await asyncio.to_thread(self._bulk_sync, [a for a, _ in batch])
+        except Exception as e:
+            logger.error(f"ES bulk request failed: {e}")
+            results = [(False, "N/A")] * len(batch)
+        finally:
+            if acquire:
+                self._semaphore.release()
+        latency_ms = (time.monotonic() - start) * 1000
+
+        rejected = False
+        retry = []
+        for (action, attempt), (ok, status) in zip(batch, results):
+            if ok:
+                self._stats["indexed"] += 1
+                continue
+            if status == 429:
+                rejected = True
+                self._stats["rejected_429"] += 1
+            if _is_retryable(status) and attempt < self.max_retries:
+                retry.append((action, attempt + 1))
+            else:
+                self._stats["failed"] += 1
+
+        self._stats["batches"] += 1
+        self._stats["last_latency_ms"] = round(latency_ms, 1)
+        self.sizer.record(latency_ms, rejected=rejected)
+
+        if retry:
+            self._stats["retried"] += len(retry)
+            backoff = min(30.0, 0.5 * (2 ** max(attempt for _, attempt in retry)))
+            logger.warning(f"Retrying {len(retry)} documents in {backoff}s")
+            handle = asyncio.get_running_loop().call_later(backoff, self._requeue, retry)
+            self._retries[id(retry)] = (handle, retry)
+
+    def _requeue(self, retry: list):
+        self._retries.pop(id(retry), None)
+        for action, attempt in reversed(retry):
+            self._enqueue(action, attempt, front=True)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _bulk_sync(self, actions: list) -> list:
+        """Send one batch and return an (ok, status) pair per action, in order."""
+        es = self._es or self._client_factory()
+        if not es:
+            return [(False, "N/A")] * len(actions)
+        self._es = es
+
+        from elasticsearch.helpers import streaming_bulk
+
+        results = []
+        for ok, item in streaming_bulk(
+            es,
+            actions,
+            chunk_size=len(actions),
+            max_chunk_bytes=self.max_bytes * 2,
+            raise_on_error=False,
+            raise_on_exception=False,
+            max_retries=0,
+            yield_ok=True,
+        ):
+            info = next(iter(item.values()))
+            status = info.get("status")
+            if not ok and not isinstance(status, int):
+                # Transport-level failure, reconnect on the next batch
+                self._es = None
+            results.append((ok, status))
+        return results
+
+
+bulk_indexer = BulkIndexer()
+
+
+async def start_bulk_indexer():
+    await bulk_indexer.start()
+
+
+async def stop_bulk_indexer():
+    await bulk_indexer.stop()
@@ -1,10 +1,21 @@
 import os
+import json
+import base64
+import hashlib
 import logging
+from datetime import datetime, timezone
 from typing import Optional
 
+from .index_routing import write_index, search_index, range_filter, to_utc
+
+SEARCH_FIELD = "search_text"
+HIGHLIGHT = {"fields": {SEARCH_FIELD: {}}}
+
 logger = logging.getLogger("datapulse-fastapi")
 
 ES_HOST = os.environ.get("ELASTICSEARCH_HOST", "localhost:9200")
+PIT_KEEP_ALIVE = os.environ.get("ES_PIT_KEEP_ALIVE", "2m")
+EXPORT_PAGE_SIZE = int(os.environ.get("ES_EXPORT_PAGE_SIZE", "1000"))
 
 
 def get_es_client():
@@ -25,7 +36,11 @@ def index_document(index: str, document: dict):
     if not es:
         return False
     try:
-        es.index(index=index, document=document)
+        es.index(
+            index=write_index(index, document),
+            id=document.get("event_id"),
+            document=document,
+        )
         return True
     except Exception as e:
         logger.error(f"ES index failed: {e}")
@@ -38,10 +53,12 @@ def bulk_index(index: str, documents: list):
         return False
     try:
         from elasticsearch.helpers import bulk
-        actions = [
-            {"_index": index, "_source": doc}
-            for doc in documents
-        ]
+        actions = []
+        for doc in documents:
+            action = {"_index": write_index(index, doc), "_source": doc}
+            if doc.get("event_id"):
+                action["_id"] = doc["event_id"]
+            actions.append(action)
         success, errors = bulk(es, actions)
         logger.info(f"Bulk indexed {success} documents, {len(errors)} errors")
         return True
@@ -50,6 +67,46 @@ def bulk_index(index: str, documents: list):
         return False
 
 
+def _build_query(
+    query: str,
+    filters: Optional[dict] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    fuzzy: bool = False,
+) -> dict:
+    # All string values are copied into one analyzed field by the index
+    # template, so a query never expands across payload.*/metadata.*.
+    text_match = {"query": query}
+    if fuzzy:
+        text_match["fuzziness"] = "AUTO"
+    must_clauses = [{"match": {SEARCH_FIELD: text_match}}]
+    should_clauses = [{"term": {"event_type": {"value": query, "boost": 3}}}]
+
+    filter_clauses = []
+    if filters:
+        for field, value in filters.items():
+            filter_clauses.append({"term": {field: value}})
+    time_filter = range_filter(start_time, end_time)
+    if time_filter:
+        filter_clauses.append(time_filter)
+
+    return {
+        "bool": {
+            "must": must_clauses,
+            "should": should_clauses,
+            "filter": filter_clauses,
+        }
+    }
+
+
+def _format_hit(hit: dict) -> dict:
+    result = hit["_source"]
+    result["_score"] = hit["_score"]
+    if "highlight" in hit:
+        result["_highlights"] = hit["highlight"]
+    return result
+
+
 def search_documents(
     index: str,
     query: str,
@@ -58,57 +115,35 @@ def search_documents(
     sort_by: Optional[str] = "timestamp",
     sort_order: Optional[str] = "desc",
     filters: Optional[dict] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    fuzzy: bool = False,
 ):
     es = get_es_client()
     if not es:
         return {"results": [], "total": 0, "error": "Elasticsearch unavailable"}
 
     try:
-        must_clauses = [
-            {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["event_type^3", "payload.*", "metadata.*"],
-                    "fuzziness": "AUTO",
-                }
-            }
-        ]
-
-        filter_clauses = []
-        if filters:
-            for field, value in filters.items():
-                filter_clauses.append({"term": {f"{field}.keyword": value}})
-
         body = {
-            "query": {
-                "bool": {
-                    "must": must_clauses,
-                    "filter": filter_clauses,
-                }
-            },
+            "query": _build_query(query, filters, start_time, end_time, fuzzy),
             "size": size,
             "from": from_offset,
-            "highlight": {
-                "fields": {"event_type": {}, "payload.*": {}}
-            },
+            "highlight": HIGHLIGHT,
         }
 
         if sort_by:
             body["sort"] = [{sort_by: {"order": sort_order}}]
 
-        response = es.search(index=index, body=body)
+        response = es.search(
+            index=search_index(index, start_time, end_time),
+            body=body,
+            ignore_unavailable=True,
+            allow_no_indices=True,
+        )
         hits = response["hits"]
 
-        results = []
-        for hit in hits["hits"]:
-            result = hit["_source"]
-            result["_score"] = hit["_score"]
-            if "highlight" in hit:
-                result["_highlights"] = hit["highlight"]
-            results.append(result)
-
         return {
-            "results": results,
+            "results": [_format_hit(hit) for hit in hits["hits"]],
             "total": hits["total"]["value"],
             "max_score": hits.get("max_score"),
         }
@@ -117,36 +152,384 @@ def search_documents(
         return {"results": [], "total": 0, "error": str(e)}
 
 
-def aggregate_data(index: str, field: str, interval: str = "day", size: int = 30):
+def encode_cursor(pit_id: str, search_after: list, sort_by: str, sort_order: str, params: str = "") -> str:
+    payload = {"pit": pit_id, "after": search_after, "sort": [sort_by, sort_order], "params": params}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not payload.get("pit") or not isinstance(payload.get("after"), list):
+            raise ValueError("incomplete cursor")
+        return payload
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def search_params_hash(index: str, query: str, filters: Optional[dict], start_time, end_time, fuzzy: bool) -> str:
+    """Fingerprint of the parameters a cursor was issued for, so a cursor
+    cannot be replayed against a different search."""
+    material = json.dumps(
+        [index, query, filters or {}, to_utc(start_time), to_utc(end_time), bool(fuzzy)],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def _pit_sort(sort_by: Optional[str], sort_order: Optional[str]) -> list:
+    # event_id is unique per document, which makes search_after positions stable
+    sort = []
+    if sort_by and sort_by != "event_id":
+        sort.append({sort_by: {"order": sort_order or "desc"}})
+    sort.append({"event_id": {"order": "asc"}})
+    return sort
+
+
+def search_page(
+    index: str,
+    query: str,
+    size: int = 50,
+    cursor: Optional[str] = None,
+    sort_by: Optional[str] = "timestamp",
+    sort_order: Optional[str] = "desc",
+    filters: Optional[dict] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    fuzzy: bool = False,
+):
+    """Cursor-paginated search using a point-in-time context and
+    ``search_after``. Cost per page is independent of how deep the page is.
+
+    Pass the returned ``next_cursor`` back to fetch the following page; it is
+    ``None`` once the result set is exhausted and the PIT has been closed.
+    Raises ValueError for a malformed cursor or one issued for different
+    search parameters.
+    """
+    params = search_params_hash(index, query, filters, start_time, end_time, fuzzy)
+    state = decode_cursor(cursor) if cursor else None
+    if state:
+        if state.get("params") != params:
+            raise ValueError("Cursor does not match the search parameters")
+        sort_by, sort_order = state["sort"]
+
     es = get_es_client()
     if not es:
-        return {}
+        return {"results": [], "total": 0, "next_cursor": None, "error": "Elasticsearch unavailable"}
+
     try:
+        if state:
+            pit_id = state["pit"]
+        else:
+            pit = es.open_point_in_time(
+                index=search_index(index, start_time, end_time),
+                keep_alive=PIT_KEEP_ALIVE,
+                ignore_unavailable=True,
+            )
+            pit_id = pit["id"]
+
         body = {
-            "size": 0,
-            "aggs": {
-                "over_time": {
-                    "date_histogram": {
-                        "field": "timestamp",
-                        "calendar_interval": interval,
-                    }
-                },
-                "by_field": {
-                    "terms": {"field": f"{field}.keyword", "size": size}
-                },
-            },
+            "query": _build_query(query, filters, start_time, end_time, fuzzy),
+            "size": size,
+            "sort": _pit_sort(sort_by, sort_order),
+            "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+            # Only the first page pays for an exact hit count
+            "track_total_hits": state is None,
+            "highlight": HIGHLIGHT,
         }
-        response = es.search(index=index, body=body)
-        return response["aggregations"]
+        if state:
+            body["search_after"] = state["after"]
+
+        response = es.search(body=body)
+        pit_id = response.get("pit_id", pit_id)
+        hits = response["hits"]["hits"]
+
+        next_cursor = None
+        if len(hits) == size:
+            next_cursor = encode_cursor(pit_id, hits[-1]["sort"], sort_by, sort_order, params)
+        else:
+            _close_pit(es, pit_id)
+
+        result = {
+            "results": [_format_hit(hit) for hit in hits],
+            "next_cursor": next_cursor,
+        }
+        if "total" in response["hits"]:
+            result["total"] = response["hits"]["total"]["value"]
+        return result
+    except Exception as e:
+        logger.error(f"ES cursor search failed: {e}")
+        return {"results": [], "total": 0, "next_cursor": None, "error": str(e)}
+
+
+def close_cursor(cursor: str) -> bool:
+    state = decode_cursor(cursor)
+    es = get_es_client()
+    if not es:
+        return False
+    return _close_pit(es, state["pit"])
+
+
+def _close_pit(es, pit_id: str) -> bool:
+    try:
+        es.close_point_in_time(id=pit_id)
+        return True
+    except Exception as e:
+        logger.warning(f"ES close PIT failed: {e}")
+        return False
+
+
+def iter_documents(
+    index: str,
+    query: str,
+    sort_by: Optional[str] = "timestamp",
+    sort_order: Optional[str] = "desc",
+    filters: Optional[dict] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    page_size: int = EXPORT_PAGE_SIZE,
+    fuzzy: bool = False,
+):
+    """Yield every matching document, one page in memory at a time."""
+    es = get_es_client()
+    if not es:
+        return
+
+    pit_id = es.open_point_in_time(
+        index=search_index(index, start_time, end_time),
+        keep_alive=PIT_KEEP_ALIVE,
+        ignore_unavailable=True,
+    )["id"]
+    try:
+        search_after = None
+        while True:
+            body = {
+                "query": _build_query(query, filters, start_time, end_time, fuzzy),
+                "size": page_size,
+                "sort": _pit_sort(sort_by, sort_order),
+                "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                "track_total_hits": False,
+            }
+            if search_after:
+                body["search_after"] = search_after
+
+            response = es.search(body=body)
+            pit_id = response.get("pit_id", pit_id)
+            hits = response["hits"]["hits"]
+            for hit in hits:
+                yield hit["_source"]
+            if len(hits) < page_size:
+                break
+            search_after = hits[-1]["sort"]
+    finally:
+        _close_pit(es, pit_id)
+
+
+METRIC_AGGREGATIONS = {"sum", "avg", "min", "max", "percentiles", "value_count", "cardinality"}
+METRIC_FIELD_PREFIXES = ("payload.", "metadata.")
+
+
+def parse_metrics(metrics: Optional[list]) -> dict:
+    """Turn ``["avg:payload.response_ms", ...]`` into named ES metric
+    aggregations. Raises ValueError for unknown operations or fields."""
+    aggs = {}
+    for spec in metrics or []:
+        op, _, field = spec.partition(":")
+        if op not in METRIC_AGGREGATIONS:
+            raise ValueError(f"Unsupported metric '{op}'")
+        if not field.startswith(METRIC_FIELD_PREFIXES):
+            raise ValueError(f"Metric field must be a payload or metadata field: '{field}'")
+        aggs[f"{op}_{field.replace('.', '_')}"] = {op: {"field": field}}
+    return aggs
+
+
+def build_aggregation_body(
+    field: str,
+    interval: str = "day",
+    size: int = 30,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    filters: Optional[dict] = None,
+    mode: str = "flat",
+    metrics: Optional[list] = None,
+    min_doc_count: int = 0,
+) -> dict:
+    metric_aggs = parse_metrics(metrics)
+
+    histogram = {
+        "field": "timestamp",
+        "calendar_interval": interval,
+        "min_doc_count": min_doc_count,
+    }
+    if start_time is not None:
+        # Buckets cover exactly the requested window, empty ones included
+        bounds = {
+            "min": to_utc(start_time).isoformat(),
+            "max": (to_utc(end_time) or datetime.now(timezone.utc)).isoformat(),
+        }
+        histogram["extended_bounds"] = bounds
+        histogram["hard_bounds"] = bounds
+
+    terms = {"terms": {"field": field, "size": size}}
+    if metric_aggs:
+        terms["aggs"] = dict(metric_aggs)
+
+    over_time = {"date_histogram": histogram}
+    aggs = {"over_time": over_time}
+    if mode == "nested":
+        over_time["aggs"] = {"by_field": terms}
+    else:
+        if metric_aggs:
+            over_time["aggs"] = dict(metric_aggs)
+        aggs["by_field"] = terms
+
+    filter_clauses = [{"term": {name: value}} for name, value in (filters or {}).items()]
+    time_filter = range_filter(start_time, end_time)
+    if time_filter:
+        filter_clauses.append(time_filter)
+
+    body = {"size": 0, "aggs": aggs}
+    if filter_clauses:
+        body["query"] = {"bool": {"filter": filter_clauses}}
+    return body
+
+
+def aggregate_data(
+    index: str,
+    field: str,
+    interval: str = "day",
+    size: int = 30,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    filters: Optional[dict] = None,
+    mode: str = "flat",
+    metrics: Optional[list] = None,
+    min_doc_count: int = 0,
+):
+    body = build_aggregation_body(
+        field,
+        interval=interval,
+        size=size,
+        start_time=start_time,
+        end_time=end_time,
+        filters=filters,
+        mode=mode,
+        metrics=metrics,
+        min_doc_count=min_doc_count,
+    )
+
+    es = get_es_client()
+    if not es:
+        return {}
+    try:
+        response = es.search(
+            index=search_index(index, start_time, end_time),
+            body=body,
+            ignore_unavailable=True,
+            allow_no_indices=True,
+        )
+        return response.get("aggregations", {})
     except Exception as e:
         logger.error(f"ES aggregation failed: {e}")
         return {}
 
 
+DSL_MAX_SIZE = 200
+# Deepest hit a caller-built body may page to (from + size)
+DSL_MAX_WINDOW = 1000
+DSL_ALLOWED_KEYS = {"query", "size", "from", "sort", "aggs", "aggregations", "_source", "track_total_hits"}
+# Query types a caller-built body may use; anything else (wrapper, percolate,
+# script_score...) is refused rather than reviewed case by case
+DSL_LEAF_QUERIES = {
+    "match_all", "match_none", "term", "terms", "match", "match_phrase", "match_phrase_prefix",
+    "multi_match", "range", "prefix", "wildcard", "fuzzy", "exists", "ids", "simple_query_string",
+}
+DSL_COMPOUND_QUERIES = {
+    "bool": ("must", "filter", "should", "must_not"),
+    "constant_score": ("filter",),
+    "dis_max": ("queries",),
+    "boosting": ("positive", "negative"),
+}
+# Never allowed anywhere, aggregations included: wrapper hides a base64 query
+DSL_FORBIDDEN_KEYS = {"wrapper"}
+
+
+def _has_script(node) -> bool:
+    if isinstance(node, dict):
+        return any(
+            key.startswith("script") or key in DSL_FORBIDDEN_KEYS or _has_script(value)
+            for key, value in node.items()
+        )
+    if isinstance(node, list):
+        return any(_has_script(item) for item in node)
+    return False
+
+
+def _check_query(node):
+    """Raise ValueError unless ``node`` only uses allowlisted query types."""
+    if not isinstance(node, dict) or len(node) != 1:
+        raise ValueError("Each query must be an object with a single query type")
+    kind, spec = next(iter(node.items()))
+    if kind in DSL_LEAF_QUERIES:
+        return
+    if kind not in DSL_COMPOUND_QUERIES or not isinstance(spec, dict):
+        raise ValueError(f"Query type not allowed: {kind}")
+    for clause in DSL_COMPOUND_QUERIES[kind]:
+        value = spec.get(clause)
+        for child in value if isinstance(value, list) else ([] if value is None else [value]):
+            _check_query(child)
+
+
+def _non_negative_int(body: dict, key: str, default: int) -> int:
+    value = body.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{key} must be a non-negative integer")
+    return value
+
+
+def run_dsl_query(index: str, body: dict):
+    """Run a caller-built search body (e.g. a translated natural-language
+    question). Only read-only search keys and allowlisted query types are
+    accepted, ``size`` is capped and ``from + size`` is bounded; raises
+    ValueError for anything else."""
+    unknown = set(body) - DSL_ALLOWED_KEYS
+    if unknown:
+        raise ValueError(f"Unsupported search keys: {', '.join(sorted(unknown))}")
+    if _has_script(body):
+        raise ValueError("Scripts and wrapper queries are not allowed in search bodies")
+    if "query" in body:
+        _check_query(body["query"])
+    size = min(_non_negative_int(body, "size", 10), DSL_MAX_SIZE)
+    offset = _non_negative_int(body, "from", 0)
+    if offset + size > DSL_MAX_WINDOW:
+        raise ValueError(f"from + size must not exceed {DSL_MAX_WINDOW}")
+    body = {**body, "size": size}
+
+    es = get_es_client()
+    if not es:
+        return {"results": [], "total": 0, "error": "Elasticsearch unavailable"}
+    try:
+        response = es.search(index=index, body=body, ignore_unavailable=True, allow_no_indices=True)
+        hits = response["hits"]
+        return {
+            "results": [_format_hit(hit) for hit in hits["hits"]],
+            "total": hits["total"]["value"],
+            "aggregations": response.get("aggregations", {}),
+        }
+    except Exception as e:
+        logger.error(f"ES DSL search failed: {e}")
+        return {"results": [], "total": 0, "error": str(e)}
+
+
 def get_suggestions(index: str, query: str):
+    """Completion suggestions for ``query``; None when Elasticsearch is
+    unavailable or fails, so callers can tell that apart from no matches."""
     es = get_es_client()
     if not es:
-        return []
+        return None
     try:
         body = {
             "suggest": {
@@ -163,4 +546,4 @@ def get_suggestions(index: str, query: str):
         return suggestions
     except Exception as e:
         logger.error(f"ES suggest failed: {e}")
-        return []
+        return None
@@ -0,0 +1,133 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("datapulse-fastapi")
+
+WS_FLUSH_INTERVAL_MS = int(os.environ.get("WS_FLUSH_INTERVAL_MS", "250"))
+WS_BATCH_SAMPLES = int(os.environ.get("WS_BATCH_SAMPLES", "20"))
+
+Publish = Callable[[dict, str], Awaitable[None]]
+
+
+class _ChannelBatch:
+    __slots__ = ("count", "counts", "samples")
+
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.counts: Dict[str, int] = {}
+        self.samples: deque = deque(maxlen=max_samples)
+
+    def add(self, event: dict):
+        event_type = event.get("event_type", "unknown")
+        self.count += 1
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+        self.samples.append(event)
+
+
+class EventConflator:
+    """Batches live events per channel and publishes one ``new_events`` frame
+    per channel every ``interval_ms``, carrying per-type counts and the most
+    recent ``max_samples`` events instead of one frame per event."""
+
+    def __init__(
+        self,
+        publish: Publish,
+        interval_ms: int = WS_FLUSH_INTERVAL_MS,
+        max_samples: int = WS_BATCH_SAMPLES,
+    ):
+        self._publish = publish
+        self.interval_ms = interval_ms
+        self.max_samples = max_samples
+        self._batches: Dict[str, _ChannelBatch] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add(self, channel: str, event: dict) -> bool:
+        """Buffer an event for ``channel``. Returns False when conflation is
+        not running so the caller can push the event directly."""
+        if not self.running:
+            return False
+        batch = self._batches.get(channel)
+        if batch is None:
+            batch = self._batches[channel] = _ChannelBatch(self.max_samples)
+        batch.add(event)
+        return True
+
+    async def start(self):
+        if self.running or self.interval_ms <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Live event conflation started (interval={self.interval_ms}ms)")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def flush(self):
+        batches, self._batches = self._batches, {}
+        timestamp = datetime.utcnow().isoformat()
+        for channel, batch in batches.items():
+            frame = {
+                "type": "new_events",
+                "channel": channel,
+                "window_ms": self.interval_ms,
+                "timestamp": timestamp,
+                "count": batch.count,
+                "counts": batch.counts,
+                "samples": list(batch.samples),
+            }
+            try:
+                await self._publish(frame, channel)
+            except Exception as e:
+                logger.error(f"Live event flush failed for {channel}: {e}")
+
+    async def _run(self):
+        interval = self.interval_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+def shape_frame(frame: dict, mode: str = "batch", event_types: Optional[frozenset] = None) -> Optional[dict]:
+    """Narrow a ``new_events`` frame to a client's stream options.
+
+    ``event_types`` keeps only those types; ``mode="aggregate"`` drops the
+    samples and sends counts only. Returns None when nothing is left to send.
+    Other frame types pass through unchanged.
+    """
+    if frame.get("type") != "new_events":
+        return frame
+
+    counts = frame["counts"]
+    samples = frame.get("samples", [])
+    if event_types:
+        counts = {k: v for k, v in counts.items() if k in event_types}
+        samples = [s for s in samples if s.get("event_type") in event_types]
+        if not counts:
+            return None
+
+    shaped = {
+        "type": "new_events",
+        "channel": frame.get("channel"),
+        "window_ms": frame.get("window_ms"),
+        "timestamp": frame.get("timestamp"),
+        "count": sum(counts.values()),
+        "counts": counts,
+    }
+    if mode != "aggregate":
+        shaped["samples"] = samples
+    return shaped
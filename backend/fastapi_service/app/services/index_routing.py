@@ -0,0 +1,100 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
+
+EVENTS_INDEX = os.environ.get("ES_EVENTS_INDEX", "datapulse-events")
+INDEX_GRANULARITY = os.environ.get("ES_INDEX_GRANULARITY", "day")
+MAX_ROUTED_INDICES = int(os.environ.get("ES_MAX_ROUTED_INDICES", "62"))
+
+_SUFFIX_FORMATS = {
+    "day": "%Y.%m.%d",
+    "month": "%Y.%m",
+}
+
+
+def to_utc(value: Union[str, datetime, None]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def index_for_timestamp(timestamp: Union[str, datetime, None], prefix: str = EVENTS_INDEX) -> str:
+    """Backing index for a document, e.g. ``datapulse-events-2024.01.15``.
+
+    Documents are routed by their event time, not by ingest time, so late
+    arrivals still land in the index a time-range query will look at.
+    """
+    ts = to_utc(timestamp) or datetime.now(timezone.utc)
+    return f"{prefix}-{ts.strftime(_SUFFIX_FORMATS[INDEX_GRANULARITY])}"
+
+
+def write_index(index: str, document: dict) -> str:
+    """Resolve the logical events index to its date-suffixed backing index.
+    Any other index name is written as-is."""
+    if index != EVENTS_INDEX:
+        return index
+    return index_for_timestamp(document.get("timestamp"), prefix=index)
+
+
+def indices_for_range(
+    start: Union[str, datetime, None],
+    end: Union[str, datetime, None] = None,
+    prefix: str = EVENTS_INDEX,
+) -> str:
+    """Comma-separated backing indices overlapping ``[start, end]``.
+
+    Without a start time, or when the range spans more than
+    ``MAX_ROUTED_INDICES`` indices, the read alias covering every backing
+    index is returned instead.
+    """
+    start = to_utc(start)
+    if start is None:
+        return prefix
+    end = to_utc(end) or datetime.now(timezone.utc)
+    if end < start:
+        return prefix
+
+    names = []
+    current = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if INDEX_GRANULARITY == "month":
+        current = current.replace(day=1)
+    while current <= end:
+        names.append(index_for_timestamp(current, prefix=prefix))
+        if len(names) > MAX_ROUTED_INDICES:
+            return prefix
+        if INDEX_GRANULARITY == "month":
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current += timedelta(days=1)
+    return ",".join(names)
+
+
+def search_index(
+    index: str,
+    start: Union[str, datetime, None] = None,
+    end: Union[str, datetime, None] = None,
+) -> str:
+    if index != EVENTS_INDEX:
+        return index
+    return indices_for_range(start, end, prefix=index)
+
+
+def range_filter(
+    start: Union[str, datetime, None] = None,
+    end: Union[str, datetime, None] = None,
+) -> Optional[dict]:
+    bounds = {}
+    if start is not None:
+        bounds["gte"] = to_utc(start).isoformat()
+    if end is not None:
+        bounds["lte"] = to_utc(end).isoformat()
+    if not bounds:
+        return None
+    return {"range": {"timestamp": bounds}}
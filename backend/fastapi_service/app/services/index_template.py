@@ -0,0 +1,88 @@
+import os
+import logging
+
+from .elasticsearch_client import get_es_client
+from .index_routing import EVENTS_INDEX
+
+logger = logging.getLogger("datapulse-fastapi")
+
+ES_ILM_POLICY = os.environ.get("ES_ILM_POLICY", "")
+ES_NUMBER_OF_SHARDS = int(os.environ.get("ES_NUMBER_OF_SHARDS", "2"))
+ES_NUMBER_OF_REPLICAS = int(os.environ.get("ES_NUMBER_OF_REPLICAS", "1"))
+
+# Bump whenever the template body changes so running services upgrade it
+TEMPLATE_VERSION = 1
+SEARCH_FIELD = "search_text"
+
+
+def _string_leaf(path: str) -> dict:
+    # String leaves under payload/metadata become keywords (for filters and
+    # terms aggregations) and are copied into the single full-text field.
+    return {
+        "path_match": path,
+        "match_mapping_type": "string",
+        "mapping": {"type": "keyword", "ignore_above": 256, "copy_to": SEARCH_FIELD},
+    }
+
+
+def events_template() -> dict:
+    settings = {
+        "number_of_shards": ES_NUMBER_OF_SHARDS,
+        "number_of_replicas": ES_NUMBER_OF_REPLICAS,
+        "index.mapping.total_fields.limit": 2000,
+    }
+    if ES_ILM_POLICY:
+        settings["index.lifecycle.name"] = ES_ILM_POLICY
+
+    return {
+        "index_patterns": [f"{EVENTS_INDEX}-*"],
+        "priority": 200,
+        "version": TEMPLATE_VERSION,
+        "template": {
+            "settings": settings,
+            "aliases": {EVENTS_INDEX: {}},
+            "mappings": {
+                "dynamic_templates": [
+                    {"payload_strings": _string_leaf("payload.*")},
+                    {"metadata_strings": _string_leaf("metadata.*")},
+                ],
+                "properties": {
+                    "event_id": {"type": "keyword"},
+                    "event_type": {
+                        "type": "keyword",
+                        "copy_to": SEARCH_FIELD,
+                        "fields": {"suggest": {"type": "completion"}},
+                    },
+                    "source_id": {"type": "keyword", "copy_to": SEARCH_FIELD},
+                    "timestamp": {"type": "date"},
+                    "payload": {"type": "object"},
+                    "metadata": {"type": "object"},
+                    SEARCH_FIELD: {"type": "text", "store": True},
+                },
+            },
+        },
+    }
+
+
+def ensure_index_template() -> bool:
+    """Install or upgrade the events index template. Newer templates installed
+    by another deployment are left alone."""
+    es = get_es_client()
+    if not es:
+        return False
+
+    name = EVENTS_INDEX
+    try:
+        installed = 0
+        if es.indices.exists_index_template(name=name):
+            existing = es.indices.get_index_template(name=name)["index_templates"][0]
+            installed = existing["index_template"].get("version", 0)
+        if installed >= TEMPLATE_VERSION:
+            return True
+
+        es.indices.put_index_template(name=name, **events_template())
+        logger.info(f"Installed index template {name} v{TEMPLATE_VERSION}")
+        return True
+    except Exception as e:
+        logger.error(f"Index template install failed: {e}")
+        return False
@@ -1,80 +1,209 @@
 import os
 import json
+import time
 import logging
 import asyncio
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .suggestion_index import suggestion_index
 
 logger = logging.getLogger("datapulse-fastapi")
 
 KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 KAFKA_CONSUMER_GROUP = os.environ.get("KAFKA_CONSUMER_GROUP", "datapulse-fastapi-consumer")
-
-_consumer_task: Optional[asyncio.Task] = None
+KAFKA_TOPICS = ("datapulse-events", "datapulse-alerts")
+KAFKA_POLL_TIMEOUT_MS = int(os.environ.get("KAFKA_POLL_TIMEOUT_MS", "500"))
+KAFKA_MAX_POLL_RECORDS = int(os.environ.get("KAFKA_MAX_POLL_RECORDS", "500"))
+KAFKA_LAG_INTERVAL = float(os.environ.get("KAFKA_LAG_INTERVAL", "15"))
+KAFKA_RETRY_BACKOFF = 1.0
+KAFKA_MAX_RETRY_BACKOFF = 30.0
+
+
+def _create_kafka_consumer():
+    from kafka import KafkaConsumer
+
+    return KafkaConsumer(
+        *KAFKA_TOPICS,
+        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+        group_id=KAFKA_CONSUMER_GROUP,
+        auto_offset_reset="latest",
+        enable_auto_commit=False,
+        max_poll_records=KAFKA_MAX_POLL_RECORDS,
+    )
 
 
-async def start_consumer():
-    global _consumer_task
-    try:
-        _consumer_task = asyncio.create_task(_consume_events())
+def _decode(value):
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class EventConsumer:
+    """Consumes DataPulse topics without blocking the event loop.
+
+    kafka-python is synchronous and not thread-safe, so every call on the
+    client runs on one dedicated worker thread. Each polled batch is handled
+    per partition: partitions run concurrently, records within a partition
+    stay in order, and offsets are committed once the whole batch is done.
+    Connection failures are retried with exponential backoff.
+    """
+
+    def __init__(self, factory: Callable = _create_kafka_consumer, handler: Optional[Callable] = None):
+        self._factory = factory
+        self._handler = handler
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._consumer = None
+        self._task: Optional[asyncio.Task] = None
+        self._lag: dict = {}
+        self._lag_checked_at = 0.0
+        self._stats = {
+            "messages": 0,
+            "batches": 0,
+            "failed": 0,
+            "commits": 0,
+            "commit_failures": 0,
+            "reconnects": 0,
+            "last_batch_ms": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kafka-consumer")
+        self._task = asyncio.create_task(self._run())
         logger.info("Kafka consumer started")
-    except Exception as e:
-        logger.warning(f"Kafka consumer could not start: {e}")
 
-
-async def stop_consumer():
-    global _consumer_task
-    if _consumer_task:
-        _consumer_task.cancel()
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
         try:
-            await _consumer_task
+            await self._task
         except asyncio.CancelledError:
             pass
+        self._task = None
+        # Queued behind any in-flight poll on the same thread
+        await self._close()
+        self._executor.shutdown(wait=False)
         logger.info("Kafka consumer stopped")
 
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "running": self.running,
+            "connected": self._consumer is not None,
+            "lag": {f"{tp.topic}-{tp.partition}": lag for tp, lag in self._lag.items()},
+            "total_lag": sum(self._lag.values()),
+        }
 
-async def _consume_events():
-    try:
-        from kafka import KafkaConsumer
-    except ImportError:
-        logger.warning("kafka-python not installed, consumer disabled")
-        return
-
-    try:
-        consumer = KafkaConsumer(
-            "datapulse-events",
-            "datapulse-alerts",
-            bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
-            group_id=KAFKA_CONSUMER_GROUP,
-            value_deserializer=lambda m: json.loads(m.decode("utf-8")),
-            auto_offset_reset="latest",
-            enable_auto_commit=True,
-            consumer_timeout_ms=1000,
-        )
-
-        logger.info("Kafka consumer connected, listening for events...")
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
 
+    async def _run(self):
+        backoff = KAFKA_RETRY_BACKOFF
         while True:
-            messages = consumer.poll(timeout_ms=500)
-            for topic_partition, records in messages.items():
-                for record in records:
-                    await _process_message(record.topic, record.value)
-            await asyncio.sleep(0.1)
+            try:
+                if self._consumer is None:
+                    self._consumer = await self._call(self._factory)
+                    logger.info("Kafka consumer connected, listening for events...")
+                await self.poll_once()
+                backoff = KAFKA_RETRY_BACKOFF
+            except asyncio.CancelledError:
+                raise
+            except ImportError:
+                logger.warning("kafka-python not installed, consumer disabled")
+                return
+            except Exception as e:
+                logger.error(f"Kafka consumer error, reconnecting in {backoff:.0f}s: {e}")
+                await self._close()
+                self._stats["reconnects"] += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, KAFKA_MAX_RETRY_BACKOFF)
+
+    async def poll_once(self):
+        batch = await self._call(self._poll)
+        if batch:
+            started = time.perf_counter()
+            await asyncio.gather(*(self._process_partition(records) for records in batch.values()))
+            self._stats["batches"] += 1
+            self._stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            await self._commit(batch)
+        if time.monotonic() - self._lag_checked_at >= KAFKA_LAG_INTERVAL:
+            self._lag_checked_at = time.monotonic()
+            try:
+                self._lag = await self._call(self._fetch_lag)
+            except Exception as e:
+                logger.warning(f"Kafka lag check failed: {e}")
+
+    def _poll(self) -> dict:
+        return self._consumer.poll(timeout_ms=KAFKA_POLL_TIMEOUT_MS, max_records=KAFKA_MAX_POLL_RECORDS)
+
+    async def _process_partition(self, records: list):
+        for record in records:
+            try:
+                await (self._handler or _process_message)(record.topic, _decode(record.value))
+                self._stats["messages"] += 1
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"Skipping message {record.topic}@{record.offset}: {e}")
+
+    async def _commit(self, batch: dict):
+        from kafka.structs import OffsetAndMetadata
+
+        offsets = {tp: OffsetAndMetadata(records[-1].offset + 1, None) for tp, records in batch.items()}
+        try:
+            await self._call(self._consumer.commit, offsets)
+            self._stats["commits"] += 1
+        except Exception as e:
+            # Typically a rebalance; the batch is redelivered to the new owner
+            self._stats["commit_failures"] += 1
+            logger.warning(f"Kafka offset commit failed: {e}")
+
+    def _fetch_lag(self) -> dict:
+        assignment = self._consumer.assignment()
+        if not assignment:
+            return {}
+        end_offsets = self._consumer.end_offsets(list(assignment))
+        return {tp: max(0, end_offsets[tp] - self._consumer.position(tp)) for tp in assignment}
+
+    async def _close(self):
+        consumer, self._consumer = self._consumer, None
+        self._lag = {}
+        if consumer is None:
+            return
+        try:
+            await self._call(consumer.close)
+        except Exception as e:
+            logger.warning(f"Kafka consumer close failed: {e}")
 
-    except Exception as e:
-        logger.error(f"Kafka consumer error: {e}")
-        await asyncio.sleep(5)
 
+event_consumer = EventConsumer()
 
-async def _process_message(topic: str, message: dict):
+
+async def start_consumer():
     try:
-        if topic == "datapulse-events":
-            await _handle_event(message)
-        elif topic == "datapulse-alerts":
-            await _handle_alert(message)
-        else:
-            logger.warning(f"Unknown topic: {topic}")
+        await event_consumer.start()
     except Exception as e:
-        logger.error(f"Error processing message from {topic}: {e}")
+        logger.warning(f"Kafka consumer could not start: {e}")
+
+
+async def stop_consumer():
+    await event_consumer.stop()
+
+
+async def _process_message(topic: str, message: dict):
+    # Handler errors propagate so the consumer counts and logs the failure
+    if topic == "datapulse-events":
+        await _handle_event(message)
+    elif topic == "datapulse-alerts":
+        await _handle_alert(message)
+    else:
+        logger.warning(f"Unknown topic: {topic}")
 
 
 async def _handle_event(event_data: dict):
@@ -83,6 +212,9 @@ async def _handle_event(event_data: dict):
     event_type = event_data.get("event_type", "unknown")
     logger.info(f"Processing event: {event_type}")
 
+    suggestion_index.record(event_type, "event_type")
+    suggestion_index.record(event_data.get("source_id"), "source_id")
+
     # Push to WebSocket clients for real-time updates
     await push_event_to_clients(event_data, channel=event_type)
     await push_event_to_clients(event_data, channel="default")
@@ -98,4 +230,5 @@ async def _handle_alert(alert_data: dict):
     await push_event_to_clients(
         {"type": "alert", "data": alert_data},
         channel="alerts",
+        conflate=False,
     )
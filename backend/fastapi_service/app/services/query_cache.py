@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable
+
+from .index_routing import to_utc
+
+logger = logging.getLogger("datapulse-fastapi")
+
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "2048"))
+QUERY_CACHE_REDIS_URL = os.environ.get("QUERY_CACHE_REDIS_URL", os.environ.get("REDIS_URL", ""))
+QUERY_CACHE_PREFIX = "datapulse:query-cache:"
+
+INTERVAL_SECONDS = {
+    "minute": 60, "1m": 60,
+    "hour": 3600, "1h": 3600,
+    "day": 86400, "1d": 86400,
+    "week": 604800, "1w": 604800,
+    "month": 2592000, "1M": 2592000,
+    "quarter": 7776000, "1q": 7776000,
+    "year": 31536000, "1y": 31536000,
+}
+MIN_TTL = 5
+MAX_TTL = 900
+
+
+def ttl_for_interval(interval: str) -> int:
+    """Cache lifetime for a histogram interval: about a twelfth of one bucket,
+    so minute charts refresh every few seconds and daily ones every 15 minutes."""
+    seconds = INTERVAL_SECONDS.get(interval, 3600)
+    return max(MIN_TTL, min(MAX_TTL, seconds // 12))
+
+
+def ttl_for_window(interval: str, end=None) -> int:
+    """Like ``ttl_for_interval``, but windows that closed more than one bucket
+    ago cannot change any more and are kept for the maximum TTL."""
+    end = to_utc(end)
+    if end is not None:
+        age = time.time() - end.timestamp()
+        if age > INTERVAL_SECONDS.get(interval, 3600):
+            return MAX_TTL
+    return ttl_for_interval(interval)
+
+
+def _default_cacheable(result) -> bool:
+    if isinstance(result, dict):
+        return bool(result) and "error" not in result
+    return result is not None
+
+
+class QueryCache:
+    """Two-tier result cache for read-heavy search endpoints.
+
+    Entries live in an in-process LRU and, when Redis is configured, in a
+    shared Redis tier. Keys combine the normalized parameters with the current
+    TTL-sized time bucket. Concurrent misses for the same key share a single
+    backend call.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, redis_url: str = QUERY_CACHE_REDIS_URL):
+        self.max_entries = max_entries
+        self.redis_url = redis_url
+        self._redis = None
+        self._redis_failed = False
+        self._local: OrderedDict = OrderedDict()
+        self._inflight: dict = {}
+        self._stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def make_key(namespace: str, params: dict, ttl: int) -> str:
+        normalized = json.dumps(
+            {k: v for k, v in params.items() if v is not None},
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        bucket = int(time.time() // ttl)
+        return f"{namespace}:{digest}:{bucket}"
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        params: dict,
+        ttl: int,
+        compute: Callable,
+        cacheable: Callable = _default_cacheable,
+    ):
+        """Return the cached result for ``params`` or run the blocking
+        ``compute`` in a worker thread and cache what it returns."""
+        key = self.make_key(namespace, params, ttl)
+
+        value = self._get_local(key)
+        if value is not None:
+            self._stats["local_hits"] += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The leader was cancelled, not us: take over the computation
+                return await self.get_or_compute(namespace, params, ttl, compute, cacheable)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._get_redis(key)
+            if value is not None:
+                self._stats["redis_hits"] += 1
+                self._set_local(key, value, ttl)
+            else:
+                self._stats["misses"] += 1
+                value = await asyncio.to_thread(compute)
+                if cacheable(value):
+                    self._set_local(key, value, ttl)
+                    await self._set_redis(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody else awaited is not logged
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = sum(self._stats[k] for k in ("local_hits", "redis_hits", "misses", "coalesced"))
+        hits = lookups - self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._local),
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "redis_enabled": bool(self.redis_url) and not self._redis_failed,
+        }
+
+    def clear(self):
+        self._local.clear()
+
+    def _get_local(self, key: str):
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value, ttl: int):
+        self._local[key] = (time.monotonic() + ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _get_redis_client(self):
+        if self._redis is not None or self._redis_failed or not self.redis_url:
+            return self._redis
+        try:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url, socket_timeout=0.5)
+        except Exception as e:
+            logger.warning(f"Query cache Redis tier unavailable: {e}")
+            self._redis_failed = True
+        return self._redis
+
+    async def _get_redis(self, key: str):
+        client = self._get_redis_client()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(QUERY_CACHE_PREFIX + key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"Query cache Redis read failed: {e}")
+            return None
+
+    async def _set_redis(self, key: str, value, ttl: int):
+        client = self._get_redis_client()
+        if client is None:
+            return
+        try:
+            await client.set(QUERY_CACHE_PREFIX + key, json.dumps(value, default=str), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Query cache Redis write failed: {e}")
+
+
+query_cache = QueryCache()
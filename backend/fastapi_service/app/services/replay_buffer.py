@@ -0,0 +1,89 @@
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+WS_REPLAY_MAX_EVENTS = int(os.environ.get("WS_REPLAY_MAX_EVENTS", "500"))
+WS_REPLAY_MAX_AGE = float(os.environ.get("WS_REPLAY_MAX_AGE", "300"))
+WS_REPLAY_MAX_CHANNELS = int(os.environ.get("WS_REPLAY_MAX_CHANNELS", "1000"))
+
+
+class ReplayBuffer:
+    """Recent events per channel, so a client that subscribes late can catch
+    up from memory.
+
+    Each channel keeps at most ``max_events`` events no older than
+    ``max_age`` seconds, and only the ``max_channels`` most recently written
+    channels are kept at all, which bounds total memory.
+    """
+
+    def __init__(
+        self,
+        max_events: int = WS_REPLAY_MAX_EVENTS,
+        max_age: float = WS_REPLAY_MAX_AGE,
+        max_channels: int = WS_REPLAY_MAX_CHANNELS,
+    ):
+        self.max_events = max_events
+        self.max_age = max_age
+        self.max_channels = max_channels
+        self._channels: OrderedDict = OrderedDict()
+
+    def record(self, channel: str, event: dict, now: Optional[float] = None):
+        if self.max_events <= 0:
+            return
+        now = time.time() if now is None else now
+        events = self._channels.get(channel)
+        if events is None:
+            events = self._channels[channel] = deque(maxlen=self.max_events)
+            if len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(channel)
+        events.append((now, event))
+        self._expire(events, now)
+
+    def recent(
+        self,
+        channel: str,
+        last: Optional[int] = None,
+        seconds: Optional[float] = None,
+        event_types=None,
+        now: Optional[float] = None,
+    ) -> list:
+        """Events for ``channel``, oldest first: the newest ``last`` of them,
+        those from the past ``seconds``, or both limits together. With
+        ``event_types``, only those types are counted and returned."""
+        events = self._channels.get(channel)
+        if not events:
+            return []
+        now = time.time() if now is None else now
+        self._expire(events, now)
+
+        cutoff = now - seconds if seconds is not None else None
+        limit = len(events) if last is None else max(0, last)
+        types = set(event_types) if event_types else None
+        picked = []
+        # Walk back from the newest event until either limit is hit
+        for ts, event in reversed(events):
+            if len(picked) >= limit or (cutoff is not None and ts < cutoff):
+                break
+            if types is None or event.get("event_type") in types:
+                picked.append(event)
+        picked.reverse()
+        return picked
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self._channels),
+            "events": sum(len(events) for events in self._channels.values()),
+            "max_events_per_channel": self.max_events,
+            "max_age_seconds": self.max_age,
+        }
+
+    def _expire(self, events: deque, now: float):
+        cutoff = now - self.max_age
+        while events and events[0][0] < cutoff:
+            events.popleft()
+
+
+replay_buffer = ReplayBuffer()
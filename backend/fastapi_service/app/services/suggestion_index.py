@@ -0,0 +1,107 @@
+import os
+import heapq
+import logging
+from bisect import bisect_left, insort
+
+from .elasticsearch_client import get_es_client
+
+logger = logging.getLogger("datapulse-fastapi")
+
+SUGGEST_MAX_TERMS = int(os.environ.get("SUGGEST_MAX_TERMS", "50000"))
+SUGGEST_MAX_TERM_LENGTH = 100
+SUGGEST_SEED_SIZE = int(os.environ.get("SUGGEST_SEED_SIZE", "1000"))
+SUGGEST_MIN_QUERY_COUNT = int(os.environ.get("SUGGEST_MIN_QUERY_COUNT", "3"))
+
+
+class SuggestionIndex:
+    """In-memory prefix index of event types, sources and popular search terms.
+
+    Keys are kept in a sorted list so every term sharing a prefix sits in one
+    contiguous slice found with two bisects; the slice is ranked by weight.
+    Raw search strings are only served once they have been searched
+    ``min_query_count`` times, so one user's query is not shown to everyone.
+    """
+
+    def __init__(self, max_terms: int = SUGGEST_MAX_TERMS, min_query_count: int = SUGGEST_MIN_QUERY_COUNT):
+        self.max_terms = max_terms
+        self.min_query_count = min_query_count
+        self._keys: list = []
+        self._entries: dict = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, term, kind: str, weight: float = 1.0):
+        if not isinstance(term, str):
+            return
+        text = term.strip()
+        if not text or len(text) > SUGGEST_MAX_TERM_LENGTH:
+            return
+        key = text.lower()
+
+        entry = self._entries.get(key)
+        if entry:
+            entry[1] += weight
+            if kind != "query":
+                # Seen in real events, so no longer gated as a raw search
+                entry[2] = kind
+            return
+
+        self._entries[key] = [text, weight, kind]
+        insort(self._keys, key)
+        if len(self._entries) > self.max_terms:
+            self._evict()
+
+    def suggest(self, prefix: str, limit: int = 5) -> list:
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\uffff", lo)
+        if lo == hi:
+            return []
+        best = heapq.nlargest(
+            limit,
+            (
+                entry
+                for entry in map(self._entries.__getitem__, self._keys[lo:hi])
+                if entry[2] != "query" or entry[1] >= self.min_query_count
+            ),
+            key=lambda entry: entry[1],
+        )
+        return [text for text, _, _ in best]
+
+    def _evict(self):
+        # Drop the lightest tenth in one pass instead of one term per insert
+        keep = self.max_terms - max(1, self.max_terms // 10)
+        ranked = heapq.nlargest(keep, self._entries.items(), key=lambda item: item[1][1])
+        self._entries = dict(ranked)
+        self._keys = sorted(self._entries)
+
+    def seed_from_es(self, index: str = "datapulse-events", size: int = SUGGEST_SEED_SIZE) -> int:
+        """Prime the index with the most frequent event types and sources."""
+        es = get_es_client()
+        if not es:
+            return 0
+        try:
+            body = {
+                "size": 0,
+                "aggs": {
+                    "event_type": {"terms": {"field": "event_type", "size": size}},
+                    "source_id": {"terms": {"field": "source_id", "size": size}},
+                },
+            }
+            response = es.search(index=index, body=body, ignore_unavailable=True, allow_no_indices=True)
+            seeded = 0
+            for kind, agg in response.get("aggregations", {}).items():
+                for bucket in agg.get("buckets", []):
+                    self.record(bucket["key"], kind, weight=bucket["doc_count"])
+                    seeded += 1
+            logger.info(f"Suggestion index seeded with {seeded} terms")
+            return seeded
+        except Exception as e:
+            logger.warning(f"Suggestion index seed failed: {e}")
+            return 0
+
+
+suggestion_index = SuggestionIndex()
@@ -0,0 +1,123 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger("datapulse-fastapi")
+
+WS_BACKPLANE = os.environ.get("WS_BACKPLANE", "")
+WS_BACKPLANE_REDIS_URL = os.environ.get("WS_BACKPLANE_REDIS_URL", os.environ.get("REDIS_URL", ""))
+WS_BACKPLANE_PREFIX = "datapulse:ws:"
+
+Deliver = Callable[[str, str], Awaitable[None]]
+
+
+class InMemoryBackplane:
+    """Backplane whose "processes" are instances sharing one hub dict.
+
+    Used in tests and single-process deployments. Instances created with the
+    same ``hub`` behave like workers connected to the same Redis.
+    """
+
+    def __init__(self, hub: Optional[Dict[str, Set["InMemoryBackplane"]]] = None):
+        self._hub = hub if hub is not None else {}
+        self._deliver: Optional[Deliver] = None
+        self.channels: Set[str] = set()
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        for channel in list(self.channels):
+            await self.unsubscribe(channel)
+
+    async def publish(self, channel: str, text: str):
+        for peer in list(self._hub.get(channel, ())):
+            await peer._deliver(channel, text)
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+        self._hub.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+        peers = self._hub.get(channel)
+        if peers is not None:
+            peers.discard(self)
+            if not peers:
+                del self._hub[channel]
+
+
+class RedisBackplane:
+    """Fans channel broadcasts out across processes with Redis pub/sub.
+
+    Every process publishes to ``datapulse:ws:<channel>`` and subscribes only
+    to the channels its own clients are listening on.
+    """
+
+    def __init__(self, redis_url: str = WS_BACKPLANE_REDIS_URL):
+        self.redis_url = redis_url
+        self.channels: Set[str] = set()
+        self._redis = None
+        self._pubsub = None
+        self._deliver: Optional[Deliver] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        import redis.asyncio as aioredis
+
+        self._deliver = deliver
+        self._redis = aioredis.from_url(self.redis_url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._reader = asyncio.create_task(self._read_loop())
+        logger.info("WebSocket Redis backplane started")
+
+    async def stop(self):
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub:
+            await self._pubsub.aclose()
+        if self._redis:
+            await self._redis.aclose()
+
+    async def publish(self, channel: str, text: str):
+        await self._redis.publish(WS_BACKPLANE_PREFIX + channel, text)
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+        await self._pubsub.subscribe(WS_BACKPLANE_PREFIX + channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+        await self._pubsub.unsubscribe(WS_BACKPLANE_PREFIX + channel)
+
+    async def _read_loop(self):
+        while True:
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(0.2)
+                continue
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if not message or message.get("type") != "message":
+                    continue
+                channel = message["channel"].decode("utf-8")[len(WS_BACKPLANE_PREFIX):]
+                data = message["data"]
+                await self._deliver(channel, data.decode("utf-8") if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # redis-py resubscribes on reconnect, so just back off
+                logger.error(f"WebSocket backplane read failed: {e}")
+                await asyncio.sleep(1)
+
+
+def create_backplane(kind: str = WS_BACKPLANE):
+    if kind == "redis":
+        return RedisBackplane()
+    if kind == "memory":
+        return InMemoryBackplane()
+    return None
@@ -0,0 +1,38 @@
+import json
+import logging
+from typing import Union
+
+logger = logging.getLogger("datapulse-fastapi")
+
+DEFAULT_ENCODING = "json"
+
+
+def _msgpack():
+    try:
+        import msgpack
+        return msgpack
+    except ImportError:
+        return None
+
+
+def available_encodings() -> list:
+    encodings = ["json"]
+    if _msgpack():
+        encodings.append("msgpack")
+    return encodings
+
+
+def negotiate_encoding(requested) -> str:
+    """Pick the encoding a client asked for, or JSON if it is not available."""
+    if requested in available_encodings():
+        return requested
+    if requested and requested != DEFAULT_ENCODING:
+        logger.info(f"WebSocket encoding '{requested}' unavailable, using JSON")
+    return DEFAULT_ENCODING
+
+
+def encode_frame(frame: dict, encoding: str = DEFAULT_ENCODING) -> Union[str, bytes]:
+    """JSON frames are sent as text, MessagePack frames as binary."""
+    if encoding == "msgpack":
+        return _msgpack().packb(frame, default=str, use_bin_type=True)
+    return json.dumps(frame, default=str)
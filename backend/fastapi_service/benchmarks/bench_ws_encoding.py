@@ -0,0 +1,81 @@
+"""Compare WebSocket frame size and encode time per 1,000 events.
+
+Run from backend/fastapi_service:
+
+    python -m benchmarks.bench_ws_encoding
+
+"deflate" applies raw DEFLATE with a shared context per connection, which is
+what permessage-deflate does when the client negotiates it.
+"""
+import json
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from app.services.ws_encoding import available_encodings, encode_frame
+
+EVENTS = 1000
+REPEAT = 20
+EVENT_TYPES = ["page_view", "click", "purchase", "signup", "api_call", "error"]
+
+
+def make_events(n: int) -> list:
+    start = datetime(2024, 1, 15, 10, 0, 0)
+    return [
+        {
+            "event_id": f"evt-{i:06d}",
+            "event_type": random.choice(EVENT_TYPES),
+            "source_id": f"source-{random.randint(1, 20)}",
+            "timestamp": (start + timedelta(milliseconds=37 * i)).isoformat(),
+            "payload": {
+                "page": random.choice(["/home", "/pricing", "/checkout", "/docs"]),
+                "response_ms": round(random.uniform(5, 900), 2),
+                "status": random.choice([200, 200, 200, 201, 404, 500]),
+            },
+            "metadata": {"region": random.choice(["us-east-1", "eu-west-1"])},
+        }
+        for i in range(n)
+    ]
+
+
+def measure(frames: list, encoding: str, deflate: bool):
+    best = float("inf")
+    total_bytes = 0
+    for _ in range(REPEAT):
+        compressor = zlib.compressobj(wbits=-15) if deflate else None
+        total_bytes = 0
+        start = time.perf_counter()
+        for frame in frames:
+            data = encode_frame(frame, encoding)
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if compressor:
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            total_bytes += len(data)
+        best = min(best, time.perf_counter() - start)
+    return total_bytes, best * 1000
+
+
+def main():
+    random.seed(7)
+    events = make_events(EVENTS)
+    per_event = [{"type": "new_event", "data": e} for e in events]
+    batched = [{
+        "type": "new_events",
+        "channel": "default",
+        "count": len(events),
+        "samples": events,
+    }]
+
+    print(f"{'shape':<10} {'encoding':<16} {'bytes':>10} {'encode ms':>10}")
+    for shape, frames in (("per-event", per_event), ("batched", batched)):
+        for encoding in available_encodings():
+            for deflate in (False, True):
+                size, ms = measure(frames, encoding, deflate)
+                label = encoding + ("+deflate" if deflate else "")
+                print(f"{shape:<10} {label:<16} {size:>10} {ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
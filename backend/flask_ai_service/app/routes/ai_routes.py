@@ -1,12 +1,126 @@
+import os
+import json
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from ..services.bedrock_service import generate_bedrock_summary
-from ..services.openai_service import generate_openai_insights
-from ..services.llm_orchestrator import analyze_data, generate_natural_language_query
+from ..services.llm_orchestrator import (
+    LLM_STRATEGY,
+    analysis_prompt,
+    analyze_data_async,
+    complete,
+    generate_natural_language_query,
+    provider_stats,
+    stream_complete,
+    summarize_content,
+    with_usage,
+)
+from ..services.token_budget import estimate_tokens, fits, token_quota, verified_user_id
+from ..services.anomaly_engine import DEFAULT_WINDOW, detect_anomalies as run_anomaly_detection
+from ..services.llm_cache import llm_cache
+from ..services.batch_analysis import run_batch, validate_jobs
 
 logger = logging.getLogger("datapulse-flask-ai")
 ai_bp = Blueprint("ai", __name__)
 
+# Routes whose LLM responses are never cached, e.g. "summarize,nl-query"
+LLM_CACHE_SKIP_ROUTES = {
+    r.strip() for r in os.environ.get("LLM_CACHE_SKIP_ROUTES", "").split(",") if r.strip()
+}
+
+
+def _use_cache(route: str, data: dict) -> bool:
+    """Whether this request may be answered from the LLM response cache.
+    Clients opt out with ``"cache": false`` or ``Cache-Control: no-cache``."""
+    if route in LLM_CACHE_SKIP_ROUTES:
+        return False
+    if data.get("cache") is False:
+        return False
+    return "no-cache" not in request.headers.get("Cache-Control", "")
+
+
+MAX_OUTPUT_TOKENS = 4096
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cost_usd")
+
+
+def _quota_user() -> str:
+    # Only a verified access token names a user; anyone else is keyed by
+    # client address, so a made-up identity cannot reset the quota
+    auth = request.headers.get("Authorization", "")
+    user_id = verified_user_id(auth[len("Bearer "):] if auth.startswith("Bearer ") else "")
+    if user_id:
+        return f"user:{user_id}"
+    return f"addr:{request.remote_addr or 'unknown'}"
+
+
+def _quota_exceeded(user: str, needed: int = 0):
+    """429 response when ``user`` cannot afford ``needed`` more tokens today."""
+    if token_quota.allow(user, needed):
+        return None
+    return jsonify({
+        "error": "Daily token quota exceeded",
+        "remaining_tokens": token_quota.remaining(user),
+    }), 429
+
+
+def _charge(user: str, result: dict):
+    token_quota.consume(user, result.get("input_tokens", 0) + result.get("output_tokens", 0))
+
+
+def _max_tokens(data: dict, default: int) -> int:
+    """Requested output limit clamped to ``MAX_OUTPUT_TOKENS``; raises
+    ValueError when it is not a number."""
+    try:
+        requested = int(data.get("max_tokens", default))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("'max_tokens' must be an integer")
+    return max(1, min(MAX_OUTPUT_TOKENS, requested))
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _sse_response(chunks, done: dict, user: str, prompt_tokens: int) -> Response:
+    """Server-sent events for a ``stream_complete`` generator: one ``token``
+    event per chunk, then ``done`` carrying ``done`` plus the result
+    metadata and usage, or ``error`` if the stream broke. Usage is charged
+    to ``user`` once the stream completes."""
+
+    def events():
+        try:
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration as stop:
+                    meta = stop.value
+                    break
+                yield _sse("token", {"text": chunk})
+        except Exception as e:
+            logger.error(f"Streaming response failed: {e}")
+            yield _sse("error", {"error": str(e)})
+            return
+        finally:
+            # Runs on client disconnect too, releasing the provider slot
+            chunks.close()
+        meta = meta or {}
+        if meta.get("error"):
+            yield _sse("error", {"error": meta["error"]})
+        usage = with_usage({"provider": "fallback", **meta}, prompt_tokens)
+        _charge(user, usage)
+        yield _sse("done", {
+            **done,
+            "provider": meta.get("provider"),
+            "tokens_used": meta.get("tokens_used", 0),
+            "cached": meta.get("cached", False),
+            **{field: usage[field] for field in USAGE_FIELDS},
+        })
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @ai_bp.route("/summarize", methods=["POST"])
 def summarize_data():
@@ -15,19 +129,37 @@ def summarize_data():
         return jsonify({"error": "Missing 'content' field"}), 400
 
     provider = data.get("provider", "bedrock")
-    content = data["content"]
-    max_tokens = data.get("max_tokens", 500)
+    content = str(data["content"])
+    try:
+        max_tokens = _max_tokens(data, 500)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user = _quota_user()
+    exceeded = _quota_exceeded(user, estimate_tokens(content) + max_tokens)
+    if exceeded:
+        return exceeded
+
+    use_cache = _use_cache("summarize", data)
 
     try:
-        if provider == "openai":
-            result = generate_openai_insights(content, max_tokens=max_tokens)
-        else:
-            result = generate_bedrock_summary(content, max_tokens=max_tokens)
+        # Oversized content is summarized in parallel chunks, then combined
+        result = summarize_content(
+            content,
+            max_tokens,
+            provider=provider,
+            strategy=data.get("strategy", LLM_STRATEGY),
+            use_cache=use_cache,
+        )
+        _charge(user, result)
 
         return jsonify({
             "summary": result["text"],
-            "provider": provider,
+            "provider": result.get("provider", provider),
             "tokens_used": result.get("tokens_used", 0),
+            "cached": result.get("cached", False),
+            "chunks": result["chunks"],
+            "degraded": result.get("degraded", False),
+            **{field: result[field] for field in USAGE_FIELDS},
         })
     except Exception as e:
         logger.error(f"Summarization failed: {e}")
@@ -35,35 +167,92 @@ def summarize_data():
 
 
 @ai_bp.route("/analyze", methods=["POST"])
-def analyze_analytics_data():
+async def analyze_analytics_data():
     data = request.get_json()
     if not data or "events" not in data:
         return jsonify({"error": "Missing 'events' field"}), 400
 
+    user = _quota_user()
+    exceeded = _quota_exceeded(user)
+    if exceeded:
+        return exceeded
+
     try:
-        analysis = analyze_data(
+        analysis = await analyze_data_async(
             events=data["events"],
             analysis_type=data.get("type", "trend"),
             provider=data.get("provider", "bedrock"),
+            use_cache=_use_cache("analyze", data),
+            strategy=data.get("strategy", LLM_STRATEGY),
         )
+        _charge(user, analysis)
         return jsonify(analysis)
     except Exception as e:
         logger.error(f"Analysis failed: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@ai_bp.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    data = request.get_json()
+    if not data or "jobs" not in data:
+        return jsonify({"error": "Missing 'jobs' field"}), 400
+    error = validate_jobs(data["jobs"])
+    if error:
+        return jsonify({"error": error}), 400
+    user = _quota_user()
+    exceeded = _quota_exceeded(user)
+    if exceeded:
+        return exceeded
+
+    records = run_batch(
+        data["jobs"],
+        provider=data.get("provider", "bedrock"),
+        strategy=data.get("strategy", LLM_STRATEGY),
+        use_cache=_use_cache("analyze", data),
+    )
+
+    def lines():
+        for record in records:
+            # Duplicates share one call, so only the original is charged
+            if record["type"] == "result" and "duplicate_of" not in record:
+                _charge(user, record)
+            yield json.dumps(record, default=str) + "\n"
+            if not token_quota.allow(user):
+                # Stop mid-batch: closing the generator cancels the jobs
+                # that have not started yet
+                records.close()
+                yield json.dumps({
+                    "type": "error",
+                    "error": "Daily token quota exceeded",
+                    "remaining_tokens": token_quota.remaining(user),
+                }) + "\n"
+                return
+
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
+
+
 @ai_bp.route("/nl-query", methods=["POST"])
 def natural_language_query():
     data = request.get_json()
     if not data or "question" not in data:
         return jsonify({"error": "Missing 'question' field"}), 400
 
+    user = _quota_user()
+    exceeded = _quota_exceeded(user)
+    if exceeded:
+        return exceeded
+
     try:
         result = generate_natural_language_query(
             question=data["question"],
             schema_context=data.get("schema", ""),
             provider=data.get("provider", "bedrock"),
+            use_cache=_use_cache("nl-query", data),
+            strategy=data.get("strategy", LLM_STRATEGY),
+            execute=bool(data.get("execute", False)),
         )
+        _charge(user, result)
         return jsonify(result)
     except Exception as e:
         logger.error(f"NL query generation failed: {e}")
@@ -73,83 +262,194 @@ def natural_language_query():
 @ai_bp.route("/anomaly-detect", methods=["POST"])
 def detect_anomalies():
     data = request.get_json()
-    if not data or "metrics" not in data:
-        return jsonify({"error": "Missing 'metrics' field"}), 400
+    if not data or ("metrics" not in data and "values" not in data):
+        return jsonify({"error": "Missing 'metrics' or 'values' field"}), 400
 
     try:
-        metrics = data["metrics"]
-        threshold = data.get("threshold", 2.0)
+        # Columnar input ("values" plus optional "timestamps") skips building
+        # a dict per point; "metrics" is the original list-of-objects form
+        metrics = data.get("metrics")
+        if metrics is not None:
+            values = [m.get("value") if isinstance(m, dict) else None for m in metrics]
+        else:
+            values = data["values"]
+        timestamps = data.get("timestamps")
 
-        # Statistical anomaly detection
-        import statistics
-        values = [m.get("value", 0) for m in metrics if isinstance(m.get("value"), (int, float))]
+        result = run_anomaly_detection(
+            values,
+            method=data.get("method", "zscore"),
+            threshold=float(data.get("threshold", 2.0)),
+            window=int(data.get("window", DEFAULT_WINDOW)),
+            period=int(data.get("period", 0)),
+            max_anomalies=int(data.get("max_anomalies", 1000)),
+        )
 
-        if len(values) < 3:
+        if result["total_points"] < 3:
             return jsonify({"anomalies": [], "message": "Not enough data points"})
 
-        mean = statistics.mean(values)
-        stdev = statistics.stdev(values)
-
         anomalies = []
-        for i, metric in enumerate(metrics):
-            val = metric.get("value", 0)
-            if isinstance(val, (int, float)) and stdev > 0:
-                z_score = abs(val - mean) / stdev
-                if z_score > threshold:
-                    anomalies.append({
-                        "index": i,
-                        "value": val,
-                        "z_score": round(z_score, 3),
-                        "metric": metric,
-                    })
+        for index, value, score in zip(result["indices"], result["values"], result["scores"]):
+            # z_score stays unsigned as before; signed_score gives the direction
+            anomaly = {"index": index, "value": value, "z_score": abs(score), "signed_score": score}
+            if metrics is not None:
+                anomaly["metric"] = metrics[index]
+            elif timestamps and index < len(timestamps):
+                anomaly["timestamp"] = timestamps[index]
+            anomalies.append(anomaly)
 
         # Get AI explanation for anomalies
         if anomalies:
             explanation = generate_bedrock_summary(
                 f"Explain these anomalies in analytics data: {anomalies[:5]}",
                 max_tokens=300,
+                use_cache=_use_cache("anomaly-detect", data),
             )
         else:
             explanation = {"text": "No anomalies detected in the provided data."}
 
         return jsonify({
             "anomalies": anomalies,
-            "total_points": len(values),
-            "mean": round(mean, 3),
-            "stdev": round(stdev, 3),
+            "anomaly_count": result["count"],
+            "method": data.get("method", "zscore"),
+            "total_points": result["total_points"],
+            "mean": round(result["mean"], 3),
+            "stdev": round(result["stdev"], 3),
+            "median": round(result["median"], 3),
             "explanation": explanation["text"],
         })
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Anomaly detection failed: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def _report_prompt(data: dict) -> str:
+    dashboard_title = data.get("dashboard_title", "Dashboard")
+    event_count = data.get("event_count", 0)
+    source_count = data.get("source_count", 0)
+    alert_count = data.get("alert_count", 0)
+    top_events = data.get("top_events", [])
+
+    return (
+        f"Generate a professional executive summary for the analytics dashboard '{dashboard_title}'. "
+        f"Key metrics: {event_count} total events processed from {source_count} data sources. "
+        f"{alert_count} alerts triggered. Top event types: {', '.join(top_events[:5])}. "
+        f"Provide insights, trends, and actionable recommendations."
+    )
+
+
 @ai_bp.route("/report-summary", methods=["POST"])
 def generate_report_summary():
     data = request.get_json()
     if not data:
         return jsonify({"error": "Missing request body"}), 400
 
+    user = _quota_user()
+    exceeded = _quota_exceeded(user)
+    if exceeded:
+        return exceeded
+
     try:
         dashboard_title = data.get("dashboard_title", "Dashboard")
-        event_count = data.get("event_count", 0)
-        source_count = data.get("source_count", 0)
-        alert_count = data.get("alert_count", 0)
-        top_events = data.get("top_events", [])
-
-        prompt = (
-            f"Generate a professional executive summary for the analytics dashboard '{dashboard_title}'. "
-            f"Key metrics: {event_count} total events processed from {source_count} data sources. "
-            f"{alert_count} alerts triggered. Top event types: {', '.join(top_events[:5])}. "
-            f"Provide insights, trends, and actionable recommendations."
-        )
+        prompt = _report_prompt(data)
 
-        result = generate_bedrock_summary(prompt, max_tokens=600)
+        result = complete(prompt, 600, use_cache=_use_cache("report-summary", data))
+        _charge(user, result)
         return jsonify({
             "summary": result["text"],
             "dashboard": dashboard_title,
             "tokens_used": result.get("tokens_used", 0),
+            "cached": result.get("cached", False),
+            **{field: result[field] for field in USAGE_FIELDS},
         })
     except Exception as e:
         logger.error(f"Report summary generation failed: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@ai_bp.route("/summarize/stream", methods=["POST"])
+def summarize_data_stream():
+    data = request.get_json()
+    if not data or "content" not in data:
+        return jsonify({"error": "Missing 'content' field"}), 400
+
+    provider = data.get("provider", "bedrock")
+    content = str(data["content"])
+    try:
+        max_tokens = _max_tokens(data, 500)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    prompt_tokens = estimate_tokens(content)
+    if not fits(provider, prompt_tokens, max_tokens):
+        return jsonify({"error": "Content too large to stream; use /summarize, which splits it"}), 413
+    user = _quota_user()
+    exceeded = _quota_exceeded(user, prompt_tokens + max_tokens)
+    if exceeded:
+        return exceeded
+
+    chunks = stream_complete(content, max_tokens, provider=provider, use_cache=_use_cache("summarize", data))
+    return _sse_response(chunks, {"requested_provider": provider}, user, prompt_tokens)
+
+
+@ai_bp.route("/analyze/stream", methods=["POST"])
+def analyze_analytics_data_stream():
+    data = request.get_json()
+    if not data or "events" not in data:
+        return jsonify({"error": "Missing 'events' field"}), 400
+    if not data["events"]:
+        return jsonify({"error": "No events provided for analysis"}), 400
+
+    user = _quota_user()
+    exceeded = _quota_exceeded(user)
+    if exceeded:
+        return exceeded
+
+    analysis_type = data.get("type", "trend")
+    prompt = analysis_prompt(data["events"], analysis_type)
+    chunks = stream_complete(
+        prompt,
+        600,
+        provider=data.get("provider", "bedrock"),
+        use_cache=_use_cache("analyze", data),
+    )
+    done = {"type": analysis_type, "events_analyzed": len(data["events"])}
+    return _sse_response(chunks, done, user, estimate_tokens(prompt))
+
+
+@ai_bp.route("/report-summary/stream", methods=["POST"])
+def generate_report_summary_stream():
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Missing request body"}), 400
+
+    user = _quota_user()
+    exceeded = _quota_exceeded(user)
+    if exceeded:
+        return exceeded
+
+    prompt = _report_prompt(data)
+    chunks = stream_complete(prompt, 600, use_cache=_use_cache("report-summary", data))
+    done = {"dashboard": data.get("dashboard_title", "Dashboard")}
+    return _sse_response(chunks, done, user, estimate_tokens(prompt))
+
+
+@ai_bp.route("/cache/stats", methods=["GET"])
+def llm_cache_stats():
+    return jsonify(llm_cache.stats())
+
+
+@ai_bp.route("/providers/stats", methods=["GET"])
+def llm_provider_stats():
+    return jsonify(provider_stats())
+
+
+@ai_bp.route("/quota", methods=["GET"])
+def token_quota_status():
+    user = _quota_user()
+    return jsonify({
+        "user": user,
+        "used_tokens": token_quota.used(user),
+        "daily_limit": token_quota.daily_limit,
+        "remaining_tokens": token_quota.remaining(user),
+    })
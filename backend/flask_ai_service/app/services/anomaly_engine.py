@@ -0,0 +1,158 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+METHODS = ("zscore", "rolling_zscore", "mad", "seasonal")
+DEFAULT_WINDOW = 60
+MIN_POINTS = 3
+# Scales the median absolute deviation to a standard deviation for normal data
+MAD_SCALE = 1.4826
+
+
+def to_array(values) -> np.ndarray:
+    """Float64 array from a list of numbers; anything that is not a JSON
+    number (strings, including numeric ones, nulls, objects) becomes NaN."""
+    try:
+        array = np.asarray(values)
+        if array.dtype.kind in "iuf":
+            return array.astype(np.float64)
+    except (TypeError, ValueError):
+        pass
+    return np.array(
+        [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values],
+        dtype=np.float64,
+    )
+
+
+def zscore(x: np.ndarray) -> np.ndarray:
+    std = x.std(ddof=1)
+    if not std > 0:
+        return np.zeros_like(x)
+    return (x - x.mean()) / std
+
+
+def rolling_zscore(x: np.ndarray, window: int = DEFAULT_WINDOW) -> np.ndarray:
+    """Score each point against the mean and deviation of the ``window``
+    points before it, so level shifts stop being anomalous once they settle.
+    Points with fewer than ``MIN_POINTS`` predecessors score zero."""
+    n = len(x)
+    window = max(MIN_POINTS, int(window))
+    # Centering first keeps the cumulative sum of squares well conditioned
+    centered = x - x.mean()
+    csum = np.concatenate(([0.0], np.cumsum(centered)))
+    csq = np.concatenate(([0.0], np.cumsum(centered * centered)))
+
+    end = np.arange(n)
+    start = np.maximum(0, end - window)
+    count = end - start
+    total = csum[end] - csum[start]
+    mean = np.divide(total, count, out=np.zeros(n), where=count > 0)
+    var = np.divide(
+        csq[end] - csq[start] - total * mean,
+        count - 1,
+        out=np.zeros(n),
+        where=count > 1,
+    )
+    std = np.sqrt(np.maximum(var, 0.0))
+
+    scores = np.zeros(n)
+    valid = (count >= MIN_POINTS) & (std > 0)
+    scores[valid] = (centered[valid] - mean[valid]) / std[valid]
+    return scores
+
+
+def mad_score(x: np.ndarray) -> np.ndarray:
+    """Robust z-score from the median and median absolute deviation, which
+    a handful of extreme points cannot drag towards themselves."""
+    median = np.median(x)
+    deviation = np.abs(x - median)
+    scale = MAD_SCALE * np.median(deviation)
+    if not scale > 0:
+        # More than half the points are identical; fall back to the mean deviation
+        scale = 1.2533 * deviation.mean()
+    if not scale > 0:
+        return np.zeros_like(x)
+    return (x - median) / scale
+
+
+def seasonal_residual(x: np.ndarray, period: int) -> np.ndarray:
+    """Robust score of what is left after removing a moving-average trend and
+    the median profile of each phase of ``period``."""
+    n = len(x)
+    period = int(period)
+    if period < 2 or n < 2 * period:
+        raise ValueError(f"seasonal method needs period >= 2 and at least {2 * max(period, 2)} points")
+
+    # Centered moving average over one full period; edges reuse the nearest value
+    csum = np.concatenate(([0.0], np.cumsum(x)))
+    half = period // 2
+    trend = np.empty(n)
+    inner = (csum[period:] - csum[:-period]) / period
+    trend[half:half + len(inner)] = inner
+    trend[:half] = inner[0]
+    trend[half + len(inner):] = inner[-1]
+
+    detrended = x - trend
+    cycles = -(-n // period)
+    padded = np.full(cycles * period, np.nan)
+    padded[:n] = detrended
+    profile = np.nanmedian(padded.reshape(cycles, period), axis=0)
+    seasonal = np.tile(profile, cycles)[:n]
+
+    return mad_score(detrended - seasonal)
+
+
+def score(x: np.ndarray, method: str = "zscore", window: int = DEFAULT_WINDOW, period: int = 0) -> np.ndarray:
+    if method == "zscore":
+        return zscore(x)
+    if method == "rolling_zscore":
+        return rolling_zscore(x, window)
+    if method == "mad":
+        return mad_score(x)
+    if method == "seasonal":
+        return seasonal_residual(x, period)
+    raise ValueError(f"Unknown method '{method}', expected one of {', '.join(METHODS)}")
+
+
+def detect_anomalies(
+    values,
+    method: str = "zscore",
+    threshold: float = 2.0,
+    window: int = DEFAULT_WINDOW,
+    period: int = 0,
+    max_anomalies: int = 1000,
+) -> dict:
+    """Score a series and return the points whose absolute score exceeds
+    ``threshold``.
+
+    Non-numeric values are skipped; returned indices refer to positions in
+    the original input. When more than ``max_anomalies`` points qualify, the
+    highest-scoring ones are kept, still in input order.
+    """
+    x = to_array(values)
+    finite = np.isfinite(x)
+    positions = np.flatnonzero(finite)
+    series = x[finite]
+
+    if len(series) < MIN_POINTS:
+        return {"indices": [], "scores": [], "values": [], "count": 0, "total_points": int(len(series))}
+
+    scores = score(series, method, window, period)
+    flagged = np.flatnonzero(np.abs(scores) > threshold)
+    count = len(flagged)
+    if count > max_anomalies:
+        top = np.argpartition(-np.abs(scores[flagged]), max_anomalies - 1)[:max_anomalies]
+        flagged = np.sort(flagged[top])
+
+    return {
+        "indices": positions[flagged].tolist(),
+        "scores": np.round(scores[flagged], 3).tolist(),
+        "values": series[flagged].tolist(),
+        "count": int(count),
+        "total_points": int(len(series)),
+        "mean": float(series.mean()),
+        "stdev": float(series.std(ddof=1)),
+        "median": float(np.median(series)),
+    }
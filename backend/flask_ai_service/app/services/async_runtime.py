@@ -0,0 +1,29 @@
+import asyncio
+import logging
+import threading
+from typing import Awaitable
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_provider_loop() -> asyncio.AbstractEventLoop:
+    """Process-wide event loop, on its own thread, that runs async provider
+    I/O. Flask gives every async view a fresh loop, and httpx async pools
+    are tied to the loop that opened them, so pooled clients live here."""
+    global _loop
+    if _loop is not None:
+        return _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-provider-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+async def on_provider_loop(coro: Awaitable):
+    """Await ``coro`` on the provider loop from any other loop."""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, get_provider_loop()))
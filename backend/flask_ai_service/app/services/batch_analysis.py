@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Generator
+
+from .llm_orchestrator import LLM_STRATEGY, PROVIDERS, analyze_data
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "500"))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "8"))
+BATCH_RATE_WAIT = float(os.environ.get("BATCH_RATE_WAIT", "120"))
+
+# Shared by every batch request, so concurrent batches together stay within
+# the pool size; provider calls are paced by the orchestrator's rate limiters
+_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-analysis")
+
+
+def validate_jobs(jobs) -> str:
+    """Return an error message for a malformed batch, or an empty string."""
+    if not isinstance(jobs, list) or not jobs:
+        return "'jobs' must be a non-empty list"
+    if len(jobs) > BATCH_MAX_JOBS:
+        return f"At most {BATCH_MAX_JOBS} jobs per batch"
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict) or not isinstance(job.get("events"), list):
+            return f"Job {index} is missing an 'events' list"
+    return ""
+
+
+def job_key(job: dict, default_provider: str, default_strategy: str) -> str:
+    material = json.dumps(
+        [
+            job["events"],
+            job.get("type", "trend"),
+            job.get("provider", default_provider),
+            job.get("strategy", default_strategy),
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _run_job(job: dict, provider: str, strategy: str, use_cache: bool) -> dict:
+    # Batch calls wait for rate-limit tokens and provider slots rather than
+    # being refused the way interactive requests are
+    return analyze_data(
+        events=job["events"],
+        analysis_type=job.get("type", "trend"),
+        provider=provider,
+        use_cache=use_cache,
+        strategy=strategy,
+        wait=BATCH_RATE_WAIT,
+    )
+
+
+def _is_degraded(result: dict) -> bool:
+    # Fallback text comes back when no provider answered in time
+    return bool(result.get("events_analyzed")) and result.get("provider") not in PROVIDERS
+
+
+def run_batch(
+    jobs: list,
+    provider: str = "bedrock",
+    strategy: str = LLM_STRATEGY,
+    use_cache: bool = True,
+) -> Generator[dict, None, None]:
+    """Run analysis jobs on the shared pool and yield one record per job as
+    it finishes, then a summary record. Identical jobs (same events, type,
+    provider and strategy) run once and their result is yielded for each."""
+    started = time.monotonic()
+    groups: dict = {}
+    for index, job in enumerate(jobs):
+        groups.setdefault(job_key(job, provider, strategy), []).append(index)
+
+    futures = {}
+    for indices in groups.values():
+        job = jobs[indices[0]]
+        job_provider = job.get("provider", provider)
+        future = _executor.submit(_run_job, job, job_provider, job.get("strategy", strategy), use_cache)
+        futures[future] = indices
+
+    failed = 0
+    degraded = 0
+    try:
+        for future in as_completed(futures):
+            indices = futures[future]
+            try:
+                result = future.result()
+                # The record kind owns "type"; the analysis type moves aside
+                record = {**result, "type": "result", "analysis_type": result.get("type")}
+                records = [dict(record) for _ in indices]
+                if _is_degraded(result):
+                    degraded += len(indices)
+                    for record in records:
+                        record["degraded"] = True
+            except Exception as e:
+                logger.error(f"Batch analysis job failed: {e}")
+                failed += len(indices)
+                records = [{"type": "error", "error": str(e)} for _ in indices]
+            for index, record in zip(indices, records):
+                record["index"] = index
+                if "id" in jobs[index]:
+                    record["id"] = jobs[index]["id"]
+                if index != indices[0]:
+                    record["duplicate_of"] = indices[0]
+                yield record
+    finally:
+        # Client went away: drop the jobs that have not started yet
+        for future in futures:
+            future.cancel()
+
+    yield {
+        "type": "summary",
+        "jobs": len(jobs),
+        "unique_jobs": len(groups),
+        "failed": failed,
+        "degraded": degraded,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    }
@@ -1,29 +1,167 @@
 import os
 import json
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .llm_cache import llm_cache
 
 logger = logging.getLogger("datapulse-flask-ai")
 
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-v2")
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "50"))
+BEDROCK_CONNECT_TIMEOUT = float(os.environ.get("BEDROCK_CONNECT_TIMEOUT", "5"))
+BEDROCK_READ_TIMEOUT = float(os.environ.get("BEDROCK_READ_TIMEOUT", "60"))
+BEDROCK_ASYNC_WORKERS = int(os.environ.get("BEDROCK_ASYNC_WORKERS", "16"))
+
+_client = None
+_client_lock = threading.Lock()
+# botocore has no asyncio transport: async callers share this bounded pool
+# rather than taking one thread each
+_async_executor = ThreadPoolExecutor(max_workers=BEDROCK_ASYNC_WORKERS, thread_name_prefix="bedrock-async")
 
 
 def get_bedrock_client():
+    """Process-wide Bedrock runtime client. boto3 clients are thread-safe, so
+    one client and its connection pool serve every request."""
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        try:
+            import boto3
+            from botocore.config import Config
+
+            config = Config(
+                max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+                connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+                read_timeout=BEDROCK_READ_TIMEOUT,
+                tcp_keepalive=True,
+                retries={"max_attempts": 3, "mode": "adaptive"},
+            )
+            # Unset keys fall through to the default chain (env, profile, IAM role)
+            _client = boto3.client(
+                "bedrock-runtime",
+                region_name=AWS_REGION,
+                aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID") or None,
+                aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY") or None,
+                config=config,
+            )
+        except Exception as e:
+            logger.warning(f"Bedrock client unavailable: {e}")
+            return None
+    return _client
+
+
+def _cache_params(max_tokens: int) -> dict:
+    return {"max_tokens": max_tokens, "temperature": 0.3, "top_p": 0.9}
+
+
+def generate_bedrock_summary(content: str, max_tokens: int = 500, use_cache: bool = True) -> dict:
+    return llm_cache.get_or_generate(
+        "bedrock",
+        BEDROCK_MODEL_ID,
+        content,
+        _cache_params(max_tokens),
+        lambda: _invoke_bedrock(content, max_tokens),
+        use_cache=use_cache,
+    )
+
+
+async def generate_bedrock_summary_async(content: str, max_tokens: int = 500, use_cache: bool = True) -> dict:
+    loop = asyncio.get_running_loop()
+    return await llm_cache.aget_or_generate(
+        "bedrock",
+        BEDROCK_MODEL_ID,
+        content,
+        _cache_params(max_tokens),
+        lambda: loop.run_in_executor(_async_executor, _invoke_bedrock, content, max_tokens),
+        use_cache=use_cache,
+    )
+
+
+def stream_bedrock_summary(content: str, max_tokens: int = 500, use_cache: bool = True):
+    """Yield summary text as Bedrock produces it; returns the result metadata."""
+    return llm_cache.stream_through(
+        "bedrock",
+        BEDROCK_MODEL_ID,
+        content,
+        _cache_params(max_tokens),
+        lambda: _stream_bedrock(content, max_tokens),
+        use_cache=use_cache,
+    )
+
+
+def _stream_bedrock(content: str, max_tokens: int):
+    client = get_bedrock_client()
+
+    if not client:
+        logger.info("Bedrock unavailable, using fallback summary")
+        fallback = _fallback_summary(content)
+        yield fallback["text"]
+        return {"tokens_used": 0, "provider": "fallback"}
+
+    tokens_used = 0
+    input_tokens = None
+    started = False
     try:
-        import boto3
-        client = boto3.client(
-            "bedrock-runtime",
-            region_name=AWS_REGION,
-            aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID", ""),
-            aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY", ""),
+        response = client.invoke_model_with_response_stream(
+            modelId=BEDROCK_MODEL_ID,
+            body=_request_body(content, max_tokens),
+            contentType="application/json",
+            accept="application/json",
         )
-        return client
+        for event in response["body"]:
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+            message = json.loads(chunk["bytes"])
+            if message.get("type") == "message_start":
+                input_tokens = message.get("message", {}).get("usage", {}).get("input_tokens")
+            elif message.get("type") == "content_block_delta":
+                text = message.get("delta", {}).get("text", "")
+                if text:
+                    started = True
+                    yield text
+            elif message.get("type") == "message_delta":
+                tokens_used = message.get("usage", {}).get("output_tokens", tokens_used)
     except Exception as e:
-        logger.warning(f"Bedrock client unavailable: {e}")
-        return None
+        logger.error(f"Bedrock stream failed: {e}")
+        if started:
+            # Part of the answer is already on the wire; end it as a failure
+            return {"tokens_used": tokens_used, "provider": "fallback", "error": str(e)}
+        yield _fallback_summary(content)["text"]
+        return {"tokens_used": 0, "provider": "fallback"}
+
+    logger.info(f"Bedrock summary streamed, tokens={tokens_used}")
+    return {
+        "tokens_used": tokens_used,
+        "input_tokens": input_tokens,
+        "output_tokens": tokens_used,
+        "provider": "bedrock",
+    }
 
 
-def generate_bedrock_summary(content: str, max_tokens: int = 500) -> dict:
+def _request_body(content: str, max_tokens: int) -> str:
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"You are a data analytics expert. Analyze and summarize the following:\n\n{content}",
+            }
+        ],
+        "temperature": 0.3,
+        "top_p": 0.9,
+    })
+
+
+def _invoke_bedrock(content: str, max_tokens: int) -> dict:
     client = get_bedrock_client()
 
     if not client:
@@ -31,32 +169,26 @@ def generate_bedrock_summary(content: str, max_tokens: int = 500) -> dict:
         return _fallback_summary(content)
 
     try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": max_tokens,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"You are a data analytics expert. Analyze and summarize the following:\n\n{content}",
-                }
-            ],
-            "temperature": 0.3,
-            "top_p": 0.9,
-        })
-
         response = client.invoke_model(
             modelId=BEDROCK_MODEL_ID,
-            body=body,
+            body=_request_body(content, max_tokens),
             contentType="application/json",
             accept="application/json",
         )
 
         response_body = json.loads(response["body"].read())
         text = response_body["content"][0]["text"]
-        tokens_used = response_body.get("usage", {}).get("output_tokens", 0)
+        usage = response_body.get("usage", {})
+        tokens_used = usage.get("output_tokens", 0)
 
         logger.info(f"Bedrock summary generated, tokens={tokens_used}")
-        return {"text": text, "tokens_used": tokens_used, "provider": "bedrock"}
+        return {
+            "text": text,
+            "tokens_used": tokens_used,
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "provider": "bedrock",
+        }
 
     except Exception as e:
         logger.error(f"Bedrock invocation failed: {e}")
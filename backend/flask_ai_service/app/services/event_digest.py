@@ -0,0 +1,255 @@
+import os
+import re
+import math
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .token_budget import estimate_tokens
+
+DIGEST_TOKEN_BUDGET = int(os.environ.get("DIGEST_TOKEN_BUDGET", "800"))
+TOP_K = 5
+MAX_FIELDS = 12
+MAX_CATEGORY_LENGTH = 64
+TARGET_BUCKETS = 24
+SAMPLE_COUNT = 3
+SAMPLE_PAYLOAD_CHARS = 160
+
+BUCKET_SIZES = [
+    (60, "1m"), (300, "5m"), (900, "15m"), (3600, "1h"),
+    (6 * 3600, "6h"), (86400, "1d"), (7 * 86400, "1w"),
+]
+
+
+# Timestamps outside years 1970-9999 cannot be formatted and are treated as bad
+MAX_EPOCH_SECONDS = 253402300799.0
+# Numeric timestamps above this are taken to be epoch milliseconds
+EPOCH_MS_THRESHOLD = 1e11
+# A "Z" or UTC offset after the time part; numpy would drop or misread it
+_TZ_SUFFIX = re.compile(r"[T ]\d.*(?:Z|[+-]\d{2}:?\d{2})$")
+
+
+def _epoch_seconds(timestamps: list) -> np.ndarray:
+    """Seconds since the epoch for ISO strings or numeric epoch seconds or
+    milliseconds; missing or unparseable timestamps are NaN."""
+    return _in_range(_parse_timestamps(timestamps))
+
+
+def _parse_timestamps(timestamps: list) -> np.ndarray:
+    # Fast path for naive ISO strings, which numpy parses in C. Numbers
+    # (read as milliseconds) and zoned strings take the slow path
+    if all(v is None or (isinstance(v, str) and not _TZ_SUFFIX.search(v)) for v in timestamps):
+        try:
+            parsed = np.array(timestamps, dtype="datetime64[ms]")
+            # NaT (from None) casts to a huge negative integer, not NaN
+            seconds = parsed.astype(np.int64) / 1000.0
+            seconds[np.isnat(parsed)] = np.nan
+            return seconds
+        except (TypeError, ValueError):
+            pass
+
+    seconds = np.full(len(timestamps), np.nan)
+    for i, value in enumerate(timestamps):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            seconds[i] = value / 1000.0 if abs(value) > EPOCH_MS_THRESHOLD else value
+            continue
+        if not isinstance(value, str):
+            continue
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        seconds[i] = dt.timestamp()
+    return seconds
+
+
+def _in_range(seconds: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        seconds[~((seconds >= 0) & (seconds <= MAX_EPOCH_SECONDS))] = np.nan
+    return seconds
+
+
+def _bucket_size(span: float):
+    for size, label in BUCKET_SIZES:
+        if span / size <= TARGET_BUCKETS:
+            return size, label
+    # Past a week, whole days sized so the bucket count stays at the target
+    days = math.ceil(span / TARGET_BUCKETS / 86400)
+    return days * 86400, f"{days}d"
+
+
+def change_points(series: np.ndarray, max_points: int = 3, min_size: int = 2, threshold: float = 3.0) -> list:
+    """Indices where the mean level of ``series`` shifts, by binary
+    segmentation. Each split is the one maximising the two-sample t-like
+    statistic, computed for every candidate at once from cumulative sums."""
+    found = []
+
+    def split(lo: int, hi: int):
+        if len(found) >= max_points or hi - lo < 2 * min_size:
+            return
+        segment = series[lo:hi]
+        n = len(segment)
+        csum = np.cumsum(segment)
+        csq = np.cumsum(segment * segment)
+        k = np.arange(min_size, n - min_size + 1)
+        left = csum[k - 1] / k
+        right = (csum[-1] - csum[k - 1]) / (n - k)
+        # Pooled within-segment spread, so the shift itself does not inflate it
+        within = (csq[k - 1] - k * left ** 2) + (csq[-1] - csq[k - 1] - (n - k) * right ** 2)
+        spread = np.sqrt(np.maximum(within, 0.0) / max(n - 2, 1))
+        spread = np.maximum(spread, 1e-9 + 0.05 * np.abs(segment).mean())
+        stat = np.abs(left - right) / (spread * np.sqrt(1.0 / k + 1.0 / (n - k)))
+        best = int(np.argmax(stat))
+        if stat[best] < threshold:
+            return
+        at = lo + int(k[best])
+        found.append(at)
+        split(lo, at)
+        split(at, hi)
+
+    split(0, len(series))
+    return sorted(found[:max_points])
+
+
+def _format_number(value: float) -> str:
+    if abs(value) >= 1000 or value == int(value):
+        return f"{value:,.0f}"
+    return f"{value:.3g}"
+
+
+def _iso(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def build_digest(events: list, token_budget: int = DIGEST_TOKEN_BUDGET) -> str:
+    """Compact statistical digest of an event list for an LLM prompt.
+
+    Everything is computed over all events: type counts, a time histogram
+    with detected level shifts, numeric payload percentiles and the most
+    common categorical payload values. Sections are added in priority order;
+    a line that would exceed ``token_budget`` (estimated) is skipped, as is
+    a section whose heading does not fit, so one long line does not crowd
+    out the sections after it.
+    """
+    total = len(events)
+    types = []
+    timestamps = []
+    numeric: dict = {}
+    categorical: dict = {}
+
+    # The only per-event Python pass: split payloads into columns
+    for event in events:
+        if not isinstance(event, dict):
+            types.append("unknown")
+            timestamps.append(None)
+            continue
+        types.append(str(event.get("event_type", "unknown")))
+        timestamps.append(event.get("timestamp"))
+        payload = event.get("payload")
+        if not isinstance(payload, dict):
+            continue
+        for field, value in payload.items():
+            if isinstance(value, bool):
+                categorical.setdefault(field, []).append(str(value).lower())
+            elif isinstance(value, (int, float)):
+                numeric.setdefault(field, []).append(value)
+            elif isinstance(value, str) and len(value) <= MAX_CATEGORY_LENGTH:
+                categorical.setdefault(field, []).append(value)
+
+    sections = [[f"Total events: {total}"]]
+
+    type_names, type_counts = np.unique(np.array(types, dtype=object), return_counts=True)
+    order = np.argsort(-type_counts)
+    sections[0].append(
+        "Event types: " + ", ".join(
+            f"{type_names[i]}={type_counts[i]} ({type_counts[i] / total:.0%})" for i in order[:MAX_FIELDS]
+        )
+        + (f", +{len(order) - MAX_FIELDS} more types" if len(order) > MAX_FIELDS else "")
+    )
+
+    seconds = _epoch_seconds(timestamps)
+    seconds = seconds[np.isfinite(seconds)]
+    if len(seconds):
+        start, end = float(seconds.min()), float(seconds.max())
+        lines = [f"Time range: {_iso(start)} to {_iso(end)}"]
+        if end > start:
+            size, label = _bucket_size(end - start)
+            first = math.floor(start / size) * size
+            counts = np.bincount(((seconds - first) // size).astype(np.int64))
+            lines.append(f"Events per {label} bucket: {' '.join(str(c) for c in counts)}")
+            # Leave out edge buckets the data only partly covers, which would
+            # otherwise look like drops in volume
+            lo = 1 if (first + size - start) / size < 0.5 else 0
+            hi = len(counts) - 1 if (end - (first + (len(counts) - 1) * size)) / size < 0.5 else len(counts)
+            full = counts[lo:hi]
+            for offset in change_points(full.astype(np.float64)):
+                index = lo + offset
+                before = full[:offset].mean()
+                after = full[offset:].mean()
+                lines.append(
+                    f"Level shift at {_iso(first + index * size)}: "
+                    f"{before:.1f} -> {after:.1f} events per {label}"
+                )
+        sections.append(lines)
+
+    if numeric:
+        lines = ["Numeric payload fields (p50 / p90 / p99, min-max):"]
+        fields = sorted(numeric, key=lambda f: -len(numeric[f]))[:MAX_FIELDS]
+        for field in fields:
+            values = np.asarray(numeric[field], dtype=np.float64)
+            # NaN and Infinity are valid JSON to Python but carry no level
+            values = values[np.isfinite(values)]
+            if not len(values):
+                continue
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            lines.append(
+                f"  {field} (n={len(values)}): {_format_number(p50)} / {_format_number(p90)} / "
+                f"{_format_number(p99)}, {_format_number(values.min())}-{_format_number(values.max())}"
+            )
+        sections.append(lines)
+
+    if categorical:
+        lines = [f"Top payload values (top {TOP_K}):"]
+        fields = sorted(categorical, key=lambda f: -len(categorical[f]))[:MAX_FIELDS]
+        for field in fields:
+            counts = Counter(categorical[field])
+            top = ", ".join(f"{value}={count}" for value, count in counts.most_common(TOP_K))
+            more = f" (+{len(counts) - TOP_K} distinct)" if len(counts) > TOP_K else ""
+            lines.append(f"  {field}: {top}{more}")
+        sections.append(lines)
+
+    if total:
+        picks = sorted({0, total // 2, total - 1})[:SAMPLE_COUNT]
+        lines = ["Sample events:"]
+        for i in picks:
+            event = events[i] if isinstance(events[i], dict) else {}
+            lines.append(
+                f"  - Type: {event.get('event_type', 'N/A')}, "
+                f"Timestamp: {event.get('timestamp', 'N/A')}, "
+                f"Payload: {str(event.get('payload', {}))[:SAMPLE_PAYLOAD_CHARS]}"
+            )
+        sections.append(lines)
+
+    output = []
+    used = 0
+    truncated = False
+    for lines in sections:
+        kept = 0
+        for line in lines:
+            cost = estimate_tokens(line) + 1
+            if used + cost > token_budget:
+                truncated = True
+                if not kept:
+                    break
+                continue
+            output.append(line)
+            used += cost
+            kept += 1
+        if kept:
+            output.append("")
+    if truncated:
+        output.append("(digest truncated to fit the token budget)")
+    return "\n".join(output).rstrip()
@@ -0,0 +1,279 @@
+import os
+import json
+import asyncio
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generator, Optional
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_REDIS_URL = os.environ.get("LLM_CACHE_REDIS_URL", os.environ.get("REDIS_URL", ""))
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", "")
+LLM_CACHE_PREFIX = "datapulse:llm-cache:"
+
+
+def _cacheable(result) -> bool:
+    # Fallback text is produced locally when a provider is down; caching it
+    # would keep serving the placeholder after the provider recovers
+    return isinstance(result, dict) and result.get("provider") not in (None, "fallback")
+
+
+class LLMCache:
+    """Content-addressed cache of provider responses.
+
+    Keys hash the provider, model, full prompt and generation parameters, so
+    any change to the prompt or settings is a different entry. Entries live
+    in an in-process LRU with a TTL and, when configured, in a shared Redis
+    tier or an on-disk tier that survives restarts.
+    """
+
+    def __init__(
+        self,
+        ttl: int = LLM_CACHE_TTL,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        redis_url: str = LLM_CACHE_REDIS_URL,
+        cache_dir: str = LLM_CACHE_DIR,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis_url = redis_url
+        self.cache_dir = cache_dir
+        self._redis = None
+        self._redis_failed = False
+        self._local: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "evictions": 0,
+            "tokens_saved": 0,
+        }
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, params: dict) -> str:
+        material = json.dumps(
+            {"provider": provider, "model": model, "prompt": prompt, "params": params},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get_or_generate(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        params: dict,
+        generate: Callable[[], dict],
+        use_cache: bool = True,
+        cacheable: Callable[[dict], bool] = _cacheable,
+    ) -> dict:
+        """Return a cached response for this exact request, or call
+        ``generate`` and cache what it returns if ``cacheable`` accepts it.
+        Hits are marked ``cached``."""
+        if not use_cache or self.ttl <= 0:
+            self._count("bypassed")
+            return generate()
+
+        key = self.make_key(provider, model, prompt, params)
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        value = generate()
+        self._store(key, value, cacheable)
+        return value
+
+    async def aget_or_generate(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        params: dict,
+        agenerate: Callable[[], Awaitable[dict]],
+        use_cache: bool = True,
+        cacheable: Callable[[dict], bool] = _cacheable,
+    ) -> dict:
+        """Async ``get_or_generate``: awaits ``agenerate`` on a miss and keeps
+        Redis/disk I/O off the event loop."""
+        if not use_cache or self.ttl <= 0:
+            self._count("bypassed")
+            return await agenerate()
+
+        key = self.make_key(provider, model, prompt, params)
+        value = await asyncio.to_thread(self._lookup, key)
+        if value is not None:
+            return value
+
+        value = await agenerate()
+        await asyncio.to_thread(self._store, key, value, cacheable)
+        return value
+
+    def stream_through(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        params: dict,
+        stream: Callable[[], Generator],
+        use_cache: bool = True,
+    ) -> Generator[str, None, dict]:
+        """Streaming ``get_or_generate``. Yields text chunks from ``stream``
+        (whose return value is the result metadata) and caches the assembled
+        response once it completes; a hit is replayed as a single chunk.
+        Returns the metadata dict."""
+        if not use_cache or self.ttl <= 0:
+            self._count("bypassed")
+            return (yield from stream())
+
+        key = self.make_key(provider, model, prompt, params)
+        value = self._lookup(key)
+        if value is not None:
+            yield value["text"]
+            return {k: v for k, v in value.items() if k != "text"}
+
+        chunks = []
+        generator = stream()
+        try:
+            while True:
+                chunk = next(generator)
+                chunks.append(chunk)
+                yield chunk
+        except StopIteration as stop:
+            meta = stop.value or {}
+        self._store(key, {**meta, "text": "".join(chunks)})
+        return meta
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._local)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        hits = lookups - stats["misses"]
+        return {
+            **stats,
+            "entries": entries,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "redis_enabled": bool(self.redis_url) and not self._redis_failed,
+            "disk_enabled": bool(self.cache_dir),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        value = self._get_local(key)
+        if value is not None:
+            return self._hit("local_hits", value)
+
+        value = self._get_shared(key)
+        if value is not None:
+            self._set_local(key, value)
+            return self._hit("shared_hits", value)
+
+        self._count("misses")
+        return None
+
+    def _store(self, key: str, value, cacheable: Callable[[dict], bool] = _cacheable):
+        if cacheable(value):
+            self._set_local(key, value)
+            self._set_shared(key, value)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _hit(self, tier: str, value: dict) -> dict:
+        with self._lock:
+            self._stats[tier] += 1
+            self._stats["tokens_saved"] += value.get("tokens_used", 0) or 0
+        return {**value, "cached": True}
+
+    def _get_local(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: dict):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _get_redis_client(self):
+        if self._redis is not None or self._redis_failed or not self.redis_url:
+            return self._redis
+        try:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5)
+        except Exception as e:
+            logger.warning(f"LLM cache Redis tier unavailable: {e}")
+            self._redis_failed = True
+        return self._redis
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _get_shared(self, key: str) -> Optional[dict]:
+        client = self._get_redis_client()
+        if client is not None:
+            try:
+                raw = client.get(LLM_CACHE_PREFIX + key)
+                return json.loads(raw) if raw else None
+            except Exception as e:
+                logger.warning(f"LLM cache Redis read failed: {e}")
+                return None
+
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), encoding="utf-8") as f:
+                    entry = json.load(f)
+                if entry["expires_at"] < time.time():
+                    os.remove(self._disk_path(key))
+                    return None
+                return entry["value"]
+            except FileNotFoundError:
+                return None
+            except Exception as e:
+                logger.warning(f"LLM cache disk read failed: {e}")
+        return None
+
+    def _set_shared(self, key: str, value: dict):
+        client = self._get_redis_client()
+        if client is not None:
+            try:
+                client.set(LLM_CACHE_PREFIX + key, json.dumps(value, default=str), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"LLM cache Redis write failed: {e}")
+            return
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"expires_at": time.time() + self.ttl, "value": value}, f, default=str)
+                os.replace(tmp, path)
+            except Exception as e:
+                logger.warning(f"LLM cache disk write failed: {e}")
+
+
+llm_cache = LLMCache()
@@ -1,14 +1,332 @@
+import os
+import json
+import asyncio
 import logging
-from .bedrock_service import generate_bedrock_summary
-from .openai_service import generate_openai_insights
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .async_runtime import on_provider_loop
+from .bedrock_service import (
+    generate_bedrock_summary,
+    generate_bedrock_summary_async,
+    stream_bedrock_summary,
+    _fallback_summary,
+)
+from .openai_service import (
+    generate_openai_insights,
+    generate_openai_insights_async,
+    stream_openai_insights,
+    _fallback_insights,
+)
+from .event_digest import build_digest
+from .nl_query import (
+    SCHEMA_CONTEXT,
+    execute_query,
+    extract_json,
+    match_template,
+    normalize_question,
+    schema_hash,
+    translation_cache,
+    validate_query,
+)
+from .provider_guard import PROVIDER_MAX_CONCURRENCY, ProviderGuard, RateLimiter
+from .token_budget import CHUNK_TOKENS, estimate_cost, estimate_tokens, fits, split_into_chunks
 
 logger = logging.getLogger("datapulse-flask-ai")
 
+LLM_STRATEGY = os.environ.get("LLM_STRATEGY", "single")
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY_MS", "2500")) / 1000
+MAP_REDUCE_WORKERS = int(os.environ.get("MAP_REDUCE_WORKERS", "4"))
+MAP_SUMMARY_TOKENS = 300
+# Map calls fan out past the provider's concurrency limit on their own, so
+# they wait this long for a slot instead of being refused
+MAP_REDUCE_WAIT = float(os.environ.get("MAP_REDUCE_WAIT", "30"))
 
-def analyze_data(events: list, analysis_type: str = "trend", provider: str = "bedrock") -> dict:
-    if not events:
-        return {"analysis": "No events provided for analysis.", "type": analysis_type}
+PROVIDERS = {
+    "bedrock": (generate_bedrock_summary, _fallback_summary),
+    "openai": (generate_openai_insights, _fallback_insights),
+}
+STREAMERS = {
+    "bedrock": stream_bedrock_summary,
+    "openai": stream_openai_insights,
+}
+ASYNC_GENERATORS = {
+    "bedrock": generate_bedrock_summary_async,
+    "openai": generate_openai_insights_async,
+}
+provider_guards = {name: ProviderGuard(name) for name in PROVIDERS}
+# Only paced (background) callers draw from these; interactive calls are
+# bounded by the guards alone
+rate_limiters = {name: RateLimiter() for name in PROVIDERS}
+_executor = ThreadPoolExecutor(
+    max_workers=PROVIDER_MAX_CONCURRENCY * len(PROVIDERS),
+    thread_name_prefix="llm-provider",
+)
+# Separate pool: map tasks call complete(), which may itself use _executor
+_map_executor = ThreadPoolExecutor(max_workers=MAP_REDUCE_WORKERS, thread_name_prefix="llm-map")
+
+
+def complete(
+    prompt: str,
+    max_tokens: int,
+    provider: str = "bedrock",
+    strategy: str = LLM_STRATEGY,
+    use_cache: bool = True,
+    wait: float = 0,
+) -> dict:
+    """``_complete`` plus token accounting: ``input_tokens`` and
+    ``output_tokens`` (provider-reported where available, otherwise
+    estimated) and ``cost_usd``. Cache hits and fallbacks cost nothing."""
+    result = _complete(prompt, max_tokens, provider, strategy, use_cache, wait)
+    return with_usage(result, estimate_tokens(prompt))
+
+
+async def complete_async(
+    prompt: str,
+    max_tokens: int,
+    provider: str = "bedrock",
+    strategy: str = LLM_STRATEGY,
+    use_cache: bool = True,
+) -> dict:
+    """``complete`` for async views. The provider call is awaited on the
+    shared provider loop under the same guard, so an in-flight OpenAI call
+    holds no thread and Bedrock calls share a bounded pool. Hedged calls
+    keep the threaded implementation."""
+    if strategy == "hedged":
+        return await asyncio.to_thread(complete, prompt, max_tokens, provider, strategy, use_cache)
+    if provider not in ASYNC_GENERATORS:
+        provider = "bedrock"
+
+    guard = provider_guards[provider]
+    if not guard.try_acquire():
+        logger.warning(f"Provider {provider} unavailable (circuit open or at capacity)")
+        result = PROVIDERS[provider][1](prompt)
+    else:
+        ok = False
+        try:
+            result = await on_provider_loop(
+                ASYNC_GENERATORS[provider](prompt, max_tokens=max_tokens, use_cache=use_cache)
+            )
+            ok = _is_answer(result, provider)
+        finally:
+            guard.release(ok)
+    return with_usage(result, estimate_tokens(prompt))
+
+
+def with_usage(result: dict, input_tokens: int) -> dict:
+    """Add usage fields to a provider result. Counts the provider reported
+    win; ``input_tokens`` (the prompt estimate) and an estimate from the
+    text only fill in for missing ones. ``tokens_used`` is not used here:
+    for OpenAI it is the prompt and completion total."""
+    billed = result.get("provider") in PROVIDERS and not result.get("cached")
+    if result.get("input_tokens") is not None:
+        input_tokens = result["input_tokens"]
+    output_tokens = result.get("output_tokens")
+    if output_tokens is None:
+        output_tokens = estimate_tokens(result.get("text", ""))
+    return {
+        **result,
+        "input_tokens": input_tokens if billed else 0,
+        "output_tokens": output_tokens if billed else 0,
+        "cost_usd": estimate_cost(result["provider"], input_tokens, output_tokens) if billed else 0.0,
+    }
+
+
+def summarize_content(
+    content: str,
+    max_tokens: int,
+    provider: str = "bedrock",
+    strategy: str = LLM_STRATEGY,
+    use_cache: bool = True,
+    chunk_tokens: int = CHUNK_TOKENS,
+) -> dict:
+    """Summarize ``content`` of any size. Content that does not fit one
+    prompt is split into chunks summarized in parallel (map), and those
+    summaries are combined (reduce), recursively if they are still too big.
+    Usage fields are totals over every call made. If any part gets no real
+    answer the reduce step is skipped and a ``degraded`` fallback returned,
+    since placeholder text would otherwise be summarized as content."""
+    if fits(provider, estimate_tokens(content), max_tokens):
+        return {**complete(content, max_tokens, provider, strategy, use_cache), "chunks": 1}
+
+    chunks = split_into_chunks(content, max(500, chunk_tokens - MAP_SUMMARY_TOKENS))
+    total = len(chunks)
+    map_prompts = [
+        f"Summarize part {i} of {total} of a larger document. Keep every key figure, "
+        f"name and date, since the parts will be combined later:\n\n{chunk}"
+        for i, chunk in enumerate(chunks, start=1)
+    ]
+    partials = list(_map_executor.map(
+        lambda p: complete(p, MAP_SUMMARY_TOKENS, provider, strategy, use_cache, wait=MAP_REDUCE_WAIT),
+        map_prompts,
+    ))
+    failed = sum(1 for r in partials if r.get("provider") not in PROVIDERS)
+    if failed:
+        logger.warning(f"Map-reduce summary degraded: {failed} of {total} parts got no answer")
+        fallback = PROVIDERS.get(provider, PROVIDERS["bedrock"])[1](content)
+        return {
+            **fallback,
+            "input_tokens": sum(r["input_tokens"] for r in partials),
+            "output_tokens": sum(r["output_tokens"] for r in partials),
+            "cost_usd": round(sum(r["cost_usd"] for r in partials), 6),
+            "chunks": total,
+            "failed_chunks": failed,
+            "degraded": True,
+        }
+
+    combined = "\n\n".join(f"Part {i}: {r['text']}" for i, r in enumerate(partials, start=1))
+    reduce_prompt = (
+        f"The following are summaries of the {total} consecutive parts of one document. "
+        f"Combine them into a single coherent summary:\n\n{combined}"
+    )
+    final = summarize_content(reduce_prompt, max_tokens, provider, strategy, use_cache, chunk_tokens)
+
+    calls = partials + [final]
+    return {
+        **final,
+        "input_tokens": sum(r["input_tokens"] for r in calls),
+        "output_tokens": sum(r["output_tokens"] for r in calls),
+        "cost_usd": round(sum(r["cost_usd"] for r in calls), 6),
+        "chunks": total,
+    }
+
+
+def _complete(
+    prompt: str,
+    max_tokens: int,
+    provider: str = "bedrock",
+    strategy: str = LLM_STRATEGY,
+    use_cache: bool = True,
+    wait: float = 0,
+) -> dict:
+    """Run a prompt against the LLM providers.
+
+    ``single`` calls only ``provider``. ``hedged`` starts ``provider`` and,
+    if it has not produced a real answer within the hedge delay, starts the
+    other provider as well; the first real answer wins and the loser is
+    abandoned. Either way each provider's concurrency limit and circuit
+    breaker apply, and a refused or failed call yields the fallback text.
+
+    With ``wait`` > 0 the call is paced instead of refused: every provider
+    call, hedged ones included, first takes a token from that provider's
+    rate limiter and then waits for a guard slot, each for up to ``wait``
+    seconds.
+    """
+    if provider not in PROVIDERS:
+        provider = "bedrock"
+    if strategy == "hedged":
+        order = [provider] + [name for name in PROVIDERS if name != provider]
+        return _run_hedged(order, prompt, max_tokens, use_cache, wait)
+
+    if not _acquire(provider, wait):
+        logger.warning(f"Provider {provider} unavailable (circuit open or at capacity)")
+        return PROVIDERS[provider][1](prompt)
+    return _call_provider(provider, prompt, max_tokens, use_cache)
+
+
+def stream_complete(prompt: str, max_tokens: int, provider: str = "bedrock", use_cache: bool = True):
+    """Streaming ``complete`` for a single provider: yields text chunks and
+    returns the result metadata. The guard slot is held until the stream
+    ends or the client goes away."""
+    if provider not in STREAMERS:
+        provider = "bedrock"
+    guard = provider_guards[provider]
+    if not guard.try_acquire():
+        logger.warning(f"Provider {provider} unavailable (circuit open or at capacity)")
+        fallback = PROVIDERS[provider][1](prompt)
+        yield fallback["text"]
+        return {k: v for k, v in fallback.items() if k != "text"}
+
+    ok = False
+    try:
+        meta = yield from STREAMERS[provider](prompt, max_tokens=max_tokens, use_cache=use_cache)
+        ok = _is_answer(meta, provider)
+        return meta
+    finally:
+        guard.release(ok)
+
+
+def _acquire(provider: str, wait: float = 0) -> bool:
+    if wait <= 0:
+        return provider_guards[provider].try_acquire()
+    if not rate_limiters[provider].acquire(timeout=wait):
+        logger.warning(f"Timed out waiting for {provider} rate limit")
+        return False
+    return provider_guards[provider].try_acquire(timeout=wait)
+
+
+def provider_stats() -> dict:
+    return {name: guard.stats() for name, guard in provider_guards.items()}
+
+
+def _is_answer(result, provider: str) -> bool:
+    return isinstance(result, dict) and result.get("provider") == provider
 
+
+def _call_provider(provider: str, prompt: str, max_tokens: int, use_cache: bool) -> dict:
+    """Call a provider whose guard slot is already held, and release it with
+    the outcome: provider modules return fallback text instead of raising."""
+    generate = PROVIDERS[provider][0]
+    guard = provider_guards[provider]
+    ok = False
+    try:
+        result = generate(prompt, max_tokens=max_tokens, use_cache=use_cache)
+        ok = _is_answer(result, provider)
+        return result
+    finally:
+        guard.release(ok)
+
+
+def _run_hedged(order: list, prompt: str, max_tokens: int, use_cache: bool, acquire_wait: float = 0) -> dict:
+    pending = {}
+    fallback = None
+
+    def collect(timeout):
+        nonlocal fallback
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Provider {name} failed: {e}")
+                continue
+            if _is_answer(result, name):
+                return result
+            fallback = fallback or result
+        return None
+
+    for index, name in enumerate(order):
+        if not _acquire(name, acquire_wait):
+            continue
+        pending[_executor.submit(_call_provider, name, prompt, max_tokens, use_cache)] = name
+        last = index == len(order) - 1
+        # Give the running providers the hedge delay before adding another
+        while pending:
+            result = collect(None if last else LLM_HEDGE_DELAY)
+            if result:
+                _abandon(pending)
+                return result
+            if not last:
+                break
+
+    while pending:
+        result = collect(None)
+        if result:
+            _abandon(pending)
+            return result
+    return fallback or PROVIDERS[order[0]][1](prompt)
+
+
+def _abandon(pending: dict):
+    # Queued calls are cancelled outright; calls already in flight finish on
+    # their worker thread, release their guard slot and are discarded
+    for future, name in pending.items():
+        if future.cancel():
+            provider_guards[name].release(None)
+        else:
+            logger.info(f"Hedged call to {name} lost the race")
+
+
+def analysis_prompt(events: list, analysis_type: str = "trend") -> str:
     event_summary = _prepare_event_summary(events)
 
     prompts = {
@@ -30,71 +348,138 @@ def analyze_data(events: list, analysis_type: str = "trend", provider: str = "be
         ),
     }
 
-    prompt = prompts.get(analysis_type, prompts["summary"])
+    return prompts.get(analysis_type, prompts["summary"])
 
-    if provider == "openai":
-        result = generate_openai_insights(prompt, max_tokens=600)
-    else:
-        result = generate_bedrock_summary(prompt, max_tokens=600)
 
+def analyze_data(
+    events: list,
+    analysis_type: str = "trend",
+    provider: str = "bedrock",
+    use_cache: bool = True,
+    strategy: str = LLM_STRATEGY,
+    wait: float = 0,
+) -> dict:
+    if not events:
+        return {"analysis": "No events provided for analysis.", "type": analysis_type}
+
+    prompt = analysis_prompt(events, analysis_type)
+
+    result = complete(prompt, 600, provider=provider, strategy=strategy, use_cache=use_cache, wait=wait)
+    return _analysis_result(result, events, analysis_type, provider)
+
+
+async def analyze_data_async(
+    events: list,
+    analysis_type: str = "trend",
+    provider: str = "bedrock",
+    use_cache: bool = True,
+    strategy: str = LLM_STRATEGY,
+) -> dict:
+    if not events:
+        return {"analysis": "No events provided for analysis.", "type": analysis_type}
+
+    prompt = analysis_prompt(events, analysis_type)
+
+    result = await complete_async(prompt, 600, provider=provider, strategy=strategy, use_cache=use_cache)
+    return _analysis_result(result, events, analysis_type, provider)
+
+
+def _analysis_result(result: dict, events: list, analysis_type: str, provider: str) -> dict:
     return {
         "analysis": result["text"],
         "type": analysis_type,
         "events_analyzed": len(events),
         "provider": result.get("provider", provider),
         "tokens_used": result.get("tokens_used", 0),
+        "input_tokens": result["input_tokens"],
+        "output_tokens": result["output_tokens"],
+        "cost_usd": result["cost_usd"],
+        "cached": result.get("cached", False),
     }
 
 
 def generate_natural_language_query(
-    question: str, schema_context: str = "", provider: str = "bedrock"
+    question: str,
+    schema_context: str = "",
+    provider: str = "bedrock",
+    use_cache: bool = True,
+    strategy: str = LLM_STRATEGY,
+    execute: bool = False,
 ) -> dict:
+    """Translate a question into an Elasticsearch body for the events index.
+
+    Common questions are answered from the template library without an LLM
+    call. Otherwise the LLM's answer is parsed and validated against the
+    mapping, and valid translations are cached by normalized question and
+    schema. With ``execute`` a valid query is also run and its results
+    returned.
+    """
+    template = None if schema_context else match_template(question)
+    if template:
+        result = {
+            "generated_query": json.dumps(template["query"], indent=2),
+            **template,
+            "valid": True,
+            "validation_errors": [],
+            "source": "template",
+            "provider": "template",
+            "tokens_used": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cost_usd": 0.0,
+            "cached": False,
+        }
+    else:
+        schema = schema_context or SCHEMA_CONTEXT
+        result = translation_cache.get_or_generate(
+            "nl-query",
+            schema_hash(schema),
+            normalize_question(question),
+            {},
+            lambda: _translate_question(question, schema, provider, strategy, use_cache),
+            use_cache=use_cache,
+            cacheable=lambda r: r["valid"] and r["provider"] in PROVIDERS,
+        )
+        if result.get("cached"):
+            result = {**result, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+    result = {"question": question, **result}
+    if execute and result["valid"]:
+        result["results"] = execute_query(result["query"])
+    return result
+
+
+def _translate_question(question: str, schema: str, provider: str, strategy: str, use_cache: bool) -> dict:
     prompt = (
-        f"Convert the following natural language question into an Elasticsearch query.\n\n"
+        f"Convert the following natural language question into an Elasticsearch query "
+        f"against the analytics events index.\n\n"
         f"Question: {question}\n\n"
+        f"Available fields and schema:\n{schema}\n\n"
+        "Return the query body as JSON in a ```json code block, using only the fields above "
+        "and no scripts. Then give a one-sentence explanation of what the query does."
     )
-    if schema_context:
-        prompt += f"Available fields and schema:\n{schema_context}\n\n"
 
-    prompt += (
-        "Return a valid Elasticsearch JSON query body. "
-        "Also provide a brief explanation of what the query does."
-    )
-
-    if provider == "openai":
-        result = generate_openai_insights(prompt, max_tokens=400)
-    else:
-        result = generate_bedrock_summary(prompt, max_tokens=400)
+    result = complete(prompt, 400, provider=provider, strategy=strategy, use_cache=use_cache)
+    query, explanation = extract_json(result["text"])
+    errors = validate_query(query) if query is not None else ["No JSON query found in the response"]
+    if errors:
+        logger.warning(f"Generated query rejected: {'; '.join(errors)}")
 
     return {
-        "question": question,
         "generated_query": result["text"],
+        "query": query if not errors else None,
+        "explanation": explanation,
+        "valid": not errors,
+        "validation_errors": errors,
+        "source": "llm",
         "provider": result.get("provider", provider),
         "tokens_used": result.get("tokens_used", 0),
+        "input_tokens": result["input_tokens"],
+        "output_tokens": result["output_tokens"],
+        "cost_usd": result["cost_usd"],
+        "cached": result.get("cached", False),
     }
 
 
 def _prepare_event_summary(events: list) -> str:
-    if len(events) > 100:
-        events = events[:100]
-
-    event_types = {}
-    for event in events:
-        etype = event.get("event_type", "unknown")
-        event_types[etype] = event_types.get(etype, 0) + 1
-
-    lines = [
-        f"Total events: {len(events)}",
-        f"Event types distribution: {event_types}",
-        "",
-        "Sample events:",
-    ]
-
-    for event in events[:10]:
-        lines.append(
-            f"  - Type: {event.get('event_type', 'N/A')}, "
-            f"Timestamp: {event.get('timestamp', 'N/A')}, "
-            f"Payload: {str(event.get('payload', {}))[:200]}"
-        )
-
-    return "\n".join(lines)
+    return build_digest(events)
@@ -0,0 +1,284 @@
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+from .llm_cache import LLMCache
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+NL_QUERY_CACHE_TTL = int(os.environ.get("NL_QUERY_CACHE_TTL", "86400"))
+SEARCH_SERVICE_URL = os.environ.get("SEARCH_SERVICE_URL", "http://fastapi-ingestion:8001")
+SEARCH_TIMEOUT = float(os.environ.get("NL_QUERY_SEARCH_TIMEOUT", "10"))
+MAX_RESULT_SIZE = 200
+# Deepest hit a translated query may page to (from + size)
+MAX_RESULT_WINDOW = 1000
+
+# Mirrors the events index template in the ingestion service; string leaves
+# under payload/metadata are mapped dynamically
+EVENT_FIELDS = {
+    "event_id": "keyword",
+    "event_type": "keyword",
+    "source_id": "keyword",
+    "timestamp": "date",
+    "search_text": "text",
+}
+DYNAMIC_PREFIXES = ("payload.", "metadata.")
+ALLOWED_KEYS = {"query", "size", "from", "sort", "aggs", "aggregations", "_source", "track_total_hits"}
+# Leaf queries whose object keys are field names
+FIELD_KEYED_QUERIES = {"term", "terms", "match", "match_phrase", "match_phrase_prefix", "range", "prefix", "wildcard", "fuzzy", "regexp"}
+FIELD_PARAMS = {"boost", "_name"}
+# Query types a translation may use, mirrored by the search service's DSL
+# endpoint; wrapper, percolate, script_score and the like are refused
+LEAF_QUERIES = {
+    "match_all", "match_none", "term", "terms", "match", "match_phrase", "match_phrase_prefix",
+    "multi_match", "range", "prefix", "wildcard", "fuzzy", "exists", "ids", "simple_query_string",
+}
+COMPOUND_QUERIES = {
+    "bool": ("must", "filter", "should", "must_not"),
+    "constant_score": ("filter",),
+    "dis_max": ("queries",),
+    "boosting": ("positive", "negative"),
+}
+
+SCHEMA_CONTEXT = "\n".join(
+    [f"- {name} ({kind})" for name, kind in EVENT_FIELDS.items()]
+    + ["- payload.<name>, metadata.<name> (keyword for strings, numeric otherwise)"]
+)
+
+# Translations are reused across users and providers: the key is the
+# normalized question plus the schema it was translated against
+translation_cache = LLMCache(ttl=NL_QUERY_CACHE_TTL)
+
+
+def normalize_question(question: str) -> str:
+    # Case is kept: event types and source ids are case-sensitive keywords
+    question = re.sub(r"\s+", " ", question.strip())
+    return question.strip(" ?.!\"'")
+
+
+def schema_hash(schema_context: str) -> str:
+    return hashlib.sha256(schema_context.encode("utf-8")).hexdigest()[:16]
+
+
+def extract_json(text: str) -> Tuple[Optional[dict], str]:
+    """Pull the query body out of an LLM answer: a fenced ```json block if
+    there is one, otherwise the first complete JSON object. Returns the body
+    (None if nothing parses) and the remaining text as the explanation."""
+    fenced = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
+    if fenced:
+        try:
+            body = json.loads(fenced.group(1))
+            return body, (text[:fenced.start()] + text[fenced.end():]).strip()
+        except ValueError:
+            pass
+
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", text):
+        try:
+            body, end = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(body, dict):
+            return body, (text[:match.start()] + text[end:]).strip()
+    return None, text.strip()
+
+
+def _known_field(field: str) -> bool:
+    if field in EVENT_FIELDS:
+        return True
+    return any(field.startswith(p) and len(field) > len(p) for p in DYNAMIC_PREFIXES)
+
+
+def _collect_fields(node, fields: set, errors: list):
+    if isinstance(node, list):
+        for item in node:
+            _collect_fields(item, fields, errors)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key.startswith("script"):
+            errors.append("Scripts are not allowed")
+        elif key == "wrapper":
+            errors.append("Wrapper queries are not allowed")
+            continue
+        elif key in FIELD_KEYED_QUERIES and isinstance(value, dict) and "field" not in value:
+            # With a "field" param this is an aggregation, handled below
+            fields.update(k for k in value if k not in FIELD_PARAMS)
+        elif key == "field" and isinstance(value, str):
+            fields.add(value)
+        elif key == "fields" and isinstance(value, list):
+            fields.update(f.split("^")[0] for f in value if isinstance(f, str))
+        elif key == "exists" and isinstance(value, dict) and "field" in value:
+            fields.add(value["field"])
+            continue
+        _collect_fields(value, fields, errors)
+
+
+def _check_query(node, errors: list):
+    if not isinstance(node, dict) or len(node) != 1:
+        errors.append("Each query must be an object with a single query type")
+        return
+    kind, spec = next(iter(node.items()))
+    if kind in LEAF_QUERIES:
+        return
+    if kind not in COMPOUND_QUERIES or not isinstance(spec, dict):
+        errors.append(f"Query type not allowed: {kind}")
+        return
+    for clause in COMPOUND_QUERIES[kind]:
+        value = spec.get(clause)
+        for child in value if isinstance(value, list) else ([] if value is None else [value]):
+            _check_query(child, errors)
+
+
+def validate_query(body) -> list:
+    """Check a search body against the events mapping: read-only top-level
+    keys, allowlisted query types, no scripts or wrapper queries, a bounded
+    result window, and only fields the index actually has. Returns the list
+    of problems, empty when the body is usable."""
+    if not isinstance(body, dict):
+        return ["Query body must be a JSON object"]
+
+    errors = []
+    unknown = set(body) - ALLOWED_KEYS
+    if unknown:
+        errors.append(f"Unsupported keys: {', '.join(sorted(unknown))}")
+    size = body.get("size", 10)
+    if isinstance(size, bool) or not isinstance(size, int) or not 0 <= size <= MAX_RESULT_SIZE:
+        errors.append(f"size must be an integer between 0 and {MAX_RESULT_SIZE}")
+        size = 0
+    offset = body.get("from", 0)
+    if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+        errors.append("from must be a non-negative integer")
+    elif offset + size > MAX_RESULT_WINDOW:
+        errors.append(f"from + size must not exceed {MAX_RESULT_WINDOW}")
+    if "query" in body:
+        _check_query(body["query"], errors)
+
+    fields = set()
+    _collect_fields(body, fields, errors)
+    for sort in body.get("sort", []) if isinstance(body.get("sort"), list) else [body.get("sort")]:
+        if isinstance(sort, str):
+            fields.add(sort)
+        elif isinstance(sort, dict):
+            fields.update(sort)
+    fields.discard("_score")
+
+    bad = sorted(f for f in fields if not _known_field(f))
+    if bad:
+        errors.append(f"Unknown fields: {', '.join(bad)}")
+    return sorted(set(errors), key=errors.index)
+
+
+# --- Template library: common questions answered without an LLM ----------
+
+_UNITS = {"minute": "m", "hour": "h", "day": "d", "week": "w", "month": "M"}
+_TIME_RANGE = re.compile(
+    r"\b(?:in |during |over |for |from )?(?:the )?(?:(?:last|past) (?P<n>\d+ )?(?P<unit>minute|hour|day|week|month)s?|(?P<day>today|yesterday))\b",
+    re.IGNORECASE,
+)
+
+
+def _time_range(question: str) -> Tuple[Optional[dict], str]:
+    """The timestamp filter for a relative time phrase, and the question
+    with that phrase removed."""
+    match = _TIME_RANGE.search(question)
+    if not match:
+        return None, question
+    day = (match.group("day") or "").lower()
+    if day == "today":
+        bounds = {"gte": "now/d"}
+    elif day == "yesterday":
+        bounds = {"gte": "now-1d/d", "lt": "now/d"}
+    else:
+        n = int(match.group("n") or 1)
+        bounds = {"gte": f"now-{n}{_UNITS[match.group('unit').lower()]}"}
+    rest = re.sub(r"\s+", " ", question[:match.start()] + question[match.end():]).strip()
+    return {"range": {"timestamp": bounds}}, rest
+
+
+def _query(filters: list) -> dict:
+    return {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+
+def _type_filter(event_type: Optional[str]) -> list:
+    if not event_type or event_type.lower() in ("all", "total", "the"):
+        return []
+    return [{"term": {"event_type": event_type}}]
+
+
+def _count(m, filters):
+    filters = filters + _type_filter(m.group("type"))
+    return {"query": _query(filters), "size": 0, "track_total_hits": True}, "Counts matching events"
+
+
+def _latest(m, filters):
+    filters = filters + _type_filter(m.group("type"))
+    size = min(int(m.groupdict().get("n") or 20), MAX_RESULT_SIZE)
+    body = {"query": _query(filters), "sort": [{"timestamp": {"order": "desc"}}], "size": size}
+    return body, f"Returns the {size} most recent matching events"
+
+
+def _by_field(field):
+    def build(m, filters):
+        aggs = {f"by_{field}": {"terms": {"field": field, "size": 50}}}
+        return {"query": _query(filters), "size": 0, "aggs": aggs}, f"Counts events per {field}"
+    return build
+
+
+def _histogram(m, filters):
+    interval = m.group("interval").lower()
+    filters = filters + _type_filter(m.group("type"))
+    aggs = {"over_time": {"date_histogram": {"field": "timestamp", "calendar_interval": interval}}}
+    return {"query": _query(filters), "size": 0, "aggs": aggs}, f"Counts events per {interval}"
+
+
+def _from_source(m, filters):
+    filters = filters + [{"term": {"source_id": m.group("source")}}]
+    body = {"query": _query(filters), "sort": [{"timestamp": {"order": "desc"}}], "size": 50}
+    return body, f"Lists recent events from source {m.group('source')}"
+
+
+# Matched case-insensitively against the normalized question with any time
+# phrase removed; captured values keep the case the user typed
+TEMPLATES = [(re.compile(pattern, re.IGNORECASE), build) for pattern, build in [
+    (r"^(?:how many|count(?: of)?|number of) (?:(?P<type>[\w-]+) )?events(?: are there| were there| happened)?$", _count),
+    (r"^(?:count |number of )?events (?:by|per) (?:event )?type$|^(?:event )?type breakdown$", _by_field("event_type")),
+    (r"^(?:count |number of )?events (?:by|per) source(?: id)?$|^top sources$", _by_field("source_id")),
+    (r"^(?:count |number of )?(?:(?P<type>[\w-]+) )?events (?:per|by|each) (?P<interval>minute|hour|day|week|month)$", _histogram),
+    (r"^(?:show|list|get|find)(?: me)?(?: all)?(?: the)? events from source (?P<source>[\w.:-]+)$", _from_source),
+    (r"^(?:show|list|get)(?: me)?(?: the)? (?:latest|last|most recent|recent|newest) (?:(?P<n>\d+) )?(?:(?P<type>[\w-]+) )?events$", _latest),
+    (r"^(?:show|list|get|find)(?: me)?(?: all)?(?: the)? (?:(?P<type>[\w-]+) )?events$", _latest),
+]]
+
+
+def match_template(question: str) -> Optional[dict]:
+    """Answer a common question from the template library, or None."""
+    filters, rest = _time_range(normalize_question(question))
+    filters = [filters] if filters else []
+    for pattern, build in TEMPLATES:
+        match = pattern.match(rest)
+        if match:
+            body, explanation = build(match, filters)
+            return {"query": body, "explanation": explanation}
+    return None
+
+
+def execute_query(body: dict) -> dict:
+    """Run a validated body through the search service's DSL endpoint."""
+    try:
+        import requests
+        response = requests.post(
+            f"{SEARCH_SERVICE_URL}/api/v1/search/dsl",
+            json={"body": body},
+            timeout=SEARCH_TIMEOUT,
+        )
+        if response.status_code >= 400:
+            return {"results": [], "total": 0, "error": f"Search service returned {response.status_code}"}
+        return response.json()
+    except Exception as e:
+        logger.error(f"NL query execution failed: {e}")
+        return {"results": [], "total": 0, "error": str(e)}
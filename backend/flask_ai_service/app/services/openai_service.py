@@ -1,50 +1,234 @@
 import os
+import inspect
 import logging
+import threading
+
+from .llm_cache import llm_cache
 
 logger = logging.getLogger("datapulse-flask-ai")
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+OPENAI_MODEL = "gpt-4"
+INSIGHTS_SYSTEM_PROMPT = "You are a senior data analyst. Provide clear, actionable insights from analytics data."
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def _http_options() -> dict:
+    import httpx
+
+    return {
+        "timeout": httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=30,
+        ),
+    }
 
 
 def get_openai_client():
+    """Process-wide OpenAI client sharing one pooled keep-alive HTTP client."""
+    global _client
     if not OPENAI_API_KEY:
         logger.warning("OpenAI API key not configured")
         return None
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        try:
+            import httpx
+            from openai import OpenAI
+
+            options = _http_options()
+            _client = OpenAI(
+                api_key=OPENAI_API_KEY,
+                timeout=options["timeout"],
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.Client(**options),
+            )
+        except Exception as e:
+            logger.warning(f"OpenAI client unavailable: {e}")
+            return None
+    return _client
+
+
+def get_async_openai_client():
+    """Process-wide AsyncOpenAI client. Its httpx pool is bound to the loop
+    that first uses it, so it is only awaited on the provider loop."""
+    global _async_client
+    if not OPENAI_API_KEY:
+        logger.warning("OpenAI API key not configured")
+        return None
+    if _async_client is not None:
+        return _async_client
+    with _client_lock:
+        if _async_client is not None:
+            return _async_client
+        try:
+            import httpx
+            from openai import AsyncOpenAI
+
+            options = _http_options()
+            _async_client = AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                timeout=options["timeout"],
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.AsyncClient(**options),
+            )
+        except Exception as e:
+            logger.warning(f"Async OpenAI client unavailable: {e}")
+            return None
+    return _async_client
+
+
+def _cache_params(max_tokens: int) -> dict:
+    return {"system": INSIGHTS_SYSTEM_PROMPT, "max_tokens": max_tokens, "temperature": 0.3}
+
+
+def _insights_request(content: str, max_tokens: int) -> dict:
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": INSIGHTS_SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+        ],
+        "max_tokens": max_tokens,
+        "temperature": 0.3,
+    }
+
+
+def _insights_result(response) -> dict:
+    text = response.choices[0].message.content
+    usage = response.usage
+    logger.info(f"OpenAI insights generated, tokens={usage.total_tokens}")
+    return {
+        "text": text,
+        "tokens_used": usage.total_tokens,
+        "input_tokens": usage.prompt_tokens,
+        "output_tokens": usage.completion_tokens,
+        "provider": "openai",
+    }
+
+
+def generate_openai_insights(content: str, max_tokens: int = 500, use_cache: bool = True) -> dict:
+    return llm_cache.get_or_generate(
+        "openai",
+        OPENAI_MODEL,
+        content,
+        _cache_params(max_tokens),
+        lambda: _invoke_openai(content, max_tokens),
+        use_cache=use_cache,
+    )
+
+
+async def generate_openai_insights_async(content: str, max_tokens: int = 500, use_cache: bool = True) -> dict:
+    """``generate_openai_insights`` for the provider loop: the request is
+    awaited on the shared async client instead of holding a thread."""
+    return await llm_cache.aget_or_generate(
+        "openai",
+        OPENAI_MODEL,
+        content,
+        _cache_params(max_tokens),
+        lambda: _invoke_openai_async(content, max_tokens),
+        use_cache=use_cache,
+    )
+
+
+def stream_openai_insights(content: str, max_tokens: int = 500, use_cache: bool = True):
+    """Yield insight text as OpenAI produces it; returns the result metadata."""
+    return llm_cache.stream_through(
+        "openai",
+        OPENAI_MODEL,
+        content,
+        _cache_params(max_tokens),
+        lambda: _stream_openai(content, max_tokens),
+        use_cache=use_cache,
+    )
+
+
+def _stream_usage_options(client) -> dict:
+    # stream_options only exists in newer SDK releases; older ones reject
+    # the argument, and their streams are counted delta by delta instead
+    params = inspect.signature(client.chat.completions.create).parameters
+    return {"stream_options": {"include_usage": True}} if "stream_options" in params else {}
+
+
+def _stream_openai(content: str, max_tokens: int):
+    client = get_openai_client()
+
+    if not client:
+        yield _fallback_insights(content)["text"]
+        return {"tokens_used": 0, "provider": "fallback"}
+
+    chunks = 0
+    usage = None
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        return client
+        stream = client.chat.completions.create(
+            **_insights_request(content, max_tokens),
+            stream=True,
+            **_stream_usage_options(client),
+        )
+        for event in stream:
+            # The usage block arrives on a final event with no choices
+            usage = getattr(event, "usage", None) or usage
+            if not event.choices:
+                continue
+            text = event.choices[0].delta.content
+            if text:
+                chunks += 1
+                yield text
     except Exception as e:
-        logger.warning(f"OpenAI client unavailable: {e}")
-        return None
+        logger.error(f"OpenAI stream failed: {e}")
+        if chunks:
+            return {"tokens_used": chunks, "provider": "fallback", "error": str(e)}
+        yield _fallback_insights(content)["text"]
+        return {"tokens_used": 0, "provider": "fallback"}
+
+    if usage is None:
+        # No usage block from the server; count each delta as one token
+        logger.info(f"OpenAI insights streamed, tokens={chunks}")
+        return {"tokens_used": chunks, "output_tokens": chunks, "provider": "openai"}
+    logger.info(f"OpenAI insights streamed, tokens={usage.total_tokens}")
+    return {
+        "tokens_used": usage.total_tokens,
+        "input_tokens": usage.prompt_tokens,
+        "output_tokens": usage.completion_tokens,
+        "provider": "openai",
+    }
 
 
-def generate_openai_insights(content: str, max_tokens: int = 500) -> dict:
+def _invoke_openai(content: str, max_tokens: int) -> dict:
     client = get_openai_client()
 
     if not client:
         return _fallback_insights(content)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a senior data analyst. Provide clear, actionable insights from analytics data.",
-                },
-                {"role": "user", "content": content},
-            ],
-            max_tokens=max_tokens,
-            temperature=0.3,
-        )
+        response = client.chat.completions.create(**_insights_request(content, max_tokens))
+        return _insights_result(response)
+    except Exception as e:
+        logger.error(f"OpenAI call failed: {e}")
+        return _fallback_insights(content)
 
-        text = response.choices[0].message.content
-        tokens_used = response.usage.total_tokens
 
-        logger.info(f"OpenAI insights generated, tokens={tokens_used}")
-        return {"text": text, "tokens_used": tokens_used, "provider": "openai"}
+async def _invoke_openai_async(content: str, max_tokens: int) -> dict:
+    client = get_async_openai_client()
 
+    if not client:
+        return _fallback_insights(content)
+
+    try:
+        response = await client.chat.completions.create(**_insights_request(content, max_tokens))
+        return _insights_result(response)
     except Exception as e:
         logger.error(f"OpenAI call failed: {e}")
         return _fallback_insights(content)
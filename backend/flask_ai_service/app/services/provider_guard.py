@@ -0,0 +1,146 @@
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+PROVIDER_MAX_CONCURRENCY = int(os.environ.get("PROVIDER_MAX_CONCURRENCY", "16"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))
+PROVIDER_RATE_LIMIT = float(os.environ.get("PROVIDER_RATE_LIMIT", "5"))
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and rejects
+    calls for ``reset_timeout`` seconds, then lets a single trial call
+    through (half-open). The trial's outcome closes or re-opens it."""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_skipped(self):
+        # The call never ran; free the half-open trial for someone else
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class ProviderGuard:
+    """Concurrency limit plus circuit breaker for one LLM provider. Calls
+    beyond the limit or against an open circuit are refused immediately
+    rather than queued, so a slow provider cannot tie up every worker."""
+
+    def __init__(self, name: str, max_concurrency: int = PROVIDER_MAX_CONCURRENCY, breaker: CircuitBreaker = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.in_flight = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    def try_acquire(self, timeout: float = 0) -> bool:
+        """Take a slot, refusing at once unless ``timeout`` allows waiting
+        for one. An open circuit is always refused."""
+        acquired = self._slots.acquire(timeout=timeout) if timeout > 0 else self._slots.acquire(blocking=False)
+        if not acquired:
+            self._reject()
+            return False
+        if not self.breaker.allow():
+            self._slots.release()
+            self._reject()
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self, ok: Optional[bool]):
+        """Free the slot and report the outcome; ``None`` means the call was
+        cancelled before it ran and says nothing about the provider."""
+        if ok is None:
+            self.breaker.record_skipped()
+        elif ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "rejected": self.rejected,
+        }
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` calls per second with bursts of up to
+    ``burst``. Unlike ``ProviderGuard`` it makes callers wait, which suits
+    background batch work that should be paced rather than refused."""
+
+    def __init__(self, rate: float = PROVIDER_RATE_LIMIT, burst: int = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = None) -> bool:
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_for = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
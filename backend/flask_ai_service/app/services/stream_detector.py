@@ -0,0 +1,279 @@
+import os
+import math
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+STREAM_Z_THRESHOLD = float(os.environ.get("STREAM_Z_THRESHOLD", "4.0"))
+STREAM_MIN_SAMPLES = int(os.environ.get("STREAM_MIN_SAMPLES", "30"))
+STREAM_EWMA_ALPHA = float(os.environ.get("STREAM_EWMA_ALPHA", "0.05"))
+STREAM_QUANTILE = float(os.environ.get("STREAM_QUANTILE", "0.99"))
+STREAM_MAX_SERIES = int(os.environ.get("STREAM_MAX_SERIES", "10000"))
+STREAM_RATE_BUCKET_SECONDS = int(os.environ.get("STREAM_RATE_BUCKET_SECONDS", "60"))
+STREAM_ALERT_COOLDOWN = float(os.environ.get("STREAM_ALERT_COOLDOWN", "300"))
+
+COUNT_FIELD = "_count"
+# Empty buckets replayed after a quiet spell, so a gap lowers the rate baseline
+# without an unbounded catch-up loop
+MAX_EMPTY_BUCKETS = 10
+
+
+class Welford:
+    """Running mean and variance over every observation."""
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class Ewma:
+    """Exponentially weighted mean and variance, which follow gradual drift."""
+
+    __slots__ = ("alpha", "mean", "var", "initialized")
+
+    def __init__(self, alpha: float = STREAM_EWMA_ALPHA):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.var = 0.0
+        self.initialized = False
+
+    def update(self, x: float):
+        if not self.initialized:
+            self.mean = x
+            self.initialized = True
+            return
+        delta = x - self.mean
+        increment = self.alpha * delta
+        self.mean += increment
+        self.var = (1 - self.alpha) * (self.var + delta * increment)
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.var)
+
+
+class P2Quantile:
+    """Streaming quantile estimate with five markers (the P-squared
+    algorithm of Jain and Chlamtac), using constant memory."""
+
+    __slots__ = ("p", "q", "n", "np", "dn")
+
+    def __init__(self, p: float = STREAM_QUANTILE):
+        self.p = p
+        self.q: list = []
+        self.n = [0, 1, 2, 3, 4]
+        self.np = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def update(self, x: float):
+        q = self.q
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self.n
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = candidate
+                n[i] += d
+
+    @property
+    def value(self) -> Optional[float]:
+        if not self.q:
+            return None
+        if len(self.q) < 5:
+            return self.q[min(len(self.q) - 1, int(self.p * len(self.q)))]
+        return self.q[2]
+
+
+class SeriesStats:
+    __slots__ = ("welford", "ewma", "quantile", "last_alert")
+
+    def __init__(self, alpha: float, quantile: float):
+        self.welford = Welford()
+        self.ewma = Ewma(alpha)
+        self.quantile = P2Quantile(quantile)
+        self.last_alert = 0.0
+
+    def update(self, x: float):
+        self.welford.update(x)
+        self.ewma.update(x)
+        self.quantile.update(x)
+
+
+class StreamDetector:
+    """Online anomaly detection over the event stream.
+
+    Every numeric top-level ``payload`` field of each event type is a series,
+    and so is the number of events of each type per ``rate_bucket_seconds``.
+    A value is anomalous when it sits more than ``threshold`` EWMA standard
+    deviations from the EWMA mean; it is scored before being folded in, so a
+    spike cannot hide itself. Series state is a fixed handful of floats, and
+    only the ``max_series`` most recently seen series are kept.
+    """
+
+    def __init__(
+        self,
+        threshold: float = STREAM_Z_THRESHOLD,
+        min_samples: int = STREAM_MIN_SAMPLES,
+        alpha: float = STREAM_EWMA_ALPHA,
+        quantile: float = STREAM_QUANTILE,
+        max_series: int = STREAM_MAX_SERIES,
+        rate_bucket_seconds: int = STREAM_RATE_BUCKET_SECONDS,
+        cooldown: float = STREAM_ALERT_COOLDOWN,
+    ):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.quantile = quantile
+        self.max_series = max_series
+        self.rate_bucket_seconds = rate_bucket_seconds
+        self.cooldown = cooldown
+        self._series: OrderedDict = OrderedDict()
+        self._rates: OrderedDict = OrderedDict()
+        self.observed = 0
+        self.alerts = 0
+
+    def __len__(self):
+        return len(self._series)
+
+    def process_event(self, event: dict, now: Optional[float] = None) -> list:
+        """Fold one event into its series and return any anomaly alerts."""
+        now = time.time() if now is None else now
+        event_type = event.get("event_type") or "unknown"
+        alerts = []
+
+        payload = event.get("payload")
+        if isinstance(payload, dict):
+            for field, value in payload.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+                    alert = self.observe(event_type, field, float(value), now, event)
+                    if alert:
+                        alerts.append(alert)
+
+        alerts.extend(self._count_event(event_type, now))
+        return alerts
+
+    def observe(self, event_type: str, field: str, value: float, now: float, event: Optional[dict] = None):
+        self.observed += 1
+        stats = self._get_series((event_type, field))
+        alert = None
+
+        if stats.welford.n >= self.min_samples:
+            stdev = stats.ewma.stdev
+            if stdev > 0:
+                z_score = (value - stats.ewma.mean) / stdev
+                if abs(z_score) > self.threshold and now - stats.last_alert >= self.cooldown:
+                    stats.last_alert = now
+                    self.alerts += 1
+                    alert = self._build_alert(event_type, field, value, z_score, stats, event)
+
+        stats.update(value)
+        return alert
+
+    def _count_event(self, event_type: str, now: float) -> list:
+        if self.rate_bucket_seconds <= 0:
+            return []
+        bucket = int(now // self.rate_bucket_seconds)
+        current = self._rates.get(event_type)
+        if current is None:
+            # Same LRU policy as _series, so new types always get a rate series
+            self._rates[event_type] = [bucket, 1]
+            if len(self._rates) > self.max_series:
+                self._rates.popitem(last=False)
+            return []
+        self._rates.move_to_end(event_type)
+        if current[0] == bucket:
+            current[1] += 1
+            return []
+
+        # The previous bucket is complete; score its count, then any empty ones
+        alerts = []
+        closed = [current[1]] + [0] * min(MAX_EMPTY_BUCKETS, bucket - current[0] - 1)
+        for count in closed:
+            alert = self.observe(event_type, COUNT_FIELD, float(count), now)
+            if alert:
+                alerts.append(alert)
+        current[0], current[1] = bucket, 1
+        return alerts
+
+    def _get_series(self, key: tuple) -> SeriesStats:
+        stats = self._series.get(key)
+        if stats is None:
+            stats = self._series[key] = SeriesStats(self.alpha, self.quantile)
+            if len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        else:
+            self._series.move_to_end(key)
+        return stats
+
+    def _build_alert(self, event_type, field, value, z_score, stats: SeriesStats, event: Optional[dict]) -> dict:
+        metric = "event rate" if field == COUNT_FIELD else field
+        severity = "critical" if abs(z_score) > 2 * self.threshold else "high"
+        return {
+            "alert_name": f"Anomalous {metric} for {event_type}",
+            "severity": severity,
+            "source": "stream-detector",
+            "event_type": event_type,
+            "field": field,
+            "value": value,
+            "z_score": round(z_score, 3),
+            "ewma_mean": round(stats.ewma.mean, 3),
+            "ewma_stdev": round(stats.ewma.stdev, 3),
+            "mean": round(stats.welford.mean, 3),
+            "stdev": round(stats.welford.stdev, 3),
+            f"p{round(self.quantile * 100)}": stats.quantile.value,
+            "samples": stats.welford.n,
+            "triggered_by_event": (event or {}).get("event_id"),
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "series": len(self._series),
+            "rate_series": len(self._rates),
+            "observed": self.observed,
+            "alerts": self.alerts,
+        }
@@ -0,0 +1,179 @@
+import os
+import hmac
+import json
+import math
+import time
+import base64
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger("datapulse-flask-ai")
+
+CHARS_PER_TOKEN = 4
+# Context windows and USD prices per 1K input/output tokens of the default models
+CONTEXT_TOKENS = {"bedrock": 100000, "openai": 8192}
+PRICES_PER_1K = {"bedrock": (0.008, 0.024), "openai": (0.03, 0.06)}
+
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "6000"))
+USER_DAILY_TOKEN_QUOTA = int(os.environ.get("USER_DAILY_TOKEN_QUOTA", "500000"))
+QUOTA_REDIS_URL = os.environ.get("QUOTA_REDIS_URL", os.environ.get("REDIS_URL", ""))
+QUOTA_PREFIX = "datapulse:token-quota:"
+# Key the Django API signs its access tokens with (SimpleJWT, HS256)
+JWT_SIGNING_KEY = os.environ.get("JWT_SIGNING_KEY", os.environ.get("DJANGO_SECRET_KEY", ""))
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly four characters per token for English text and JSON; close
+    enough for budgeting without loading a tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def estimate_cost(provider: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = PRICES_PER_1K.get(provider, (0.0, 0.0))
+    return round(input_tokens / 1000 * input_price + output_tokens / 1000 * output_price, 6)
+
+
+def fits(provider: str, prompt_tokens: int, max_tokens: int) -> bool:
+    return prompt_tokens + max_tokens <= min(CHUNK_TOKENS, CONTEXT_TOKENS.get(provider, CHUNK_TOKENS))
+
+
+def split_into_chunks(text: str, chunk_tokens: int = CHUNK_TOKENS) -> list:
+    """Split text into pieces of at most ``chunk_tokens`` (estimated),
+    breaking at paragraph, then line, then word boundaries where possible."""
+    limit = chunk_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return [text]
+
+    chunks = []
+    current = ""
+    for separator in ("\n\n", "\n", " "):
+        if separator in text:
+            break
+    else:
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+    for piece in text.split(separator):
+        if len(piece) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(split_into_chunks(piece, chunk_tokens))
+            continue
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def verified_user_id(token: str, signing_key: str = None) -> Optional[str]:
+    """The ``user_id`` claim of a Django-issued access token, or None when
+    the token is malformed, expired, not an access token or not signed
+    with ``signing_key``."""
+    signing_key = JWT_SIGNING_KEY if signing_key is None else signing_key
+    if not token or not signing_key:
+        return None
+    try:
+        header, payload, signature = token.split(".")
+        if json.loads(_b64decode(header)).get("alg") != "HS256":
+            return None
+        expected = hmac.new(signing_key.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if not isinstance(claims, dict) or claims.get("token_type", "access") != "access":
+        return None
+    if not isinstance(claims.get("exp"), (int, float)) or claims["exp"] < time.time():
+        return None
+    user_id = claims.get("user_id")
+    return str(user_id) if user_id is not None else None
+
+
+class TokenQuota:
+    """Per-user daily token allowance.
+
+    Usage is counted per UTC day, in Redis when configured so every worker
+    shares it, otherwise in process memory. A request is allowed while the
+    user still has ``needed`` tokens left; actual usage is charged after.
+    """
+
+    def __init__(self, daily_limit: int = USER_DAILY_TOKEN_QUOTA, redis_url: str = QUOTA_REDIS_URL):
+        self.daily_limit = daily_limit
+        self.redis_url = redis_url
+        self._redis = None
+        self._redis_failed = False
+        self._usage: dict = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _day() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def used(self, user: str) -> int:
+        key = f"{user}:{self._day()}"
+        client = self._get_redis_client()
+        if client is not None:
+            try:
+                return int(client.get(QUOTA_PREFIX + key) or 0)
+            except Exception as e:
+                logger.warning(f"Token quota Redis read failed: {e}")
+        with self._lock:
+            return self._usage.get(key, 0)
+
+    def remaining(self, user: str) -> int:
+        if self.daily_limit <= 0:
+            return -1
+        return max(0, self.daily_limit - self.used(user))
+
+    def allow(self, user: str, needed: int = 0) -> bool:
+        if self.daily_limit <= 0:
+            return True
+        return self.used(user) + max(needed, 1) <= self.daily_limit
+
+    def consume(self, user: str, tokens: int):
+        if tokens <= 0:
+            return
+        key = f"{user}:{self._day()}"
+        client = self._get_redis_client()
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.incrby(QUOTA_PREFIX + key, tokens)
+                pipe.expire(QUOTA_PREFIX + key, 2 * 86400)
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"Token quota Redis write failed: {e}")
+        with self._lock:
+            today = self._day()
+            # Drop previous days so the map only holds today's users
+            if any(not k.endswith(today) for k in self._usage):
+                self._usage = {k: v for k, v in self._usage.items() if k.endswith(today)}
+            self._usage[key] = self._usage.get(key, 0) + tokens
+
+    def _get_redis_client(self):
+        if self._redis is not None or self._redis_failed or not self.redis_url:
+            return self._redis
+        try:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5)
+        except Exception as e:
+            logger.warning(f"Token quota Redis tier unavailable: {e}")
+            self._redis_failed = True
+        return self._redis
+
+
+token_quota = TokenQuota()
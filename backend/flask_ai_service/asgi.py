@@ -0,0 +1,6 @@
+from asgiref.wsgi import WsgiToAsgi
+
+from app import create_app
+
+# Serve with an ASGI server, e.g. `uvicorn asgi:app --port 5001`
+app = WsgiToAsgi(create_app())
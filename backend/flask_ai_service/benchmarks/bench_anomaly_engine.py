@@ -0,0 +1,57 @@
+"""Time each anomaly method on a 1M-point series.
+
+Run from backend/flask_ai_service:
+
+    python -m benchmarks.bench_anomaly_engine
+
+The "statistics loop" row is the original pure-Python /anomaly-detect
+implementation, for comparison.
+"""
+import statistics
+import time
+
+import numpy as np
+
+from app.services.anomaly_engine import METHODS, detect_anomalies
+
+POINTS = 1_000_000
+PERIOD = 1440
+THRESHOLD = 4.0
+
+
+def make_series(n: int) -> np.ndarray:
+    rng = np.random.default_rng(7)
+    t = np.arange(n)
+    series = 200 + 40 * np.sin(2 * np.pi * t / PERIOD) + rng.normal(0, 5, n)
+    spikes = rng.choice(n, size=50, replace=False)
+    series[spikes] += rng.choice([-1, 1], size=50) * 120
+    return series
+
+
+def statistics_loop(values: list) -> int:
+    mean = statistics.mean(values)
+    stdev = statistics.stdev(values)
+    return sum(1 for v in values if abs(v - mean) / stdev > THRESHOLD)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    series = make_series(POINTS)
+    values = series.tolist()
+    print(f"{'method':<18} {'anomalies':>10} {'ms':>10}")
+
+    count, ms = timed(lambda: statistics_loop(values))
+    print(f"{'statistics loop':<18} {count:>10} {ms:>10.1f}")
+
+    for method in METHODS:
+        result, ms = timed(lambda: detect_anomalies(values, method, THRESHOLD, period=PERIOD))
+        print(f"{method:<18} {result['count']:>10} {ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
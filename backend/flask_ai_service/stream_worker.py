@@ -0,0 +1,94 @@
+"""Streaming anomaly detector.
+
+Consumes ``datapulse-events``, keeps online statistics per event type and
+payload field, and publishes anomalies to ``datapulse-alerts``:
+
+    python stream_worker.py
+"""
+import os
+import json
+import time
+import signal
+import logging
+
+from app.services.stream_detector import StreamDetector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("datapulse-flask-ai")
+
+KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+KAFKA_CONSUMER_GROUP = os.environ.get("STREAM_CONSUMER_GROUP", "datapulse-stream-detector")
+EVENTS_TOPIC = "datapulse-events"
+ALERTS_TOPIC = "datapulse-alerts"
+STATS_INTERVAL = 60
+
+_running = True
+
+
+def _stop(signum, frame):
+    global _running
+    _running = False
+
+
+def _decode(raw: bytes):
+    try:
+        return json.loads(raw.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+def run():
+    from kafka import KafkaConsumer, KafkaProducer
+
+    detector = StreamDetector()
+    backoff = 1
+    while _running:
+        consumer = producer = None
+        try:
+            consumer = KafkaConsumer(
+                EVENTS_TOPIC,
+                bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+                group_id=KAFKA_CONSUMER_GROUP,
+                auto_offset_reset="latest",
+            )
+            producer = KafkaProducer(
+                bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+                value_serializer=lambda v: json.dumps(v, default=str).encode("utf-8"),
+                key_serializer=lambda k: k.encode("utf-8") if k else None,
+            )
+            logger.info("Stream detector connected, listening for events...")
+            backoff = 1
+            last_stats = time.monotonic()
+
+            while _running:
+                batch = consumer.poll(timeout_ms=1000)
+                for records in batch.values():
+                    for record in records:
+                        event = _decode(record.value)
+                        if not isinstance(event, dict):
+                            continue
+                        for alert in detector.process_event(event):
+                            producer.send(ALERTS_TOPIC, key=alert["severity"], value=alert)
+                            logger.warning(f"Anomaly: {alert['alert_name']} (z={alert['z_score']})")
+
+                if time.monotonic() - last_stats >= STATS_INTERVAL:
+                    last_stats = time.monotonic()
+                    logger.info(f"Stream detector stats: {detector.stats()}")
+
+        except Exception as e:
+            logger.error(f"Stream detector error, reconnecting in {backoff}s: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+        finally:
+            if producer:
+                producer.close(timeout=5)
+            if consumer:
+                consumer.close()
+
+    logger.info("Stream detector stopped")
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    run()
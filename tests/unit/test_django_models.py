@@ -94,6 +94,13 @@ class AnalyticsEventModelTest(TestCase):
         events = list(AnalyticsEvent.objects.all())
         self.assertEqual(events[0].event_type, "second")
 
+    def test_events_index_uses_utc_date(self):
+        from datetime import timedelta, timezone as dt_timezone
+        from analytics.services.elasticsearch_service import events_index_for
+        local = datetime(2024, 3, 1, 1, 30, tzinfo=dt_timezone(timedelta(hours=5)))
+        with self.settings(ES_INDEX_GRANULARITY="day"):
+            self.assertEqual(events_index_for(local), "datapulse-events-2024.02.29")
+
 
 class AlertModelTest(TestCase):
     def setUp(self):
@@ -1,4 +1,5 @@
 import pytest
+import json
 from fastapi.testclient import TestClient
 from datetime import datetime
 
@@ -74,3 +75,657 @@ class TestIngestionEndpoints:
         client = get_test_client()
         response = client.get("/api/v1/search/events")
         assert response.status_code == 422
+
+    def test_ingest_event_assigns_event_id(self):
+        client = get_test_client()
+        response = client.post("/api/v1/ingest/event", json={"event_type": "id_test"})
+        assert response.status_code == 200
+        assert response.json()["event_id"]
+
+
+class TestBulkIndexer:
+    def test_batch_sizer_grows_and_backs_off(self):
+        from app.services.bulk_indexer import AdaptiveBatchSizer
+        sizer = AdaptiveBatchSizer(min_size=100, max_size=1000, target_latency_ms=200)
+        assert sizer.record(50) == 150
+        assert sizer.record(50) == 200
+        assert sizer.record(500) == 150
+        assert sizer.record(50, rejected=True) == 100
+
+    def test_flushes_on_interval_and_retries_rejections(self):
+        import asyncio
+        from app.services.bulk_indexer import AdaptiveBatchSizer, BulkIndexer
+
+        calls = []
+
+        def fake_bulk(actions):
+            calls.append(len(actions))
+            # Reject the first document of the first request only
+            if len(calls) == 1:
+                return [(False, 429)] + [(True, 201)] * (len(actions) - 1)
+            return [(True, 201)] * len(actions)
+
+        async def run():
+            indexer = BulkIndexer(
+                flush_interval=0.05,
+                sizer=AdaptiveBatchSizer(min_size=10, max_size=100),
+            )
+            indexer._bulk_sync = fake_bulk
+            await indexer.start()
+            assert indexer.add_many("datapulse-events", [{"event_id": str(i)} for i in range(5)])
+            await asyncio.sleep(1.5)
+            await indexer.stop()
+            return indexer.stats()
+
+        stats = asyncio.run(run())
+        assert calls[0] == 5
+        assert stats["indexed"] == 5
+        assert stats["rejected_429"] == 1
+        assert stats["retried"] == 1
+
+    def test_stop_flushes_documents_in_backoff(self):
+        import asyncio
+        from app.services.bulk_indexer import AdaptiveBatchSizer, BulkIndexer
+
+        calls = []
+
+        def fake_bulk(actions):
+            calls.append(len(actions))
+            if len(calls) == 1:
+                return [(False, 503)] * len(actions)
+            return [(True, 201)] * len(actions)
+
+        async def run():
+            indexer = BulkIndexer(flush_interval=0.05, sizer=AdaptiveBatchSizer(min_size=10, max_size=100))
+            indexer._bulk_sync = fake_bulk
+            await indexer.start()
+            indexer.add_many("datapulse-events", [{"event_id": str(i)} for i in range(3)])
+            await asyncio.sleep(0.2)
+            # The failed documents are now waiting out a 1s backoff
+            assert indexer.stats()["pending_retries"] == 3
+            await indexer.stop()
+            return indexer.stats()
+
+        stats = asyncio.run(run())
+        assert calls == [3, 3]
+        assert stats["indexed"] == 3 and stats["pending_retries"] == 0
+
+
+class TestIndexRouting:
+    def test_write_index_uses_event_time(self):
+        from app.services.index_routing import write_index
+        doc = {"timestamp": "2024-01-15T23:30:00+00:00"}
+        assert write_index("datapulse-events", doc) == "datapulse-events-2024.01.15"
+        assert write_index("other-index", doc) == "other-index"
+
+    def test_indices_for_range(self):
+        from app.services.index_routing import indices_for_range
+        indices = indices_for_range("2024-01-30T12:00:00", "2024-02-01T01:00:00")
+        assert indices == (
+            "datapulse-events-2024.01.30,datapulse-events-2024.01.31,datapulse-events-2024.02.01"
+        )
+        assert indices_for_range(None) == "datapulse-events"
+        assert indices_for_range("2020-01-01T00:00:00", "2024-01-01T00:00:00") == "datapulse-events"
+
+
+class TestSearchCursor:
+    def test_cursor_round_trip(self):
+        from app.services.elasticsearch_client import encode_cursor, decode_cursor
+        token = encode_cursor("pit-abc", ["2024-01-15T10:00:00", "evt-1"], "timestamp", "desc")
+        state = decode_cursor(token)
+        assert state["pit"] == "pit-abc"
+        assert state["after"] == ["2024-01-15T10:00:00", "evt-1"]
+        assert state["sort"] == ["timestamp", "desc"]
+
+    def test_cursor_pages_keep_highlights_and_parameters(self, monkeypatch):
+        from app.services import elasticsearch_client
+
+        bodies = []
+
+        class FakeES:
+            def open_point_in_time(self, **kwargs):
+                return {"id": "pit-1"}
+
+            def search(self, body):
+                bodies.append(body)
+                hits = [
+                    {"_source": {"event_id": f"e{i}"}, "_score": 1.0, "sort": [i], "highlight": {"search_text": ["<em>x</em>"]}}
+                    for i in range(2)
+                ]
+                return {"pit_id": "pit-1", "hits": {"hits": hits, "total": {"value": 10}}}
+
+            def close_point_in_time(self, id):
+                return {}
+
+        monkeypatch.setattr(elasticsearch_client, "get_es_client", lambda: FakeES())
+        first = elasticsearch_client.search_page("datapulse-events", "error", size=2, filters={"event_type": "a"})
+        second = elasticsearch_client.search_page(
+            "datapulse-events", "error", size=2, cursor=first["next_cursor"], filters={"event_type": "a"}
+        )
+        assert all("highlight" in body for body in bodies)
+        assert second["results"][0]["_highlights"] == {"search_text": ["<em>x</em>"]}
+
+        for changed in ({"query": "other"}, {"filters": {"event_type": "b"}}, {"fuzzy": True}):
+            kwargs = {"query": "error", "filters": {"event_type": "a"}, **changed}
+            with pytest.raises(ValueError):
+                elasticsearch_client.search_page("datapulse-events", size=2, cursor=first["next_cursor"], **kwargs)
+        response = get_test_client().get(
+            "/api/v1/search/events", params={"q": "other", "cursor": first["next_cursor"]}
+        )
+        assert response.status_code == 400
+
+    def test_invalid_cursor_rejected(self):
+        client = get_test_client()
+        response = client.get("/api/v1/search/events", params={"q": "error", "cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+    def test_dsl_query_rejects_writes_and_scripts(self):
+        client = get_test_client()
+        unknown = client.post("/api/v1/search/dsl", json={"body": {"query": {"match_all": {}}, "script": {}}})
+        assert unknown.status_code == 400
+        scripted = client.post("/api/v1/search/dsl", json={
+            "body": {"query": {"script_score": {"query": {"match_all": {}}, "script": {"source": "1"}}}},
+        })
+        assert scripted.status_code == 400
+        for size in (None, [5], True, "10", -1):
+            bad_size = client.post("/api/v1/search/dsl", json={"body": {"query": {"match_all": {}}, "size": size}})
+            assert bad_size.status_code == 400
+        for body in (
+            {"query": {"bool": {"must": [{"wrapper": {"query": "eyJtYXRjaF9hbGwiOnt9fQ=="}}]}}},
+            {"query": {"match_all": {}}, "aggs": {"x": {"filter": {"wrapper": {"query": "e30="}}}}},
+            {"query": {"percolate": {"field": "q"}}},
+            {"query": {"match_all": {}}, "from": 10000},
+            {"query": {"match_all": {}}, "from": 900, "size": 200},
+        ):
+            assert client.post("/api/v1/search/dsl", json={"body": body}).status_code == 400
+
+    def test_dsl_query_accepts_allowlisted_compound_queries(self):
+        from app.services.elasticsearch_client import _check_query
+        _check_query({"bool": {
+            "filter": [{"range": {"timestamp": {"gte": "now-1d"}}}],
+            "should": {"dis_max": {"queries": [{"term": {"event_type": "a"}}, {"match": {"search_text": "x"}}]}},
+        }})
+
+
+class TestIndexTemplate:
+    def test_template_copies_strings_into_search_field(self):
+        from app.services.index_template import events_template
+        template = events_template()
+        mappings = template["template"]["mappings"]
+        assert template["index_patterns"] == ["datapulse-events-*"]
+        assert mappings["properties"]["search_text"]["type"] == "text"
+        payload_rule = mappings["dynamic_templates"][0]["payload_strings"]
+        assert payload_rule["mapping"]["copy_to"] == "search_text"
+
+    def test_query_targets_single_field(self):
+        from app.services.elasticsearch_client import _build_query
+        query = _build_query("checkout", filters={"event_type": "purchase"})
+        assert query["bool"]["must"] == [{"match": {"search_text": {"query": "checkout"}}}]
+        assert query["bool"]["filter"] == [{"term": {"event_type": "purchase"}}]
+        fuzzy = _build_query("checkout", fuzzy=True)
+        assert fuzzy["bool"]["must"][0]["match"]["search_text"]["fuzziness"] == "AUTO"
+
+
+class TestQueryCache:
+    def test_ttl_tracks_interval(self):
+        from app.services.query_cache import ttl_for_interval, ttl_for_window
+        assert ttl_for_interval("minute") == 5
+        assert ttl_for_interval("hour") == 300
+        assert ttl_for_interval("day") == 900
+        assert ttl_for_window("minute", end="2020-01-01T00:00:00") == 900
+
+    def test_concurrent_misses_share_one_call(self):
+        import asyncio
+        import time
+        from app.services.query_cache import QueryCache
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"over_time": {"buckets": []}}
+
+        async def run():
+            cache = QueryCache(redis_url="")
+            params = {"field": "event_type", "interval": "day"}
+            results = await asyncio.gather(*[
+                cache.get_or_compute("aggregate", params, ttl=60, compute=compute)
+                for _ in range(5)
+            ])
+            await cache.get_or_compute("aggregate", params, ttl=60, compute=compute)
+            return results, cache.stats()
+
+        results, stats = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(r == {"over_time": {"buckets": []}} for r in results)
+        assert stats["misses"] == 1
+        assert stats["coalesced"] == 4
+        assert stats["local_hits"] == 1
+
+    def test_cancelled_leader_does_not_strand_followers(self):
+        import asyncio
+        import time
+        from app.services.query_cache import QueryCache
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"total": 1}
+
+        async def run():
+            cache = QueryCache(redis_url="")
+            leader = asyncio.create_task(cache.get_or_compute("search", {"q": "x"}, ttl=60, compute=compute))
+            await asyncio.sleep(0.01)
+            follower = asyncio.create_task(cache.get_or_compute("search", {"q": "x"}, ttl=60, compute=compute))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            result = await asyncio.wait_for(follower, timeout=2)
+            return result, leader.cancelled()
+
+        result, leader_cancelled = asyncio.run(run())
+        assert leader_cancelled
+        assert result == {"total": 1}
+        assert len(calls) == 2
+
+
+class TestAggregationBody:
+    def test_window_filters_and_nested_metrics(self):
+        from app.services.elasticsearch_client import build_aggregation_body
+        body = build_aggregation_body(
+            "source_id",
+            interval="hour",
+            start_time="2024-01-15T00:00:00",
+            end_time="2024-01-16T00:00:00",
+            filters={"event_type": "api_call"},
+            mode="nested",
+            metrics=["percentiles:payload.response_ms"],
+        )
+        histogram = body["aggs"]["over_time"]["date_histogram"]
+        assert histogram["extended_bounds"]["min"].startswith("2024-01-15T00:00:00")
+        assert histogram["min_doc_count"] == 0
+        assert "by_field" not in body["aggs"]
+        nested = body["aggs"]["over_time"]["aggs"]["by_field"]
+        assert nested["aggs"] == {
+            "percentiles_payload_response_ms": {"percentiles": {"field": "payload.response_ms"}}
+        }
+        assert {"term": {"event_type": "api_call"}} in body["query"]["bool"]["filter"]
+
+    def test_invalid_metric_rejected(self):
+        client = get_test_client()
+        response = client.get("/api/v1/search/aggregate", params={"metrics": "median:payload.value"})
+        assert response.status_code == 400
+
+
+class TestSuggestionIndex:
+    def test_failed_suggest_lookup_not_cached(self, monkeypatch):
+        from app.routers import search
+
+        answers = iter([None, ["zqx-type"]])
+        monkeypatch.setattr(search, "get_suggestions", lambda index, prefix: next(answers))
+        client = get_test_client()
+        assert client.get("/api/v1/search/suggest", params={"q": "zqx"}).json() == {"suggestions": []}
+        assert client.get("/api/v1/search/suggest", params={"q": "zqx"}).json() == {"suggestions": ["zqx-type"]}
+
+    def test_prefix_suggestions_ranked_by_weight(self):
+        from app.services.suggestion_index import SuggestionIndex
+        index = SuggestionIndex()
+        index.record("page_view", "event_type", weight=10)
+        index.record("payment_failed", "event_type", weight=3)
+        index.record("Payment_Succeeded", "event_type", weight=5)
+        index.record("signup", "event_type")
+        assert index.suggest("pa") == ["page_view", "Payment_Succeeded", "payment_failed"]
+        assert index.suggest("PAY", limit=1) == ["Payment_Succeeded"]
+        assert index.suggest("zzz") == []
+
+    def test_query_terms_need_minimum_count(self):
+        from app.services.suggestion_index import SuggestionIndex
+        index = SuggestionIndex(min_query_count=3)
+        index.record("secret-order-4411", "query")
+        index.record("checkout", "query")
+        index.record("checkout", "query")
+        index.record("cart_add", "event_type")
+        assert index.suggest("secret") == []
+        assert index.suggest("c") == ["cart_add"]
+        index.record("checkout", "query")
+        assert index.suggest("check") == ["checkout"]
+        index.record("secret-order-4411", "source_id")
+        assert index.suggest("secret") == ["secret-order-4411"]
+
+    def test_evicts_lightest_terms(self):
+        from app.services.suggestion_index import SuggestionIndex
+        index = SuggestionIndex(max_terms=10)
+        for i in range(11):
+            index.record(f"term{i:02d}", "query", weight=i)
+        assert len(index) == 9
+        assert index.suggest("term00") == []
+        assert index.suggest("term10") == ["term10"]
+
+
+class TestWebSocketSubscriptions:
+    def test_subscribe_unsubscribe_and_limit(self):
+        from app.routers.websocket_router import manager
+        client = get_test_client()
+        previous_limit = manager.max_subscriptions
+        manager.max_subscriptions = 2
+        try:
+            with client.websocket_connect("/ws/events/orders") as ws:
+                ws.send_text('{"type": "subscribe", "channel": "payments"}')
+                assert ws.receive_json() == {
+                    "type": "subscribed", "channel": "payments", "mode": "batch", "encoding": "json",
+                }
+                ws.send_text('{"type": "subscribe", "channel": "payments"}')
+                assert ws.receive_json()["type"] == "subscribed"
+                ws.send_text('{"type": "subscribe", "channel": "refunds"}')
+                assert ws.receive_json()["type"] == "error"
+                ws.send_text('{"type": "unsubscribe", "channel": "orders"}')
+                assert ws.receive_json() == {"type": "unsubscribed", "channel": "orders"}
+                assert "orders" not in manager.subscriptions
+                assert len(manager.subscriptions["payments"]) == 1
+        finally:
+            manager.max_subscriptions = previous_limit
+        assert "payments" not in manager.subscriptions
+        assert not manager.connection_channels
+
+    def test_stream_options_are_per_channel(self):
+        import asyncio
+        from app.routers.websocket_router import ConnectionManager
+
+        class FakeSocket:
+            def __init__(self):
+                self.sent = []
+
+            async def accept(self):
+                pass
+
+            async def send_text(self, text):
+                self.sent.append(json.loads(text))
+
+        frame = {"type": "new_events", "count": 2, "counts": {"click": 1, "view": 1},
+                 "samples": [{"event_type": "click"}, {"event_type": "view"}]}
+
+        async def run():
+            manager = ConnectionManager()
+            socket = FakeSocket()
+            await manager.connect(socket, "orders")
+            manager.set_stream_options(socket, "orders", "aggregate", ["click"])
+            manager.subscribe(socket, "payments")
+            manager.set_stream_options(socket, "payments", "batch", None)
+            await manager.broadcast(frame, channel="orders")
+            await manager.broadcast(frame, channel="payments")
+            await asyncio.sleep(0.01)
+            manager.disconnect(socket)
+            return socket.sent
+
+        orders, payments = asyncio.run(run())
+        # Subscribing to payments did not reset the orders filter
+        assert orders["counts"] == {"click": 1} and "samples" not in orders
+        assert payments == frame
+
+    def test_msgpack_encoding_negotiated_on_subscribe(self):
+        import msgpack
+        client = get_test_client()
+        with client.websocket_connect("/ws/events/orders") as ws:
+            ws.send_text('{"type": "subscribe", "channel": "orders", "encoding": "msgpack"}')
+            reply = msgpack.unpackb(ws.receive_bytes())
+            assert reply["encoding"] == "msgpack"
+            ws.send_text('{"type": "ping", "timestamp": 1}')
+            assert msgpack.unpackb(ws.receive_bytes()) == {"type": "pong", "timestamp": 1}
+
+    def test_slow_client_keeps_latest_frames(self):
+        import asyncio
+        from app.routers.websocket_router import ClientConnection
+
+        class SlowSocket:
+            def __init__(self):
+                self.sent = []
+                self.release = asyncio.Event()
+
+            async def send_text(self, text):
+                await self.release.wait()
+                self.sent.append(text)
+
+        async def run():
+            socket = SlowSocket()
+            client = ClientConnection(socket, on_error=lambda ws: None, queue_size=3, policy="drop_oldest")
+            for i in range(10):
+                client.enqueue(str(i))
+            socket.release.set()
+            await asyncio.sleep(0.01)
+            client.close()
+            return socket.sent, client.dropped
+
+        sent, dropped = asyncio.run(run())
+        assert sent == ["7", "8", "9"]
+        assert dropped == 7
+
+    def test_backplane_fans_out_across_managers(self):
+        import asyncio
+        from app.routers.websocket_router import ConnectionManager
+        from app.services.ws_backplane import InMemoryBackplane
+
+        class FakeSocket:
+            def __init__(self):
+                self.sent = []
+
+            async def accept(self):
+                pass
+
+            async def send_text(self, text):
+                self.sent.append(text)
+
+        async def run():
+            hub = {}
+            worker_a, worker_b = ConnectionManager(), ConnectionManager()
+            await worker_a.set_backplane(InMemoryBackplane(hub))
+            await worker_b.set_backplane(InMemoryBackplane(hub))
+            socket_a, socket_b = FakeSocket(), FakeSocket()
+            await worker_a.connect(socket_a, "dashboard-1")
+            await worker_b.connect(socket_b, "dashboard-1")
+            await worker_b.connect(FakeSocket(), "alerts")
+            await asyncio.sleep(0.01)
+            assert len(hub["dashboard-1"]) == 2
+            assert len(hub["alerts"]) == 1
+
+            await worker_a.broadcast({"type": "dashboard_update"}, channel="dashboard-1")
+            await asyncio.sleep(0.01)
+            worker_b.disconnect(socket_b)
+            await asyncio.sleep(0.01)
+            return socket_a.sent, socket_b.sent, hub
+
+        sent_a, sent_b, hub = asyncio.run(run())
+        assert sent_a == sent_b == ['{"type": "dashboard_update"}']
+        assert len(hub["dashboard-1"]) == 1
+
+
+class TestLiveEventConflation:
+    def test_events_batched_per_channel(self):
+        import asyncio
+        from app.services.event_conflator import EventConflator
+
+        frames = []
+
+        async def publish(frame, channel):
+            frames.append((channel, frame))
+
+        async def run():
+            conflator = EventConflator(publish, interval_ms=20, max_samples=2)
+            await conflator.start()
+            for i in range(50):
+                conflator.add("default", {"event_type": "click" if i % 5 else "purchase", "i": i})
+            await asyncio.sleep(0.05)
+            await conflator.stop()
+
+        asyncio.run(run())
+        assert len(frames) == 1
+        channel, frame = frames[0]
+        assert channel == "default"
+        assert frame["type"] == "new_events"
+        assert frame["count"] == 50
+        assert frame["counts"] == {"purchase": 10, "click": 40}
+        assert [s["i"] for s in frame["samples"]] == [48, 49]
+
+    def test_shape_frame_filters_and_aggregates(self):
+        from app.services.event_conflator import shape_frame
+        frame = {
+            "type": "new_events",
+            "channel": "default",
+            "count": 3,
+            "counts": {"click": 2, "purchase": 1},
+            "samples": [{"event_type": "click"}, {"event_type": "purchase"}],
+        }
+        filtered = shape_frame(frame, "batch", frozenset({"purchase"}))
+        assert filtered["count"] == 1
+        assert filtered["samples"] == [{"event_type": "purchase"}]
+        aggregated = shape_frame(frame, "aggregate")
+        assert aggregated["counts"] == {"click": 2, "purchase": 1}
+        assert "samples" not in aggregated
+        assert shape_frame(frame, "batch", frozenset({"signup"})) is None
+        assert shape_frame({"type": "alert"}, "aggregate") == {"type": "alert"}
+
+
+class TestEventConsumer:
+    def test_batch_processed_per_partition_then_committed(self):
+        import asyncio
+        import json
+        from collections import namedtuple
+        from kafka.structs import TopicPartition
+        from app.services.kafka_consumer import EventConsumer
+
+        Record = namedtuple("Record", "topic partition offset value")
+        p0 = TopicPartition("datapulse-events", 0)
+        p1 = TopicPartition("datapulse-events", 1)
+
+        class FakeKafka:
+            def __init__(self):
+                self.committed = None
+
+            def poll(self, timeout_ms, max_records):
+                return {
+                    p0: [Record(p0.topic, 0, o, json.dumps({"n": o}).encode()) for o in (3, 4, 5)],
+                    p1: [Record(p1.topic, 1, 9, b"not json"), Record(p1.topic, 1, 10, b'{"n": 10}')],
+                }
+
+            def commit(self, offsets):
+                self.committed = {tp: meta.offset for tp, meta in offsets.items()}
+
+            def assignment(self):
+                return {p0, p1}
+
+            def end_offsets(self, partitions):
+                return {p0: 10, p1: 11}
+
+            def position(self, tp):
+                return 6 if tp == p0 else 11
+
+        handled = []
+
+        async def handler(topic, message):
+            handled.append(message["n"])
+
+        kafka = FakeKafka()
+
+        async def run():
+            consumer = EventConsumer(factory=lambda: kafka, handler=handler)
+            await consumer.start()
+            await asyncio.sleep(0.05)
+            live = consumer.stats()
+            await consumer.stop()
+            return live, consumer.stats()
+
+        live, stats = asyncio.run(run())
+        assert live["total_lag"] == 4
+        assert [n for n in handled if n < 10][:3] == [3, 4, 5]
+        assert kafka.committed == {p0: 6, p1: 11}
+        assert stats["failed"] >= 1
+        assert stats["commits"] >= 1
+        assert stats["running"] is False
+
+    def test_handler_errors_counted_as_failed(self, monkeypatch):
+        import asyncio
+        from collections import namedtuple
+        from app.services import kafka_consumer
+
+        Record = namedtuple("Record", "topic partition offset value")
+
+        async def broken_handler(event_data):
+            raise RuntimeError("push failed")
+
+        monkeypatch.setattr(kafka_consumer, "_handle_event", broken_handler)
+        consumer = kafka_consumer.EventConsumer()
+        records = [Record("datapulse-events", 0, o, b'{"event_type": "click"}') for o in range(3)]
+        asyncio.run(consumer._process_partition(records))
+        assert consumer.stats()["failed"] == 3
+        assert consumer.stats()["messages"] == 0
+
+
+class TestReplayBuffer:
+    def test_last_n_and_last_seconds_within_caps(self):
+        from app.services.replay_buffer import ReplayBuffer
+        buffer = ReplayBuffer(max_events=5, max_age=60, max_channels=2)
+        for i in range(8):
+            buffer.record("orders", {"i": i}, now=1000 + i)
+        assert [e["i"] for e in buffer.recent("orders", now=1008)] == [3, 4, 5, 6, 7]
+        assert [e["i"] for e in buffer.recent("orders", last=2, now=1008)] == [6, 7]
+        assert [e["i"] for e in buffer.recent("orders", seconds=2.5, now=1008)] == [6, 7]
+        assert buffer.recent("orders", now=1100) == []
+
+        buffer.record("a", {}, now=1100)
+        buffer.record("b", {}, now=1100)
+        assert buffer.stats()["channels"] == 2
+        assert buffer.recent("orders", now=1100) == []
+
+    def test_replay_recorded_from_backplane_deliveries(self):
+        import asyncio
+        from app.routers.websocket_router import ConnectionManager
+        from app.services.replay_buffer import ReplayBuffer
+        from app.services.ws_backplane import InMemoryBackplane
+
+        class FakeSocket:
+            async def accept(self):
+                pass
+
+            async def send_text(self, text):
+                pass
+
+        buffer_a, buffer_b = ReplayBuffer(), ReplayBuffer()
+
+        async def run():
+            hub = {}
+            worker_a, worker_b = ConnectionManager(replay=buffer_a), ConnectionManager(replay=buffer_b)
+            await worker_a.set_backplane(InMemoryBackplane(hub))
+            await worker_b.set_backplane(InMemoryBackplane(hub))
+            socket_a, socket_b = FakeSocket(), FakeSocket()
+            await worker_a.connect(socket_a, "orders")
+            await worker_b.connect(socket_b, "orders")
+            await asyncio.sleep(0.01)
+            # Each worker consumes different partitions; both replay both events
+            await worker_a.broadcast({"type": "new_event", "data": {"n": 1}}, channel="orders")
+            await worker_b.broadcast({"type": "new_events", "count": 1, "samples": [{"n": 2}]}, channel="orders")
+            await worker_b.broadcast({"type": "dashboard_update"}, channel="orders")
+            await asyncio.sleep(0.01)
+            worker_a.disconnect(socket_a)
+            worker_b.disconnect(socket_b)
+
+        asyncio.run(run())
+        assert [e["n"] for e in buffer_a.recent("orders")] == [1, 2]
+        assert [e["n"] for e in buffer_b.recent("orders")] == [1, 2]
+
+    def test_replay_sent_after_subscribe(self):
+        from app.services.replay_buffer import replay_buffer
+        replay_buffer.record("replay-test", {"event_type": "click", "n": 1})
+        replay_buffer.record("replay-test", {"event_type": "purchase", "n": 2})
+        replay_buffer.record("replay-test", {"event_type": "click", "n": 3})
+
+        client = get_test_client()
+        with client.websocket_connect("/ws/events/replay-test") as ws:
+            ws.send_text(
+                '{"type": "subscribe", "channel": "replay-test",'
+                ' "event_types": ["click"], "replay": {"last": 2}}'
+            )
+            assert ws.receive_json()["type"] == "subscribed"
+            frame = ws.receive_json()
+            assert frame["type"] == "replay"
+            assert [e["n"] for e in frame["events"]] == [1, 3]
@@ -102,3 +102,752 @@ class TestFlaskAIService:
         data = json.loads(response.data)
         assert "summary" in data
         assert data["dashboard"] == "Sales Dashboard"
+
+
+class TestAnomalyEngine:
+    def test_methods_flag_spike(self):
+        import numpy as np
+        from app.services.anomaly_engine import METHODS, detect_anomalies
+        t = np.arange(2000)
+        series = 100 + 10 * np.sin(2 * np.pi * t / 50) + np.random.default_rng(3).normal(0, 1, 2000)
+        series[1500] += 60
+        for method in METHODS:
+            result = detect_anomalies(series.tolist(), method, threshold=5.0, window=100, period=50)
+            assert 1500 in result["indices"], method
+
+    def test_non_numeric_values_keep_original_indices(self):
+        from app.services.anomaly_engine import detect_anomalies
+        result = detect_anomalies([10, "n/a", 12, 11, None, 500, 13, 10, 11, 12], "mad", threshold=3.0)
+        assert result["indices"] == [5]
+        assert result["total_points"] == 8
+
+    def test_columnar_input_and_bad_method(self):
+        client = get_test_client()
+        response = client.post("/api/v1/ai/anomaly-detect", json={
+            "values": [10, 12, 11, 100, 13, 10],
+            "timestamps": ["t0", "t1", "t2", "t3", "t4", "t5"],
+            "method": "mad",
+            "threshold": 3.0,
+        })
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [a["timestamp"] for a in data["anomalies"]] == ["t3"]
+        assert data["method"] == "mad"
+
+        response = client.post("/api/v1/ai/anomaly-detect", json={"values": [1, 2, 3], "method": "bogus"})
+        assert response.status_code == 400
+
+    def test_z_score_unsigned_and_numeric_strings_ignored(self):
+        client = get_test_client()
+        response = client.post("/api/v1/ai/anomaly-detect", json={
+            "metrics": [{"value": v} for v in [50, 51, 49, 50, 52, 48, 50, -100, 51, "900"]],
+            "threshold": 2.0,
+        })
+        data = json.loads(response.data)
+        assert data["total_points"] == 9
+        assert [a["index"] for a in data["anomalies"]] == [7]
+        assert data["anomalies"][0]["z_score"] > 2 and data["anomalies"][0]["signed_score"] < -2
+
+
+class TestStreamDetector:
+    def test_online_statistics_match_batch(self):
+        import random
+        import statistics
+        from app.services.stream_detector import P2Quantile, Welford
+        rng = random.Random(5)
+        values = [rng.gauss(100, 15) for _ in range(20000)]
+        welford, p99 = Welford(), P2Quantile(0.99)
+        for v in values:
+            welford.update(v)
+            p99.update(v)
+        assert abs(welford.mean - statistics.mean(values)) < 1e-6
+        assert abs(welford.stdev - statistics.stdev(values)) < 1e-6
+        exact = sorted(values)[int(0.99 * len(values))]
+        assert abs(p99.value - exact) < 2.0
+
+    def test_field_spike_and_rate_spike_alert(self):
+        import random
+        from app.services.stream_detector import StreamDetector
+        rng = random.Random(9)
+        detector = StreamDetector(threshold=4.0, min_samples=30, rate_bucket_seconds=60, cooldown=0)
+        now = 0.0
+        for _ in range(300):
+            now += 1
+            assert detector.process_event({"event_type": "api_call", "payload": {"response_ms": rng.gauss(120, 10)}}, now) == []
+
+        alerts = detector.process_event({"event_type": "api_call", "event_id": "e1", "payload": {"response_ms": 900}}, now)
+        assert [(a["field"], a["triggered_by_event"]) for a in alerts] == [("response_ms", "e1")]
+
+        # Steady error rate for an hour, then a burst
+        for minute in range(60):
+            for _ in range(5 + minute % 3):
+                detector.process_event({"event_type": "error"}, minute * 60.0)
+        for _ in range(200):
+            detector.process_event({"event_type": "error"}, 3600.0)
+        alerts = detector.process_event({"event_type": "error"}, 3660.0)
+        assert [a["field"] for a in alerts] == ["_count"]
+
+    def test_series_count_is_capped(self):
+        from app.services.stream_detector import StreamDetector
+        detector = StreamDetector(max_series=10)
+        for i in range(100):
+            detector.process_event({"event_type": f"type-{i}", "payload": {"value": i}}, 0)
+        assert len(detector) == 10
+        assert detector.stats()["rate_series"] == 10
+        # Newest types evict the least recently seen instead of being ignored
+        assert list(detector._rates) == [f"type-{i}" for i in range(90, 100)]
+
+
+class TestLLMCache:
+    def test_hits_misses_and_fallback_not_cached(self, tmp_path):
+        from app.services.llm_cache import LLMCache
+        cache = LLMCache(ttl=60, max_entries=10, redis_url="", cache_dir=str(tmp_path))
+        calls = []
+
+        def generate():
+            calls.append(1)
+            return {"text": "ok", "tokens_used": 40, "provider": "bedrock"}
+
+        first = cache.get_or_generate("bedrock", "m", "prompt", {"max_tokens": 100}, generate)
+        second = cache.get_or_generate("bedrock", "m", "prompt", {"max_tokens": 100}, generate)
+        other = cache.get_or_generate("bedrock", "m", "prompt", {"max_tokens": 200}, generate)
+        bypass = cache.get_or_generate("bedrock", "m", "prompt", {"max_tokens": 100}, generate, use_cache=False)
+        assert len(calls) == 3
+        assert "cached" not in first and second["cached"] is True
+        assert "cached" not in other and "cached" not in bypass
+
+        # The disk tier survives a fresh process-local cache
+        restarted = LLMCache(ttl=60, max_entries=10, redis_url="", cache_dir=str(tmp_path))
+        assert restarted.get_or_generate("bedrock", "m", "prompt", {"max_tokens": 100}, generate)["cached"]
+        assert len(calls) == 3
+
+        fallback = lambda: {"text": "offline", "tokens_used": 0, "provider": "fallback"}
+        cache.get_or_generate("openai", "m", "p2", {}, fallback)
+        assert "cached" not in cache.get_or_generate("openai", "m", "p2", {}, fallback)
+
+        stats = cache.stats()
+        assert stats["local_hits"] == 1
+        assert stats["bypassed"] == 1
+        assert stats["tokens_saved"] == 40
+
+    def test_report_summary_served_from_cache(self, monkeypatch):
+        import io
+        from app.services import bedrock_service
+        from app.services.llm_cache import llm_cache
+
+        class FakeBedrock:
+            calls = 0
+
+            def invoke_model(self, **kwargs):
+                FakeBedrock.calls += 1
+                body = {"content": [{"text": "summary"}], "usage": {"output_tokens": 12}}
+                return {"body": io.BytesIO(json.dumps(body).encode())}
+
+        monkeypatch.setattr(bedrock_service, "get_bedrock_client", lambda: FakeBedrock())
+        monkeypatch.setattr(llm_cache, "cache_dir", "")
+        monkeypatch.setattr(llm_cache, "redis_url", "")
+        llm_cache.clear()
+
+        client = get_test_client()
+        body = {"dashboard_title": "Cache Test", "event_count": 10, "top_events": ["click"]}
+        assert client.post("/api/v1/ai/report-summary", json=body).get_json()["cached"] is False
+        assert client.post("/api/v1/ai/report-summary", json=body).get_json()["cached"] is True
+        opted_out = client.post("/api/v1/ai/report-summary", json=body, headers={"Cache-Control": "no-cache"})
+        assert opted_out.get_json()["cached"] is False
+        assert FakeBedrock.calls == 2
+        assert client.get("/api/v1/ai/cache/stats").get_json()["local_hits"] >= 1
+
+
+class TestProviderClients:
+    def test_clients_are_reused(self, monkeypatch):
+        from app.services import bedrock_service, openai_service
+        first = bedrock_service.get_bedrock_client()
+        assert first is bedrock_service.get_bedrock_client()
+        assert first.meta.config.max_pool_connections == bedrock_service.BEDROCK_MAX_POOL_CONNECTIONS
+
+        monkeypatch.setattr(openai_service, "OPENAI_API_KEY", "sk-test")
+        monkeypatch.setattr(openai_service, "_client", None)
+        assert openai_service.get_openai_client() is openai_service.get_openai_client()
+
+
+class TestProviderOrchestration:
+    def _fake_providers(self, monkeypatch, bedrock_delay, bedrock_ok=True):
+        import time
+        from app.services import llm_orchestrator
+        from app.services.provider_guard import ProviderGuard
+
+        def bedrock(prompt, max_tokens, use_cache):
+            time.sleep(bedrock_delay)
+            return {"text": "b", "provider": "bedrock" if bedrock_ok else "fallback"}
+
+        def openai(prompt, max_tokens, use_cache):
+            return {"text": "o", "provider": "openai"}
+
+        fallback = lambda prompt: {"text": "f", "provider": "fallback"}
+        monkeypatch.setattr(llm_orchestrator, "PROVIDERS", {"bedrock": (bedrock, fallback), "openai": (openai, fallback)})
+        monkeypatch.setattr(llm_orchestrator, "provider_guards", {
+            "bedrock": ProviderGuard("bedrock", max_concurrency=4),
+            "openai": ProviderGuard("openai", max_concurrency=4),
+        })
+        monkeypatch.setattr(llm_orchestrator, "LLM_HEDGE_DELAY", 0.05)
+        return llm_orchestrator
+
+    def test_hedge_fires_after_delay_and_fast_primary_wins(self, monkeypatch):
+        import time
+        orchestrator = self._fake_providers(monkeypatch, bedrock_delay=0.5)
+        started = time.monotonic()
+        result = orchestrator.complete("p", 10, provider="bedrock", strategy="hedged")
+        assert result["provider"] == "openai"
+        assert time.monotonic() - started < 0.4
+
+        orchestrator = self._fake_providers(monkeypatch, bedrock_delay=0)
+        assert orchestrator.complete("p", 10, provider="bedrock", strategy="hedged")["provider"] == "bedrock"
+        assert orchestrator.complete("p", 10, provider="bedrock")["provider"] == "bedrock"
+
+    def test_failing_provider_trips_breaker(self, monkeypatch):
+        orchestrator = self._fake_providers(monkeypatch, bedrock_delay=0, bedrock_ok=False)
+        for _ in range(5):
+            assert orchestrator.complete("p", 10, provider="bedrock", strategy="hedged")["provider"] == "openai"
+        stats = orchestrator.provider_stats()
+        assert stats["bedrock"]["state"] == "open"
+        assert stats["bedrock"]["in_flight"] == 0
+        assert orchestrator.complete("p", 10, provider="bedrock")["provider"] == "fallback"
+        assert orchestrator.provider_stats()["bedrock"]["rejected"] == 1
+
+    def test_breaker_half_open_and_concurrency_limit(self, monkeypatch):
+        import time
+        from app.services.provider_guard import CircuitBreaker, ProviderGuard
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        assert not breaker.allow()
+        time.sleep(0.06)
+        assert breaker.allow() and not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+        guard = ProviderGuard("x", max_concurrency=1)
+        assert guard.try_acquire()
+        assert not guard.try_acquire()
+        guard.release(True)
+        assert guard.try_acquire()
+
+
+class TestStreamingEndpoints:
+    def test_summarize_stream_emits_tokens_then_done(self, monkeypatch):
+        from app.services import bedrock_service
+        from app.services.llm_cache import llm_cache
+
+        def event(message):
+            return {"chunk": {"bytes": json.dumps(message).encode()}}
+
+        class FakeBedrock:
+            calls = 0
+
+            def invoke_model_with_response_stream(self, **kwargs):
+                FakeBedrock.calls += 1
+                return {"body": [
+                    event({"type": "message_start"}),
+                    event({"type": "content_block_delta", "delta": {"text": "Sales "}}),
+                    event({"type": "content_block_delta", "delta": {"text": "grew."}}),
+                    event({"type": "message_delta", "usage": {"output_tokens": 3}}),
+                    event({"type": "message_stop"}),
+                ]}
+
+        monkeypatch.setattr(bedrock_service, "get_bedrock_client", lambda: FakeBedrock())
+        monkeypatch.setattr(llm_cache, "cache_dir", "")
+        monkeypatch.setattr(llm_cache, "redis_url", "")
+        llm_cache.clear()
+
+        def read_events(response):
+            assert response.mimetype == "text/event-stream"
+            events = []
+            for block in response.get_data(as_text=True).strip().split("\n\n"):
+                name, data = block.split("\n")
+                events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+            return events
+
+        client = get_test_client()
+        body = {"content": "Q4 sales", "max_tokens": 50}
+        events = read_events(client.post("/api/v1/ai/summarize/stream", json=body))
+        assert [e for e, _ in events] == ["token", "token", "done"]
+        assert "".join(d["text"] for e, d in events if e == "token") == "Sales grew."
+        assert events[-1][1]["provider"] == "bedrock" and events[-1][1]["tokens_used"] == 3
+
+        cached = read_events(client.post("/api/v1/ai/summarize/stream", json=body))
+        assert cached[0][1]["text"] == "Sales grew."
+        assert cached[-1][1]["cached"] is True
+        assert FakeBedrock.calls == 1
+
+    def test_stream_routes_validate_input(self):
+        client = get_test_client()
+        assert client.post("/api/v1/ai/summarize/stream", json={}).status_code == 400
+        assert client.post("/api/v1/ai/analyze/stream", json={"events": []}).status_code == 400
+
+
+class TestEventDigest:
+    def test_digest_covers_all_events_within_budget(self):
+        from datetime import datetime, timedelta
+        from app.services.event_digest import build_digest
+        start = datetime(2024, 1, 15)
+        events = []
+        for i in range(5000):
+            # 50 events/hour for a day, then 200/hour
+            minutes = i * 1.2 if i < 1200 else 1440 + (i - 1200) * 0.3
+            events.append({
+                "event_type": "error" if i % 10 == 0 else "page_view",
+                "timestamp": (start + timedelta(minutes=minutes)).isoformat() + "Z",
+                "payload": {"response_ms": 100 + i % 50, "page": f"/p{i % 3}", "body": "x" * 500},
+            })
+
+        digest = build_digest(events, token_budget=400)
+        assert "Total events: 5000" in digest
+        assert "error=500 (10%)" in digest
+        assert "response_ms (n=5000): 124 / 144 / 149, 100-149" in digest
+        assert "page: /p0=1667, /p1=1667, /p2=1666" in digest
+        assert "Level shift at 2024-01-16T00:00:00Z" in digest
+        assert "x" * 500 not in digest
+        assert len(digest) / 4 <= 400
+
+        short = build_digest(events, token_budget=40)
+        assert short.endswith("(digest truncated to fit the token budget)")
+
+    def test_missing_bad_and_numeric_timestamps(self):
+        import numpy as np
+        from app.services.event_digest import _epoch_seconds, build_digest
+        client = get_test_client()
+        response = client.post("/api/v1/ai/analyze", json={"events": [
+            {"event_type": "a", "timestamp": "2024-01-01T00:00:00"},
+            {"event_type": "b"},
+        ]})
+        assert response.status_code == 200
+
+        seconds = _epoch_seconds(["2024-01-01T00:00:00", None, "garbage", 1704070800, 1704074400000, True])
+        assert seconds[0] == 1704067200 and seconds[3] == 1704070800 and seconds[4] == 1704074400
+        assert all(np.isnan(seconds[i]) for i in (1, 2, 5))
+        digest = build_digest([{"event_type": "a", "timestamp": t} for t in ["2024-01-01T00:00:00Z", None, "bad", 1704070800]])
+        assert "Time range: 2024-01-01T00:00:00Z to 2024-01-01T01:00:00Z" in digest
+
+    def test_zoned_timestamps_outliers_and_non_finite_values(self):
+        import warnings
+        from app.services.event_digest import TARGET_BUCKETS, _epoch_seconds, build_digest
+
+        filters = list(warnings.filters)
+        seconds = _epoch_seconds(["2024-01-01T05:00:00+05:00", "2024-01-01T00:00:00Z", "2024-01-01 01:00:00"])
+        assert list(seconds) == [1704067200, 1704067200, 1704070800]
+        assert warnings.filters == filters
+
+        # One far-off timestamp must not blow up the histogram and push the
+        # later sections out of the budget
+        events = [
+            {"event_type": "a", "timestamp": f"2024-01-01T00:{i % 60:02d}:00", "payload": {"ms": i, "page": "/x"}}
+            for i in range(200)
+        ]
+        events.append({"event_type": "a", "timestamp": "1975-01-01T00:00:00", "payload": {"ms": 1}})
+        digest = build_digest(events, token_budget=400)
+        histogram = next(line for line in digest.splitlines() if line.startswith("Events per"))
+        assert len(histogram.split(":", 1)[1].split()) <= TARGET_BUCKETS + 1
+        assert "ms (n=201)" in digest and "page: /x=200" in digest
+
+        response = get_test_client().post(
+            "/api/v1/ai/analyze",
+            data='{"events": [{"event_type": "a", "payload": {"v": NaN}}, {"event_type": "a", "payload": {"v": Infinity}}, {"event_type": "a", "payload": {"v": 2}}]}',
+            content_type="application/json",
+        )
+        assert response.status_code == 200
+
+    def test_change_points(self):
+        import numpy as np
+        from app.services.event_digest import change_points
+        assert change_points(np.array([10, 11, 9, 10, 12, 10, 30, 31, 29, 30, 32, 30.0])) == [6]
+        assert change_points(np.full(20, 10.0)) == []
+
+
+class TestBatchAnalysis:
+    def test_batch_streams_ndjson_and_dedupes(self, monkeypatch):
+        import time
+        from app.services import batch_analysis
+
+        calls = []
+
+        def fake_analyze(events, analysis_type, provider, use_cache, strategy, wait):
+            calls.append(analysis_type)
+            if analysis_type == "boom":
+                raise RuntimeError("provider exploded")
+            time.sleep(0.2 if analysis_type == "slow" else 0)
+            return {"analysis": analysis_type, "events_analyzed": len(events), "provider": provider}
+
+        monkeypatch.setattr(batch_analysis, "analyze_data", fake_analyze)
+        events = [{"event_type": "click"}]
+        jobs = [
+            {"id": "a", "events": events, "type": "slow"},
+            {"id": "b", "events": events, "type": "trend"},
+            {"id": "c", "events": events, "type": "trend"},
+            {"id": "d", "events": events, "type": "boom"},
+        ]
+        client = get_test_client()
+        response = client.post("/api/v1/ai/analyze/batch", json={"jobs": jobs})
+        assert response.mimetype == "application/x-ndjson"
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        assert sorted(calls) == ["boom", "slow", "trend"]
+        results = {r["id"]: r for r in records if r["type"] != "summary"}
+        assert results["c"]["duplicate_of"] == 1 and results["c"]["analysis"] == "trend"
+        assert results["d"]["type"] == "error"
+        # The slow job finishes last even though it was submitted first
+        assert records[-2]["id"] == "a"
+        assert records[-1] == {**records[-1], "type": "summary", "jobs": 4, "unique_jobs": 3, "failed": 1}
+
+    def test_batch_waits_for_provider_slots_and_flags_fallbacks(self, monkeypatch):
+        import time
+        from app.services import batch_analysis, llm_orchestrator
+        from app.services.provider_guard import ProviderGuard, RateLimiter
+
+        def fake_generate(prompt, max_tokens=500, use_cache=True):
+            time.sleep(0.05)
+            if "degrade-me" in prompt:
+                return {"text": "fallback text", "provider": "fallback"}
+            return {"text": "ok", "provider": "bedrock", "tokens_used": 5}
+
+        monkeypatch.setitem(llm_orchestrator.PROVIDERS, "bedrock", (fake_generate, lambda p: {}))
+        monkeypatch.setitem(llm_orchestrator.provider_guards, "bedrock", ProviderGuard("bedrock", max_concurrency=1))
+        monkeypatch.setitem(llm_orchestrator.rate_limiters, "bedrock", RateLimiter(rate=1000))
+        jobs = [{"events": [{"event_type": f"type-{i}"}]} for i in range(4)]
+        jobs.append({"events": [{"event_type": "degrade-me"}]})
+
+        records = list(batch_analysis.run_batch(jobs, use_cache=False))
+        results = [r for r in records if r["type"] == "result"]
+        # One slot for five concurrent jobs: the rest wait instead of falling back
+        assert len(results) == 5
+        assert [r["provider"] for r in results].count("bedrock") == 4
+        assert [r for r in results if r.get("degraded")][0]["index"] == 4
+        assert records[-1]["degraded"] == 1 and records[-1]["failed"] == 0
+        assert llm_orchestrator.provider_guards["bedrock"].rejected == 0
+
+    def test_batch_validation_and_rate_limiter(self):
+        import time
+        from app.services.provider_guard import RateLimiter
+        client = get_test_client()
+        assert client.post("/api/v1/ai/analyze/batch", json={"jobs": []}).status_code == 400
+        assert client.post("/api/v1/ai/analyze/batch", json={"jobs": [{"type": "trend"}]}).status_code == 400
+
+        limiter = RateLimiter(rate=20, burst=2)
+        started = time.monotonic()
+        for _ in range(4):
+            assert limiter.acquire()
+        assert time.monotonic() - started >= 0.09
+        slow = RateLimiter(rate=0.5, burst=1)
+        assert slow.acquire()
+        assert not slow.acquire(timeout=0.05)
+
+
+class TestTokenBudget:
+    def test_split_into_chunks(self):
+        from app.services.token_budget import estimate_tokens, split_into_chunks
+        text = "\n\n".join(f"Paragraph {i} " + "word " * 200 for i in range(10))
+        chunks = split_into_chunks(text, chunk_tokens=600)
+        assert len(chunks) > 1
+        assert all(estimate_tokens(c) <= 600 for c in chunks)
+        assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
+        assert split_into_chunks("short") == ["short"]
+
+    def test_summarize_map_reduce_sums_usage(self, monkeypatch):
+        from app.services import llm_orchestrator
+
+        prompts = []
+
+        def fake_generate(prompt, max_tokens=500, use_cache=True):
+            prompts.append(prompt)
+            return {"text": "partial summary", "provider": "bedrock", "tokens_used": 110,
+                    "input_tokens": 100, "output_tokens": 10}
+
+        monkeypatch.setitem(llm_orchestrator.PROVIDERS, "bedrock", (fake_generate, lambda p: {}))
+        content = "\n\n".join("sentence " * 300 for _ in range(12))
+        result = llm_orchestrator.summarize_content(content, 200, use_cache=False, chunk_tokens=2000)
+
+        assert result["chunks"] > 1
+        assert len(prompts) == result["chunks"] + 1
+        assert prompts[-1].startswith(f"The following are summaries of the {result['chunks']}")
+        assert result["output_tokens"] == 10 * len(prompts)
+        assert result["input_tokens"] == 100 * len(prompts) and result["cost_usd"] > 0
+
+    def test_map_reduce_skips_reduce_when_a_part_falls_back(self, monkeypatch):
+        from app.services import llm_orchestrator
+
+        prompts = []
+
+        def fake_generate(prompt, max_tokens=500, use_cache=True):
+            prompts.append(prompt)
+            if prompt.startswith("Summarize part 2 "):
+                return {"text": "placeholder", "provider": "fallback", "tokens_used": 0}
+            return {"text": "partial summary", "provider": "bedrock", "input_tokens": 100, "output_tokens": 10}
+
+        monkeypatch.setitem(llm_orchestrator.PROVIDERS, "bedrock", (fake_generate, lambda p: {"text": "fallback", "provider": "fallback"}))
+        content = "\n\n".join("sentence " * 300 for _ in range(12))
+        result = llm_orchestrator.summarize_content(content, 200, use_cache=False, chunk_tokens=2000)
+
+        assert result["degraded"] and result["failed_chunks"] == 1
+        assert result["provider"] == "fallback" and result["text"] == "fallback"
+        assert not any(p.startswith("The following are summaries") for p in prompts)
+        assert result["output_tokens"] == 10 * (result["chunks"] - 1)
+
+    def test_usage_uses_provider_counts(self, monkeypatch):
+        import io
+        from types import SimpleNamespace
+        from app.services import bedrock_service, llm_orchestrator, openai_service
+
+        usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30, total_tokens=150)
+        message = SimpleNamespace(content="insight")
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+        result = llm_orchestrator.with_usage(openai_service._insights_result(response), input_tokens=999)
+        # total_tokens already includes the prompt, so it is not billed as output
+        assert (result["input_tokens"], result["output_tokens"]) == (120, 30)
+        assert result["cost_usd"] == llm_orchestrator.estimate_cost("openai", 120, 30)
+
+        body = {"content": [{"text": "summary"}], "usage": {"input_tokens": 80, "output_tokens": 20}}
+
+        class FakeBedrock:
+            def invoke_model(self, **kwargs):
+                return {"body": io.BytesIO(json.dumps(body).encode())}
+
+        monkeypatch.setattr(bedrock_service, "get_bedrock_client", lambda: FakeBedrock())
+        result = llm_orchestrator.with_usage(bedrock_service._invoke_bedrock("text", 100), input_tokens=999)
+        assert (result["input_tokens"], result["output_tokens"]) == (80, 20)
+
+        # Without provider counts both sides fall back to estimates
+        result = llm_orchestrator.with_usage({"text": "x" * 40, "provider": "bedrock", "tokens_used": 0}, 7)
+        assert result["input_tokens"] == 7 and result["output_tokens"] == llm_orchestrator.estimate_tokens("x" * 40)
+
+    def test_openai_stream_uses_installed_sdk_signature(self, monkeypatch):
+        import httpx
+        from openai import OpenAI
+        from app.services import openai_service
+
+        requests_seen = []
+
+        def chunk(content):
+            return json.dumps({
+                "id": "c1", "object": "chat.completion.chunk", "created": 1, "model": "gpt-4",
+                "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+            })
+
+        def respond(request):
+            requests_seen.append(json.loads(request.content))
+            body = "".join(f"data: {chunk(c)}\n\n" for c in ("Hel", "lo")) + "data: [DONE]\n\n"
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+        client = OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(respond)))
+        monkeypatch.setattr(openai_service, "get_openai_client", lambda: client)
+        stream = openai_service._stream_openai("data", 50)
+        chunks = []
+        try:
+            while True:
+                chunks.append(next(stream))
+        except StopIteration as stop:
+            meta = stop.value
+
+        assert chunks == ["Hel", "lo"]
+        assert meta["provider"] == "openai" and meta["output_tokens"] == 2
+        supported = "stream_options" in openai_service._stream_usage_options(client)
+        assert ("stream_options" in requests_seen[0]) == supported
+
+
+    @staticmethod
+    def _token(claims, key="test-key"):
+        import hmac
+        import base64
+        import hashlib
+
+        def encode(data):
+            raw = data if isinstance(data, bytes) else json.dumps(data).encode()
+            return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+        signing_input = f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(claims)}"
+        signature = hmac.new(key.encode(), signing_input.encode(), hashlib.sha256).digest()
+        return f"{signing_input}.{encode(signature)}"
+
+    def test_quota_blocks_requests(self, monkeypatch):
+        import time
+        from app.services import token_budget
+        from app.services.token_budget import TokenQuota
+        from app.routes import ai_routes
+
+        quota = TokenQuota(daily_limit=100, redis_url="")
+        assert quota.allow("user:1", 100) and not quota.allow("user:1", 101)
+        quota.consume("user:1", 80)
+        assert quota.remaining("user:1") == 20 and quota.remaining("user:2") == 100
+
+        monkeypatch.setattr(ai_routes, "token_quota", quota)
+        monkeypatch.setattr(token_budget, "JWT_SIGNING_KEY", "test-key")
+        token = self._token({"user_id": 1, "token_type": "access", "exp": time.time() + 60})
+        auth = {"Authorization": f"Bearer {token}"}
+        client = get_test_client()
+        response = client.post("/api/v1/ai/summarize", json={"content": "x" * 400}, headers=auth)
+        assert response.status_code == 429
+        assert response.get_json()["remaining_tokens"] == 20
+        status = client.get("/api/v1/ai/quota", headers=auth).get_json()
+        assert status["used_tokens"] == 80
+
+        # Forged, expired or self-signed identities fall back to the client address
+        assert token_budget.verified_user_id(self._token({"user_id": 1, "exp": time.time() + 60}, "other")) is None
+        assert token_budget.verified_user_id(self._token({"user_id": 1, "exp": time.time() - 1})) is None
+        assert token_budget.verified_user_id("not.a.token") is None
+        status = client.get("/api/v1/ai/quota", headers={"X-User-Id": "fresh-user"}).get_json()
+        assert status["used_tokens"] == 0 and status["user"].startswith("addr:")
+
+    def test_bad_max_tokens_rejected(self):
+        client = get_test_client()
+        for value in ("lots", None, [1]):
+            response = client.post("/api/v1/ai/summarize", json={"content": "x", "max_tokens": value})
+            assert response.status_code == 400
+
+    def test_batch_stops_when_quota_runs_out(self, monkeypatch):
+        import time
+        from app.services import batch_analysis
+        from app.services.token_budget import TokenQuota
+        from app.routes import ai_routes
+
+        calls = []
+
+        def fake_analyze(events, analysis_type, provider, use_cache, strategy, wait):
+            calls.append(events[0]["n"])
+            time.sleep(0.05)
+            return {"analysis": "ok", "events_analyzed": 1, "provider": provider,
+                    "input_tokens": 40, "output_tokens": 10}
+
+        monkeypatch.setattr(batch_analysis, "analyze_data", fake_analyze)
+        monkeypatch.setattr(batch_analysis, "_executor", batch_analysis.ThreadPoolExecutor(max_workers=1))
+        monkeypatch.setattr(ai_routes, "token_quota", TokenQuota(daily_limit=120, redis_url=""))
+        jobs = [{"events": [{"n": i}]} for i in range(10)]
+        response = get_test_client().post("/api/v1/ai/analyze/batch", json={"jobs": jobs})
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        assert records[-1]["type"] == "error" and records[-1]["remaining_tokens"] == 0
+        assert [r["type"] for r in records[:-1]] == ["result"] * 3
+        assert len(calls) < len(jobs)
+
+
+class TestNLQuery:
+    def test_template_answers_and_executes_without_llm(self, monkeypatch):
+        from app.services import llm_orchestrator
+
+        def no_llm(*args, **kwargs):
+            raise AssertionError("template questions must not call the LLM")
+
+        monkeypatch.setattr(llm_orchestrator, "complete", no_llm)
+        monkeypatch.setattr(llm_orchestrator, "execute_query", lambda body: {"results": [], "total": 7})
+        client = get_test_client()
+        data = client.post("/api/v1/ai/nl-query", json={
+            "question": "How many click events in the last 24 hours?", "execute": True,
+        }).get_json()
+
+        assert data["source"] == "template" and data["valid"]
+        assert data["query"]["query"]["bool"]["filter"] == [
+            {"range": {"timestamp": {"gte": "now-24h"}}},
+            {"term": {"event_type": "click"}},
+        ]
+        assert data["results"]["total"] == 7 and data["input_tokens"] == 0
+
+    def test_template_values_keep_question_case(self):
+        from app.services.nl_query import match_template
+
+        latest = match_template("Show the latest 5 UserSignup events from Yesterday")["query"]
+        assert latest["size"] == 5
+        assert latest["query"]["bool"]["filter"] == [
+            {"range": {"timestamp": {"gte": "now-1d/d", "lt": "now/d"}}},
+            {"term": {"event_type": "UserSignup"}},
+        ]
+        source = match_template("LIST EVENTS FROM SOURCE Sensor-A1")["query"]
+        assert source["query"]["bool"]["filter"] == [{"term": {"source_id": "Sensor-A1"}}]
+        per_hour = match_template("Count All events per Hour")["query"]
+        assert per_hour["query"] == {"match_all": {}}
+        assert per_hour["aggs"]["over_time"]["date_histogram"]["calendar_interval"] == "hour"
+
+    def test_llm_translation_validated_and_cached(self, monkeypatch):
+        from app.services import llm_orchestrator
+        from app.services.nl_query import translation_cache
+
+        translation_cache.clear()
+        answers = iter([
+            'Here you go:\n```json\n{"query": {"term": {"payload.plan": "pro"}}, "size": 5}\n```\nFinds pro-plan events.',
+            '{"query": {"term": {"user_name": "bob"}}}',
+            '{"query": {"term": {"user_name": "bob"}}}',
+        ])
+        calls = []
+
+        def fake_generate(prompt, max_tokens=500, use_cache=True):
+            calls.append(prompt)
+            return {"text": next(answers), "provider": "bedrock", "tokens_used": 20}
+
+        monkeypatch.setitem(llm_orchestrator.PROVIDERS, "bedrock", (fake_generate, lambda p: {}))
+        first = llm_orchestrator.generate_natural_language_query("Which events are on the PRO plan?")
+        assert first["valid"] and first["query"]["query"] == {"term": {"payload.plan": "pro"}}
+        assert first["explanation"] == "Here you go:\n\nFinds pro-plan events."
+
+        # Same question after normalization is served from the translation cache
+        again = llm_orchestrator.generate_natural_language_query("  Which events are on the  PRO plan ")
+        assert again["cached"] and again["output_tokens"] == 0 and len(calls) == 1
+
+        # Invalid translations are reported and never cached
+        for _ in range(2):
+            bad = llm_orchestrator.generate_natural_language_query("Who is bob?")
+            assert not bad["valid"] and bad["query"] is None
+            assert bad["validation_errors"] == ["Unknown fields: user_name"]
+        assert len(calls) == 3
+
+    def test_validate_query_against_mapping(self):
+        from app.services.nl_query import validate_query
+        body = {
+            "query": {"bool": {"filter": [{"range": {"timestamp": {"gte": "now-1d"}}}, {"exists": {"field": "metadata.region"}}]}},
+            "aggs": {"types": {"terms": {"field": "event_type", "size": 10}}},
+            "sort": [{"timestamp": "desc"}],
+        }
+        assert validate_query(body) == []
+        errors = validate_query({"query": {"match_all": {}}, "size": 1000, "script_fields": {"x": {"script": "1"}}})
+        assert "Unsupported keys: script_fields" in errors and "Scripts are not allowed" in errors
+
+        wrapped = validate_query({"query": {"bool": {"filter": [{"wrapper": {"query": "eyJtYXRjaF9hbGwiOnt9fQ=="}}]}}})
+        assert "Wrapper queries are not allowed" in wrapped and "Query type not allowed: wrapper" in wrapped
+        assert validate_query({"query": {"percolate": {"field": "event_type"}}}) == ["Query type not allowed: percolate"]
+        assert validate_query({"query": {"match_all": {}}, "from": 900, "size": 200}) == ["from + size must not exceed 1000"]
+        assert validate_query({"query": {"match_all": {}}, "from": -1}) == ["from must be a non-negative integer"]
+
+
+class TestAsyncProviders:
+    def test_analyze_awaits_pooled_clients_on_provider_loop(self, monkeypatch):
+        import threading
+        import httpx
+        from openai import AsyncOpenAI
+        from app.services import bedrock_service, openai_service
+
+        threads = []
+
+        def respond(request):
+            threads.append(threading.current_thread().name)
+            return httpx.Response(200, json={
+                "id": "c1", "object": "chat.completion", "created": 1, "model": "gpt-4",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "async insight"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 50, "completion_tokens": 5, "total_tokens": 55},
+            })
+
+        # One client across requests: Flask runs each async view on a new
+        # loop, so this only works if calls are awaited on the shared loop
+        client = AsyncOpenAI(api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+        monkeypatch.setattr(openai_service, "get_async_openai_client", lambda: client)
+        app_client = get_test_client()
+        for _ in range(2):
+            data = app_client.post("/api/v1/ai/analyze", json={
+                "events": [{"event_type": "click"}], "provider": "openai", "cache": False,
+            }).get_json()
+            assert data["analysis"] == "async insight" and data["provider"] == "openai"
+            assert data["input_tokens"] == 50 and data["output_tokens"] == 5
+        assert threads == ["llm-provider-loop"] * 2
+
+        def fake_invoke(content, max_tokens):
+            threads.append(threading.current_thread().name)
+            return {"text": "bedrock answer", "provider": "bedrock", "input_tokens": 10, "output_tokens": 2}
+
+        monkeypatch.setattr(bedrock_service, "_invoke_bedrock", fake_invoke)
+        data = app_client.post("/api/v1/ai/analyze", json={"events": [{"event_type": "click"}], "cache": False}).get_json()
+        assert data["analysis"] == "bedrock answer"
+        assert threads[-1].startswith("bedrock-async")
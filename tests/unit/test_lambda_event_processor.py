@@ -0,0 +1,130 @@
+import os
+import json
+import importlib.util
+from types import SimpleNamespace
+
+import pytest
+
+HANDLER_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "aws_lambda", "event_processor", "handler.py")
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class FakeDynamoDB:
+    exceptions = SimpleNamespace(ConditionalCheckFailedException=ConditionalCheckFailedException)
+
+    def __init__(self, stored=None, failing=(), conflict=False):
+        self.stored = stored or {}
+        self.failing = set(failing)
+        self.conflict = conflict
+        self.calls = []
+
+    def update_item(self, **kwargs):
+        self.calls.append(kwargs)
+        event_type = kwargs["Key"]["event_type"]["S"]
+        if "ConditionExpression" in kwargs:
+            if self.conflict:
+                raise ConditionalCheckFailedException()
+            return {}
+        if event_type in self.failing:
+            raise RuntimeError("throttled")
+        values = kwargs["ExpressionAttributeValues"]
+        # UPDATED_NEW returns what if_not_exists kept: the stored value, or this batch's
+        attributes = {name: self.stored.get(event_type, {}).get(name, values[placeholder])
+                      for name, placeholder in (("value_min", ":min"), ("value_max", ":max")) if placeholder in values}
+        return {"Attributes": attributes}
+
+    def updates(self, event_type):
+        return [c for c in self.calls if c["Key"]["event_type"]["S"] == event_type and "ConditionExpression" not in c]
+
+    def conditional(self):
+        return [c for c in self.calls if "ConditionExpression" in c]
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    spec = importlib.util.spec_from_file_location("event_processor_handler", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "s3_client", SimpleNamespace(put_object=lambda **kwargs: {}))
+    yield module
+    module._flush_executor.shutdown()
+
+
+def _records(*bodies):
+    return {"Records": [{"body": b if isinstance(b, str) else json.dumps(b)} for b in bodies]}
+
+
+def _run(handler, event):
+    response = handler.lambda_handler(event, SimpleNamespace(aws_request_id="req-1"))
+    return json.loads(response["body"])
+
+
+class TestSummaryAggregation:
+    def test_one_update_per_key_with_batch_totals(self, handler, monkeypatch):
+        client = FakeDynamoDB()
+        monkeypatch.setattr(handler, "dynamodb_client", client)
+        result = _run(handler, _records(
+            {"event_type": "purchase", "payload": {"value": 5}},
+            {"event_type": "purchase", "payload": {"value": "20"}},
+            {"event_type": "purchase", "payload": {"note": "no value"}},
+            {"event_type": "click", "payload": {"value": "n/a"}},
+            {"event_type": "click", "payload": "not-a-dict"},
+            "not json",
+        ))
+
+        assert result["processed"] == 5 and result["errors"] == 1
+        assert result["summaries_updated"] == 2 and result["summary_errors"] == 0
+        assert len(client.calls) == 2
+
+        purchase, = client.updates("purchase")
+        assert purchase["UpdateExpression"].startswith("ADD event_count :n, value_count :vc, value_sum :sum ")
+        values = purchase["ExpressionAttributeValues"]
+        assert values[":n"] == {"N": "3"} and values[":vc"] == {"N": "2"}
+        assert values[":sum"] == {"N": "25.0"}
+        assert values[":min"] == {"N": "5.0"} and values[":max"] == {"N": "20.0"}
+
+        # No usable values: only the count is added
+        click, = client.updates("click")
+        assert click["UpdateExpression"] == "ADD event_count :n SET last_updated = :ts"
+        assert set(click["ExpressionAttributeValues"]) == {":n", ":ts"}
+        assert click["ExpressionAttributeValues"][":n"] == {"N": "2"}
+
+    def test_extremes_written_only_when_moved(self, handler, monkeypatch):
+        summary = {"count": 2, "value_count": 2, "sum": 25.0, "min": 5.0, "max": 20.0}
+        key = ("purchase", "2026-10-19")
+
+        inside = FakeDynamoDB(stored={"purchase": {"value_min": {"N": "1"}, "value_max": {"N": "100"}}})
+        monkeypatch.setattr(handler, "dynamodb_client", inside)
+        assert handler._update_summary(key, summary)
+        assert inside.conditional() == []
+
+        outside = FakeDynamoDB(stored={"purchase": {"value_min": {"N": "10"}, "value_max": {"N": "15"}}})
+        monkeypatch.setattr(handler, "dynamodb_client", outside)
+        assert handler._update_summary(key, summary)
+        writes = {c["UpdateExpression"]: c for c in outside.conditional()}
+        assert writes["SET value_min = :v"]["ConditionExpression"] == "value_min > :v"
+        assert writes["SET value_min = :v"]["ExpressionAttributeValues"] == {":v": {"N": "5.0"}}
+        assert writes["SET value_max = :v"]["ConditionExpression"] == "value_max < :v"
+        assert writes["SET value_max = :v"]["ExpressionAttributeValues"] == {":v": {"N": "20.0"}}
+
+    def test_lost_extreme_race_is_not_an_error(self, handler, monkeypatch):
+        client = FakeDynamoDB(stored={"purchase": {"value_min": {"N": "10"}, "value_max": {"N": "15"}}}, conflict=True)
+        monkeypatch.setattr(handler, "dynamodb_client", client)
+        summary = {"count": 1, "value_count": 1, "sum": 30.0, "min": 30.0, "max": 30.0}
+        assert handler._update_summary(("purchase", "2026-10-19"), summary)
+        assert len(client.conditional()) == 1
+
+    def test_failed_updates_counted(self, handler, monkeypatch):
+        client = FakeDynamoDB(failing={"click"})
+        monkeypatch.setattr(handler, "dynamodb_client", client)
+        result = _run(handler, _records(
+            {"event_type": "purchase", "payload": {"value": 5}},
+            {"event_type": "click", "payload": {}},
+            {"event_type": "view", "payload": {}},
+        ))
+        assert result["processed"] == 3 and result["errors"] == 0
+        assert result["summaries_updated"] == 2 and result["summary_errors"] == 1